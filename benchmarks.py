@@ -0,0 +1,388 @@
+import gc
+import json
+import os
+import platform
+import random
+import runpy
+import statistics
+import sys
+import tempfile
+import time
+import types
+
+import contact_store
+import record_codecs
+import task_store
+from contact_store import Contact, ContactList, ContactSearchIndex, find_duplicates
+from task_store import TaskOrder, TaskSearchIndex, filter_tasks, format_timestamp
+
+# --- Benchmarks for the contact book and the to-do list ---
+#
+#   python benchmarks.py run --sizes 1000,100000 --output results.json
+#   python benchmarks.py run --compare baseline.json   (flags slowdowns)
+#   python benchmarks.py generate contacts 1000000 contacts_data.json
+#
+# Datasets are generated from a fixed seed, so every run (and every machine)
+# works on the same records. Storage runs in a scratch directory in 'json'
+# mode with the record format chosen by --format. The window paths (list
+# population) use real Tk when a display is available and otherwise stub
+# widgets, which measure our side of the work but not Tk's drawing; the
+# results record which was used.
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+DEFAULT_SEED = 0
+SEARCH_QUERIES = 100 # Contacts or words sampled per search benchmark
+REGRESSION_RATIO = 1.25 # --compare flags benchmarks this much slower than the baseline
+# Generated task dates run up to this moment (a fixed point keeps datasets identical)
+GENERATED_UNTIL = 1717200000 # 2024-06-01
+
+# --- Synthetic Data ---
+SYLLABLES = ("an", "bel", "cor", "da", "el", "fin", "gar", "ha", "is", "jo", "ka", "li", "mar",
+             "no", "or", "pe", "qui", "ro", "sa", "ta", "ul", "vi", "wen", "xa", "yo", "zu")
+STREETS = ("Main", "Oak", "Pine", "Maple", "Cedar", "Elm", "Lake", "Hill", "Park", "River")
+TASK_WORDS = ("call", "email", "review", "write", "buy", "fix", "plan", "book", "send", "clean",
+              "report", "budget", "meeting", "dentist", "groceries", "invoice", "car", "garden",
+              "slides", "taxes", "birthday", "flight", "library", "backup", "laptop", "paint")
+
+def _name_part(rng, syllables):
+    return "".join(rng.choices(SYLLABLES, k=syllables)).capitalize()
+
+def _phone(rng):
+    return f"{rng.randrange(200, 1000)}-{rng.randrange(200, 1000)}-{rng.randrange(10000):04d}"
+
+def _retyped_phone(phone):
+    """The same number written the way another person would type it."""
+    area, exchange, line = phone.split("-")
+    return f"+1 ({area}) {exchange} {line}"
+
+def _misspelled(rng, name):
+    position = rng.randrange(1, len(name))
+    return name[:position] + name[position - 1] + name[position:] # One doubled letter
+
+def generate_contacts(count, seed=DEFAULT_SEED, duplicate_share=0.02):
+    """'count' contact records (dicts as saved in contacts_data.json) with
+    unique names. About duplicate_share of them re-enter an earlier contact
+    with a misspelled name and the phone number typed differently, which is
+    what find_duplicates() looks for."""
+    rng = random.Random(seed)
+    records, names = [], set()
+    while len(records) < count:
+        if records and rng.random() < duplicate_share:
+            original = rng.choice(records)
+            name = _misspelled(rng, original['name'])
+            phone = _retyped_phone(original['phone']) if original['phone'][0] != "+" else original['phone']
+            email, address = original['email'].upper(), original['address']
+        else:
+            first, last = _name_part(rng, 2), _name_part(rng, 3)
+            name = f"{first} {last}"
+            phone = _phone(rng)
+            email = f"{first}.{last}@example.com".lower() if rng.random() < 0.7 else ""
+            address = f"{rng.randrange(1, 1000)} {rng.choice(STREETS)} St" if rng.random() < 0.5 else ""
+        if name in names:
+            continue
+        names.add(name)
+        records.append({"id": len(records) + 1, "name": name, "phone": phone, "email": email, "address": address})
+    return records
+
+def generate_tasks(count, seed=DEFAULT_SEED, completed_share=0.3, due_share=0.2):
+    """'count' task records (dicts as saved in tasks.json) added over the
+    year before GENERATED_UNTIL; some completed, some with due dates."""
+    rng = random.Random(seed)
+    tasks = []
+    for number in range(count):
+        added_ts = GENERATED_UNTIL - rng.randrange(365 * 86400)
+        added_ts -= added_ts % 60 # Stored to the minute
+        completed_ts = due_ts = repeat = None
+        if rng.random() < completed_share:
+            completed_ts = min(GENERATED_UNTIL, added_ts + rng.randrange(30 * 86400)) // 60 * 60
+        if rng.random() < due_share:
+            due_ts = (added_ts + rng.randrange(1, 60 * 86400)) // 60 * 60
+            repeat = rng.choice((None, None, None) + task_store.REPEAT_CHOICES)
+        tasks.append({
+            "id": f"{seed:08x}{number:024x}",
+            "description": " ".join(rng.choices(TASK_WORDS, k=rng.randrange(2, 6))),
+            "status": "completed" if completed_ts is not None else "pending",
+            "added_on": format_timestamp(added_ts),
+            "completed_on": format_timestamp(completed_ts),
+            "added_ts": added_ts,
+            "completed_ts": completed_ts,
+            "due_on": format_timestamp(due_ts),
+            "due_ts": due_ts,
+            "repeat": repeat,
+            "repeat_anchor_ts": due_ts if repeat else None,
+        })
+    return tasks
+
+def contact_queries(records, seed=DEFAULT_SEED):
+    """Search terms a user would type: name prefixes, name fragments and phone digits."""
+    rng = random.Random(seed + 1)
+    queries = []
+    for record in rng.sample(records, min(SEARCH_QUERIES, len(records))):
+        last_name = record['name'].split()[-1].lower()
+        queries += [last_name[:2], last_name[1:5], record['phone'][-4:]]
+    return queries
+
+# --- Stub Widgets (when there is no display) ---
+# Just enough of tkinter for the two windows to build. Listboxes keep their
+# rows in a Python list; everything else ignores what it is told. after()
+# never fires, since there is no event loop.
+
+def _ignore(*args, **kwargs):
+    return None
+
+class _StubWidget:
+    def __init__(self, master=None, *args, **options):
+        self.options = options
+
+    def __getattr__(self, name):
+        return _ignore
+
+    def cget(self, option):
+        return self.options.get(option)
+
+class _StubListbox(_StubWidget):
+    def __init__(self, master=None, **options):
+        super().__init__(master, **options)
+        self.items = []
+
+    def _index(self, index):
+        return len(self.items) if index == "end" else int(index)
+
+    def insert(self, index, *items):
+        index = self._index(index)
+        self.items[index:index] = items
+
+    def delete(self, first, last=None):
+        first = self._index(first)
+        last = first if last is None else min(self._index(last), len(self.items) - 1)
+        del self.items[first:last + 1]
+
+    def get(self, first, last=None):
+        if last is None:
+            return self.items[self._index(first)]
+        return tuple(self.items[self._index(first):self._index(last) + 1])
+
+    def size(self):
+        return len(self.items)
+
+    def curselection(self):
+        return ()
+
+class _StubVar:
+    def __init__(self, master=None, value=None):
+        self.value = "" if value is None else value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+    def trace_add(self, mode, callback):
+        return None
+
+def _stub_module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    # Constants (tk.END, tk.X...) are their lower-case names; other classes are plain widgets
+    module.__getattr__ = lambda attr: attr.lower() if attr.isupper() else _StubWidget
+    return module
+
+def install_stub_tkinter():
+    widgets = dict(Listbox=_StubListbox, StringVar=_StubVar, IntVar=_StubVar, BooleanVar=_StubVar)
+    tk = _stub_module("tkinter", TclError=RuntimeError, __path__=[], **widgets)
+    for name in ("ttk", "messagebox", "simpledialog", "filedialog", "font"):
+        submodule = _stub_module(f"tkinter.{name}", **widgets)
+        if name in ("messagebox", "simpledialog", "filedialog"):
+            submodule.__getattr__ = lambda attr: _ignore
+        setattr(tk, name, submodule)
+        sys.modules[f"tkinter.{name}"] = submodule
+    sys.modules["tkinter"] = tk
+    return tk
+
+def load_tkinter(mode):
+    """Returns (tkinter module, 'real' or 'stub') for --tk auto/real/stub."""
+    if mode != "stub":
+        import tkinter
+        try:
+            tkinter.Tk().destroy()
+            return tkinter, "real"
+        except tkinter.TclError:
+            if mode == "real":
+                raise
+        for name in [name for name in sys.modules if name == "tkinter" or name.startswith("tkinter.")]:
+            del sys.modules[name]
+    return install_stub_tkinter(), "stub"
+
+# --- Running ---
+
+def measure(func, repeat):
+    """Calls func() 'repeat' times. Returns (best seconds, median seconds, last result)."""
+    times = []
+    for _ in range(repeat):
+        gc.collect() # Don't bill one run for the garbage of the last
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), statistics.median(times), result
+
+class Recorder:
+    """Collects results and prints one line per benchmark as it finishes."""
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def time(self, name, records, func, operations=1, repeat=None):
+        best, median, result = measure(func, repeat or self.repeat)
+        self.results.append({"benchmark": name, "records": records, "operations": operations,
+                             "best_seconds": best, "median_seconds": median, "runs": repeat or self.repeat})
+        per_op = f"  ({best / operations * 1e6:.1f} us/op)" if operations > 1 else ""
+        print(f"{name:<28}{records:>10,}  {best:10.4f}s{per_op}", flush=True)
+        return result
+
+def bench_contacts(recorder, records, gui_path):
+    count = len(records)
+    contact_store.STORAGE_MODE = 'json'
+    contacts_list = [Contact.from_dict(record) for record in records]
+
+    recorder.time("contacts.save", count, lambda: contact_store.save_contacts(contacts_list))
+    loaded = recorder.time("contacts.load", count, contact_store.load_contacts)
+    book = recorder.time("contacts.sort", count, lambda: ContactList(loaded))
+    index = recorder.time("contacts.index", count, lambda: ContactSearchIndex(book))
+    queries = contact_queries(records)
+    recorder.time("contacts.search", count, lambda: [index.search(term) for term in queries],
+                  operations=len(queries))
+    recorder.time("contacts.duplicates", count, lambda: find_duplicates(book))
+
+    def start_gui():
+        build_window = runpy.run_path(gui_path, run_name="benchmark")['build_window']
+        build_window()
+        return build_window.__globals__ # run_path() returns a copy made before the window existed
+    window = recorder.time("contacts.gui_startup", count, start_gui, repeat=1)
+    populate = window['populate_listbox']
+    recorder.time("contacts.populate_listbox", count, lambda: (populate(), window['root'].update_idletasks()))
+    window['root'].destroy()
+
+def bench_tasks(recorder, tasks, tk):
+    count = len(tasks)
+    recorder.time("tasks.save", count, lambda: task_store.write_tasks(tasks))
+    loaded = recorder.time("tasks.load", count, task_store.read_tasks)
+    order = recorder.time("tasks.sort", count, lambda: TaskOrder(list(loaded)))
+    index = recorder.time("tasks.index", count, lambda: TaskSearchIndex(order.tasks))
+    words = random.Random(DEFAULT_SEED + 2).choices(TASK_WORDS, k=SEARCH_QUERIES)
+    recorder.time("tasks.search", count, lambda: [filter_tasks(order, index, text=word, status="pending")
+                                                  for word in words], operations=len(words))
+
+    from todo_gui import TodoApp # After load_tkinter(), so it picks up the stub if there is one
+    archive_after_days = task_store.ARCHIVE_AFTER_DAYS
+    task_store.ARCHIVE_AFTER_DAYS = 100 * 365 # Keep the generated history in the list; archiving isn't measured
+    try:
+        root = tk.Tk()
+        app = recorder.time("tasks.gui_startup", count, lambda: TodoApp(root), repeat=1)
+    finally:
+        task_store.ARCHIVE_AFTER_DAYS = archive_after_days
+
+    def repopulate():
+        app.task_listbox.delete(0, tk.END)
+        app.rows = []
+        app.refresh_task_list(resort=False)
+        root.update_idletasks()
+    recorder.time("tasks.refresh_task_list", count, repopulate)
+    recorder.time("tasks.refresh_unchanged", count, lambda: app.refresh_task_list(resort=False))
+    app.watcher.close()
+    root.destroy()
+
+def run(sizes, repeat=3, seed=DEFAULT_SEED, only=None, format=None, tk_mode="auto"):
+    """Runs the suite at each size in a scratch directory. Returns the results document."""
+    tk, tk_used = load_tkinter(tk_mode)
+    gui_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "contact book.py")
+    if format is not None:
+        record_codecs.RECORD_FORMAT = format
+    recorder = Recorder(repeat)
+    start_dir = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="benchmarks-") as scratch:
+        os.chdir(scratch)
+        try:
+            for size in sizes:
+                if only in (None, "contacts"):
+                    bench_contacts(recorder, generate_contacts(size, seed), gui_path)
+                if only in (None, "tasks"):
+                    bench_tasks(recorder, generate_tasks(size, seed), tk)
+        finally:
+            os.chdir(start_dir)
+    try:
+        import orjson
+    except ImportError:
+        orjson = None
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "orjson": orjson is not None,
+        "record_format": record_codecs.RECORD_FORMAT or record_codecs.DEFAULT_FORMAT,
+        "tk": tk_used,
+        "seed": seed,
+        "results": recorder.results,
+    }
+
+def compare(results, baseline):
+    """Prints each benchmark's best time against the baseline run's. Returns
+    the (benchmark, records, ratio) of every regression past REGRESSION_RATIO."""
+    before = {(r['benchmark'], r['records']): r['best_seconds'] for r in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        key = (result['benchmark'], result['records'])
+        if key not in before or not before[key]:
+            continue
+        ratio = result['best_seconds'] / before[key]
+        flag = "  REGRESSION" if ratio > REGRESSION_RATIO else ""
+        print(f"{key[0]:<28}{key[1]:>10,}  {before[key]:10.4f}s -> {result['best_seconds']:10.4f}s  x{ratio:.2f}{flag}")
+        if flag:
+            regressions.append(key + (ratio,))
+    return regressions
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark storage, search and list refresh on generated data.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench = commands.add_parser("run", help="run the benchmarks")
+    bench.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                       help="comma-separated record counts (default: %(default)s)")
+    bench.add_argument("--repeat", type=int, default=3, help="runs per benchmark; the best is reported")
+    bench.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    bench.add_argument("--only", choices=("contacts", "tasks"))
+    bench.add_argument("--format", choices=tuple(record_codecs.ENCODERS), help="record file format to save in")
+    bench.add_argument("--tk", choices=("auto", "real", "stub"), default="auto",
+                       help="window paths on a real display or stub widgets (auto: real if a display works)")
+    bench.add_argument("--output", help="write the results as JSON to this file")
+    bench.add_argument("--compare", metavar="BASELINE", help="results file of an earlier run to compare with")
+    generate = commands.add_parser("generate", help="write a synthetic contacts_data.json or tasks.json")
+    generate.add_argument("kind", choices=("contacts", "tasks"))
+    generate.add_argument("count", type=int)
+    generate.add_argument("path")
+    generate.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    generate.add_argument("--format", choices=tuple(record_codecs.ENCODERS))
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        generator = generate_contacts if args.kind == "contacts" else generate_tasks
+        record_codecs.write_records(args.path, generator(args.count, args.seed), args.format)
+        return
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f) # Read first, so a bad path fails before the run
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = run(sizes, args.repeat, args.seed, args.only, args.format, args.tk)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if baseline is not None:
+        print()
+        if compare(results, baseline):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,656 @@
+import csv
+import functools
+import math
+import operator
+import re
+import struct
+import sys
+from array import array
+from collections import deque
+
+try:
+    import numpy as np # Optional: batch evaluation runs as whole-column kernels
+except ImportError:
+    np = None
+
+# --- Calculation Engine ---
+# What the calculator window computes, without the window: nothing here
+# imports tkinter, so scripts can use it directly or run
+#   python calc_engine.py 7 / 2
+#   python calc_engine.py --expr "2 * (x + 1)" x=4
+#   python calc_engine.py --sheet budget.txt
+#   python calc_engine.py --batch operands.csv results.csv
+
+OPERATIONS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+}
+
+# Per-element outcomes of a batch; the messages are the calculator's own
+OK = 0
+DIVISION_BY_ZERO = 1
+INVALID_OPERATION = 2
+INVALID_NUMBER = 3
+ERROR_MESSAGES = {
+    DIVISION_BY_ZERO: "Division by zero",
+    INVALID_OPERATION: "Invalid operation",
+    INVALID_NUMBER: "Invalid number input",
+}
+
+def compute(num1, num2, operation):
+    """Applies one of OPERATIONS to two numbers. Raises ZeroDivisionError for
+    division by zero and KeyError for an unknown operation."""
+    num1, num2 = float(num1), float(num2)
+    if operation == '/' and num2 == 0:
+        raise ZeroDivisionError("Division by zero")
+    return OPERATIONS[operation](num1, num2)
+
+def format_number(result):
+    """Whole numbers without a trailing .0, anything else to 4 decimals."""
+    if isinstance(result, float) and result.is_integer():
+        return str(int(result))
+    return f"{result:.4f}"
+
+def format_result(result):
+    return f"Result: {format_number(result)}"
+
+def calculation_result(num1_str, num2_str, operation):
+    """Returns (value, text shown) for these inputs; value is None when the
+    text is an error message."""
+    try:
+        num1 = float(num1_str)
+        num2 = float(num2_str)
+    except ValueError:
+        return None, f"Error: {ERROR_MESSAGES[INVALID_NUMBER]}"
+    if operation not in OPERATIONS:
+        return None, f"Error: {ERROR_MESSAGES[INVALID_OPERATION]}"
+    try:
+        value = compute(num1, num2, operation)
+    except ZeroDivisionError:
+        return None, f"Error: {ERROR_MESSAGES[DIVISION_BY_ZERO]}"
+    return value, format_result(value)
+
+def evaluate(num1_str, num2_str, operation):
+    """Returns the text the calculator shows for these inputs: the formatted
+    result, or the matching error message."""
+    return calculation_result(num1_str, num2_str, operation)[1]
+
+# --- Expressions ---
+# Full expressions such as "2 * (ans - 1) / sqrt(x)": + - * / with the usual
+# precedence, ** (or ^) for powers, unary minus, parentheses, the functions
+# and constants below, and variables bound at evaluation time. Text is
+# parsed once into a tree of closures (constant parts folded) and kept in an
+# LRU cache keyed by the text, so evaluating the same expression again with
+# new variable values skips parsing. Nothing is ever passed to eval().
+
+EXPRESSION_CACHE_SIZE = 1024
+FUNCTIONS = { # name: (function, fewest arguments, most arguments)
+    'sqrt': (math.sqrt, 1, 1), 'exp': (math.exp, 1, 1),
+    'log': (math.log, 1, 2), 'log10': (math.log10, 1, 1),
+    'sin': (math.sin, 1, 1), 'cos': (math.cos, 1, 1), 'tan': (math.tan, 1, 1),
+    'asin': (math.asin, 1, 1), 'acos': (math.acos, 1, 1), 'atan': (math.atan, 1, 1),
+    'abs': (abs, 1, 1), 'floor': (math.floor, 1, 1), 'ceil': (math.ceil, 1, 1),
+    'round': (lambda x, digits=0: round(x, int(digits)), 1, 2), 'min': (min, 2, None), 'max': (max, 2, None),
+    'pow': (math.pow, 2, 2), 'hypot': (math.hypot, 1, None),
+}
+CONSTANTS = {'pi': math.pi, 'e': math.e, 'tau': math.tau}
+
+_EXPRESSION_TOKEN = re.compile(r"\s*(?:(\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)|([A-Za-z_]\w*)|(\*\*|[-+*/^(),]))")
+
+class ExpressionError(ValueError):
+    """Raised for an expression that can't be parsed or has unbound variables."""
+
+def _divide(a, b):
+    if b == 0:
+        raise ZeroDivisionError("Division by zero")
+    return a / b
+
+_BINARY = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': _divide, '**': math.pow}
+
+class _Parser:
+    """Recursive descent over the token list. Each parse method returns
+    (closure, constant): closure(variables) computes the node, and constant
+    is its value when it has no variables (else None)."""
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = []
+        self.texts = [] # Each token as written, for error messages
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = _EXPRESSION_TOKEN.match(text, position)
+            if match is None:
+                raise ExpressionError(f"Unexpected character {text[position:].lstrip()[0]!r}")
+            number, name, symbol = match.groups()
+            self.tokens.append(('number', float(number)) if number else ('name', name) if name
+                               else ('symbol', '**' if symbol == '^' else symbol))
+            self.texts.append(match.group().strip())
+            position = match.end()
+        self.position = 0
+        self.variables = set()
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def take(self, symbol=None):
+        token = self.peek()
+        if symbol is not None and token != ('symbol', symbol):
+            found = "end of expression" if token[0] is None else repr(self.texts[self.position])
+            raise ExpressionError(f"Expected {symbol!r} but found {found}")
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ExpressionError("Empty expression")
+        node = self.sum()
+        if self.position != len(self.tokens):
+            raise ExpressionError(f"Unexpected {self.texts[self.position]!r}")
+        return node
+
+    @staticmethod
+    def _fold(closure, operands):
+        """Computes a node now when all its operands are constants (unless
+        that fails, e.g. 1/0: then the error is raised at evaluation)."""
+        if all(constant is not None for _, constant in operands):
+            try:
+                value = closure(None)
+            except (ArithmeticError, ValueError):
+                return closure, None
+            return (lambda variables: value), value
+        return closure, None
+
+    def _binary(self, symbol, left, right):
+        function, (left_fn, _), (right_fn, _) = _BINARY[symbol], left, right
+        return self._fold(lambda variables: function(left_fn(variables), right_fn(variables)), (left, right))
+
+    def sum(self):
+        node = self.product()
+        while self.peek() in (('symbol', '+'), ('symbol', '-')):
+            node = self._binary(self.take()[1], node, self.product())
+        return node
+
+    def product(self):
+        node = self.unary()
+        while self.peek() in (('symbol', '*'), ('symbol', '/')):
+            node = self._binary(self.take()[1], node, self.unary())
+        return node
+
+    def unary(self):
+        if self.peek() in (('symbol', '-'), ('symbol', '+')):
+            sign = self.take()[1]
+            operand = self.unary()
+            if sign == '+':
+                return operand
+            operand_fn = operand[0]
+            return self._fold(lambda variables: -operand_fn(variables), (operand,))
+        return self.power()
+
+    def power(self):
+        base = self.atom()
+        if self.peek() == ('symbol', '**'):
+            self.take()
+            return self._binary('**', base, self.unary()) # Right-associative; -2**2 is -(2**2)
+        return base
+
+    def atom(self):
+        kind, value = self.take()
+        if kind == 'number':
+            return (lambda variables: value), value
+        if kind == 'name':
+            if self.peek() == ('symbol', '('):
+                return self.call(value)
+            if value in CONSTANTS:
+                constant = CONSTANTS[value]
+                return (lambda variables: constant), constant
+            self.variables.add(value)
+            return (lambda variables: variables[value]), None
+        if (kind, value) == ('symbol', '('):
+            node = self.sum()
+            self.take(')')
+            return node
+        raise ExpressionError("Unexpected end of expression" if kind is None else f"Unexpected {self.texts[self.position - 1]!r}")
+
+    def call(self, name):
+        if name not in FUNCTIONS:
+            raise ExpressionError(f"Unknown function {name!r}")
+        function, fewest, most = FUNCTIONS[name]
+        self.take('(')
+        arguments = [self.sum()]
+        while self.peek() == ('symbol', ','):
+            self.take()
+            arguments.append(self.sum())
+        self.take(')')
+        if len(arguments) < fewest or (most is not None and len(arguments) > most):
+            raise ExpressionError(f"Wrong number of arguments for {name}()")
+        argument_fns = [fn for fn, _ in arguments]
+        if len(argument_fns) == 1:
+            argument_fn = argument_fns[0]
+            return self._fold(lambda variables: function(argument_fn(variables)), arguments)
+        return self._fold(lambda variables: function(*[fn(variables) for fn in argument_fns]), arguments)
+
+class CompiledExpression:
+    """An expression parsed once; call evaluate() with any variable bindings."""
+    __slots__ = ('text', 'variables', '_closure')
+
+    def __init__(self, text):
+        parser = _Parser(text)
+        try:
+            self._closure = parser.parse()[0]
+        except RecursionError:
+            raise ExpressionError("nested too deeply") from None
+        self.text = text
+        self.variables = frozenset(parser.variables)
+
+    def evaluate(self, variables=None):
+        """Returns the value as a float. Raises ExpressionError for unbound
+        variables or a chain of operators too long to evaluate, and
+        ZeroDivisionError, OverflowError or ValueError (math domain) like the
+        equivalent float arithmetic."""
+        variables = variables or {}
+        missing = self.variables.difference(variables)
+        if missing:
+            raise ExpressionError(f"Unknown variable {sorted(missing)[0]!r}")
+        try:
+            return float(self._closure(variables))
+        except RecursionError: # e.g. 'x+x+...+x': constants fold away, variables can't
+            raise ExpressionError("nested too deeply") from None
+
+    def __repr__(self):
+        return f"CompiledExpression({self.text!r})"
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(text):
+    """Parses 'text' (cached by text). Raises ExpressionError for bad syntax."""
+    return CompiledExpression(text)
+
+def expression_result(text, variables=None):
+    """Returns (value, text shown) for an expression; value is None when the
+    text is an error message (division by zero reads as it always has)."""
+    try:
+        value = compile_expression(text.strip()).evaluate(variables)
+    except ExpressionError as e:
+        return None, f"Error: Invalid expression - {e}"
+    except ZeroDivisionError:
+        return None, f"Error: {ERROR_MESSAGES[DIVISION_BY_ZERO]}"
+    except OverflowError:
+        return None, "Error: Result too large"
+    except ValueError:
+        return None, "Error: Math domain error"
+    return value, format_result(value)
+
+def evaluate_expression(text, variables=None):
+    """Returns the text the calculator shows for an expression."""
+    return expression_result(text, variables)[1]
+
+# --- Worksheets ---
+# Named cells holding numbers or expressions over other cells, e.g.
+#   price = 4.5
+#   total = price * qty * (1 + tax)
+# Each cell's inputs (its expression's variables) and, in reverse, its
+# dependents are kept as a graph. Changing a cell recomputes only the cells
+# downstream of it, each once and in dependency order, so an edit costs time
+# proportional to what it affects rather than to the size of the sheet.
+
+CELL_NAME = re.compile(r"[A-Za-z_]\w*\Z")
+
+class CellError:
+    """The value of a cell that could not be computed."""
+    __slots__ = ('message',)
+
+    def __init__(self, message):
+        self.message = message
+
+    def __repr__(self):
+        return f"CellError({self.message!r})"
+
+class Worksheet:
+    def __init__(self):
+        self.formulas = {} # name -> expression text
+        self.values = {} # name -> float or CellError
+        self._compiled = {} # name -> CompiledExpression
+        self._inputs = {} # name -> cells its expression refers to
+        self._dependents = {} # name -> set of cells referring to it (defined or not)
+
+    def __contains__(self, name):
+        return name in self.formulas
+
+    def __len__(self):
+        return len(self.formulas)
+
+    def set(self, name, text):
+        """Defines or redefines a cell. Raises ExpressionError for a bad name,
+        bad syntax, a circular reference or an expression too deeply nested to
+        evaluate (the sheet is left unchanged). Returns the names of the cells
+        whose values were recomputed."""
+        if not CELL_NAME.match(name) or name in CONSTANTS:
+            raise ExpressionError(f"Invalid cell name {name!r}")
+        compiled = compile_expression(text.strip())
+        inputs = compiled.variables
+        # Only new inputs can close a cycle, and only if they are downstream of this cell
+        if self._feeds(name, inputs - self._inputs.get(name, frozenset())):
+            raise ExpressionError(f"Circular reference in {name!r}")
+        value = self._cell_value(compiled, inputs) # Before any change, as it may raise
+        for old_input in self._inputs.get(name, ()):
+            self._dependents[old_input].discard(name)
+        for new_input in inputs:
+            self._dependents.setdefault(new_input, set()).add(name)
+        self.formulas[name] = text.strip()
+        self._compiled[name] = compiled
+        self._inputs[name] = inputs
+        return self._recompute(name, value)
+
+    def delete(self, name):
+        """Removes a cell; cells that refer to it become errors. Returns the
+        names of the cells recomputed."""
+        if name not in self.formulas:
+            return []
+        for old_input in self._inputs.pop(name):
+            self._dependents[old_input].discard(name)
+        del self.formulas[name], self._compiled[name], self.values[name]
+        return self._recompute(name)[1:]
+
+    def _feeds(self, name, targets):
+        """True if any of 'targets' is 'name' or downstream of it."""
+        if not targets:
+            return False
+        seen = {name}
+        stack = [name]
+        while stack:
+            current = stack.pop()
+            if current in targets:
+                return True
+            for dependent in self._dependents.get(current, ()):
+                if dependent not in seen:
+                    seen.add(dependent)
+                    stack.append(dependent)
+        return False
+
+    def _recompute(self, changed, value=None):
+        """Recomputes 'changed' and everything downstream of it in
+        topological order (Kahn's algorithm over just the affected cells).
+        'value' is the new value of 'changed' itself, when set() has it."""
+        affected = {changed}
+        stack = [changed]
+        while stack:
+            for dependent in self._dependents.get(stack.pop(), ()):
+                if dependent not in affected:
+                    affected.add(dependent)
+                    stack.append(dependent)
+        waiting = {name: sum(1 for i in self._inputs.get(name, ()) if i in affected) for name in affected}
+        ready = deque(name for name, count in waiting.items() if count == 0)
+        order = []
+        while ready:
+            name = ready.popleft()
+            order.append(name)
+            if name == changed and value is not None:
+                self.values[name] = value
+            elif name in self.formulas:
+                self.values[name] = self._evaluate(name)
+            for dependent in self._dependents.get(name, ()):
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+        return order
+
+    def _evaluate(self, name):
+        try:
+            return self._cell_value(self._compiled[name], self._inputs[name])
+        except ExpressionError as e:
+            return CellError(str(e))
+
+    def _cell_value(self, compiled, inputs):
+        """The value for an expression over the current cell values: a float,
+        or a CellError. Raises ExpressionError if it can't be evaluated at all."""
+        variables = {}
+        for input_name in inputs:
+            value = self.values.get(input_name)
+            if value is None:
+                return CellError(f"Unknown cell '{input_name}'")
+            if isinstance(value, CellError):
+                return CellError(f"Error in '{input_name}'")
+            variables[input_name] = value
+        try:
+            return compiled.evaluate(variables)
+        except ExpressionError:
+            raise
+        except ZeroDivisionError:
+            return CellError(ERROR_MESSAGES[DIVISION_BY_ZERO])
+        except OverflowError:
+            return CellError("Result too large")
+        except ValueError:
+            return CellError("Math domain error")
+
+    def display(self, name):
+        """A cell's value as the calculator shows results."""
+        value = self.values[name]
+        if isinstance(value, CellError):
+            return f"Error: {value.message}"
+        return format_result(value)
+
+    def load_lines(self, lines):
+        """Defines cells from 'name = expression' lines (blank lines and
+        '#' comments skipped), in any order. Returns the number defined."""
+        count = 0
+        for number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            name, equals, text = line.partition('=')
+            if not equals:
+                raise ExpressionError(f"Line {number}: expected 'name = expression'")
+            try:
+                self.set(name.strip(), text)
+            except ExpressionError as e:
+                raise ExpressionError(f"Line {number}: {e}")
+            count += 1
+        return count
+
+# --- Batch Evaluation ---
+# Columns of operands and operators are evaluated in one call. With NumPy
+# each operator is one masked whole-column kernel; without it the same
+# results come from a plain loop. Either way an element that can't be
+# computed gets NaN in 'values' and its error code in 'errors', and the
+# rest of the batch is unaffected.
+
+def _float_column(column, errors):
+    """Parses a column of numbers; unparseable entries become NaN and are marked INVALID_NUMBER."""
+    try:
+        return array('d', map(float, column))
+    except ValueError:
+        pass
+    values = array('d')
+    for i, text in enumerate(column):
+        try:
+            values.append(float(text))
+        except ValueError:
+            values.append(float('nan'))
+            errors[i] = INVALID_NUMBER
+    return values
+
+def evaluate_batch(num1, num2, operations, errors=None):
+    """Evaluates num1[i] <operations[i]> num2[i] for every i.
+
+    num1/num2 are sequences of floats (lists, array('d') or NumPy arrays);
+    operations is a sequence of '+', '-', '*', '/' (strings or bytes).
+    'errors' may carry codes from parsing (see read_batch_*). Returns
+    (values, errors): NumPy arrays (float64, uint8) when NumPy is installed,
+    otherwise array('d') and array('B')."""
+    count = len(num1)
+    if errors is None:
+        errors = array('B', bytes(count))
+    if np is not None:
+        return _evaluate_batch_numpy(num1, num2, operations, errors)
+    values = array('d', bytes(8 * count))
+    nan = float('nan')
+    for i, (x, y, op) in enumerate(zip(num1, num2, operations)):
+        if isinstance(op, int):
+            op = chr(op) # Iterating bytes yields ints
+        if errors[i]:
+            values[i] = nan
+        elif op not in OPERATIONS:
+            values[i], errors[i] = nan, INVALID_OPERATION
+        elif op == '/' and y == 0:
+            values[i], errors[i] = nan, DIVISION_BY_ZERO
+        else:
+            values[i] = OPERATIONS[op](x, y)
+    return values, errors
+
+def _column(values, dtype):
+    if isinstance(values, array):
+        return np.frombuffer(values, dtype=dtype) # No per-element conversion
+    return np.asarray(values, dtype=dtype)
+
+def _evaluate_batch_numpy(num1, num2, operations, errors):
+    a = _column(num1, np.float64)
+    b = _column(num2, np.float64)
+    if isinstance(operations, (bytes, bytearray)):
+        ops = np.frombuffer(operations, dtype=np.uint8)
+    else:
+        ops = np.fromiter((ord(op) if isinstance(op, str) and len(op) == 1 else 0 for op in operations),
+                          dtype=np.uint8, count=len(a))
+    errors = _column(errors, np.uint8).copy()
+    values = np.full(len(a), np.nan)
+    pending = errors == OK
+    ufuncs = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.true_divide}
+    with np.errstate(over='ignore', invalid='ignore'): # inf/nan results, as float arithmetic gives
+        for op in OPERATIONS:
+            mask = pending & (ops == ord(op))
+            if op == '/':
+                zero = mask & (b == 0)
+                errors[zero] = DIVISION_BY_ZERO
+                mask &= ~zero
+            ufuncs[op](a, b, out=values, where=mask) # Masked in place; no gathering of operands
+            pending &= ~mask
+    errors[pending & (errors == OK)] = INVALID_OPERATION
+    return values, errors
+
+def format_batch(values, errors):
+    """format_number() for a whole column: '' where errors[i] is set."""
+    if np is None:
+        return [format_number(value) if not error else "" for value, error in zip(values, errors)]
+    values = np.asarray(values, dtype=np.float64)
+    ok = np.asarray(errors) == OK
+    whole = ok & np.isfinite(values) & (values == np.trunc(values))
+    fits = whole & (np.abs(values) < 2.0 ** 63) # Exact through int64
+    texts = np.full(len(values), "", dtype=object)
+    texts[fits] = values[fits].astype(np.int64).astype(str)
+    big = whole & ~fits
+    texts[big] = [str(int(value)) for value in values[big]]
+    fractional = ok & ~whole
+    texts[fractional] = [f"{value:.4f}" for value in values[fractional].tolist()] # Faster than np.char.mod
+    return texts.tolist()
+
+# CSV: a header naming num1, num2 and operation columns (any order), one row per calculation.
+# Binary: BATCH_MAGIC, the row count, then the num1 column (float64), the num2
+# column (float64) and the operation column (one ASCII byte each), little-endian.
+# Results: RESULTS_MAGIC, the row count, the values (float64) and error codes (uint8).
+BATCH_MAGIC = b"CALCBAT1"
+RESULTS_MAGIC = b"CALCRES1"
+_BINARY_HEADER = struct.Struct("<8sQ")
+
+def read_batch_csv(path):
+    """Returns (num1, num2, operations, errors) from a CSV file."""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = [name.strip().lower() for name in next(reader, [])]
+        try:
+            columns = [header.index(name) for name in ("num1", "num2", "operation")]
+        except ValueError:
+            raise ValueError(f"{path}: the header must name num1, num2 and operation columns")
+        rows = [(row[columns[0]], row[columns[1]], row[columns[2]].strip()) for row in reader if row]
+    num1_text, num2_text, operations = zip(*rows) if rows else ((), (), ())
+    errors = array('B', bytes(len(rows)))
+    num1 = _float_column(num1_text, errors)
+    num2 = _float_column(num2_text, errors)
+    return num1, num2, list(operations), errors
+
+def read_batch_binary(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < _BINARY_HEADER.size:
+        raise ValueError(f"{path}: truncated batch file")
+    magic, count = _BINARY_HEADER.unpack_from(data)
+    if magic != BATCH_MAGIC:
+        raise ValueError(f"{path} is not a calculator batch file")
+    if len(data) < _BINARY_HEADER.size + 17 * count:
+        raise ValueError(f"{path}: truncated batch file")
+    if len(data) > _BINARY_HEADER.size + 17 * count:
+        raise ValueError(f"{path}: unexpected data after the last row")
+    offset = _BINARY_HEADER.size
+    num1 = array('d', data[offset:offset + 8 * count])
+    num2 = array('d', data[offset + 8 * count:offset + 16 * count])
+    if sys.byteorder != 'little':
+        num1.byteswap()
+        num2.byteswap()
+    operations = data[offset + 16 * count:]
+    return num1, num2, operations, array('B', bytes(count))
+
+def write_batch_binary(path, num1, num2, operations):
+    """Writes a batch input file (the counterpart of read_batch_binary())."""
+    columns = [array('d', num1), array('d', num2)]
+    if sys.byteorder != 'little':
+        for column in columns:
+            column.byteswap()
+    with open(path, 'wb') as f:
+        f.write(_BINARY_HEADER.pack(BATCH_MAGIC, len(columns[0])))
+        for column in columns:
+            f.write(column.tobytes())
+        f.write(bytes(operations) if isinstance(operations, (bytes, bytearray))
+                else "".join(operations).encode('ascii'))
+
+def write_results_csv(path, values, errors):
+    texts = format_batch(values, errors)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(("result", "error"))
+        writer.writerows((text, ERROR_MESSAGES.get(int(error), "")) for text, error in zip(texts, errors))
+
+def write_results_binary(path, values, errors):
+    values = array('d', values)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    with open(path, 'wb') as f:
+        f.write(_BINARY_HEADER.pack(RESULTS_MAGIC, len(values)))
+        f.write(values.tobytes())
+        f.write(bytes(errors))
+
+def run_batch(input_path, output_path):
+    """Evaluates a .csv or binary batch file into a .csv or binary results
+    file (by extension). Returns (rows, rows with errors)."""
+    read = read_batch_csv if input_path.lower().endswith(".csv") else read_batch_binary
+    write = write_results_csv if output_path.lower().endswith(".csv") else write_results_binary
+    num1, num2, operations, errors = read(input_path)
+    values, errors = evaluate_batch(num1, num2, operations, errors)
+    write(output_path, values, errors)
+    return len(values), len(errors) - bytes(errors).count(OK)
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 3 and sys.argv[1] == "--expr":
+        try:
+            bindings = {name: float(value) for name, value in (binding.split("=", 1) for binding in sys.argv[3:])}
+        except ValueError:
+            sys.exit("variable values must be numbers (name=value)")
+        print(evaluate_expression(sys.argv[2], bindings))
+    elif len(sys.argv) == 3 and sys.argv[1] == "--sheet":
+        sheet = Worksheet()
+        with open(sys.argv[2]) as f:
+            try:
+                sheet.load_lines(f)
+            except ExpressionError as e:
+                sys.exit(f"{sys.argv[2]}: {e}")
+        for name in sheet.formulas:
+            print(f"{name} = {sheet.display(name)}")
+    elif len(sys.argv) == 4 and sys.argv[1] == "--batch":
+        rows, failed = run_batch(sys.argv[2], sys.argv[3])
+        print(f"Evaluated {rows} row(s), {failed} with errors.")
+    elif len(sys.argv) == 4:
+        print(evaluate(sys.argv[1], sys.argv[3], sys.argv[2]))
+    else:
+        sys.exit("usage: python calc_engine.py NUMBER {+,-,*,/} NUMBER\n"
+                 "       python calc_engine.py --expr EXPRESSION [NAME=VALUE ...]\n"
+                 "       python calc_engine.py --sheet FILE   ('name = expression' lines)\n"
+                 "       python calc_engine.py --batch INPUT OUTPUT   (.csv or binary)")
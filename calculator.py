@@ -1,116 +1,188 @@
 # Unique Code ID: TKCALC_BASIC_GUI_V1_20231027
 
-import tkinter as tk
-from tkinter import messagebox # For potential error popups (optional, here we display in label)
-import math # For checking if float is integer
+from bisect import bisect_left
+from instrumentation import timed
+from calc_engine import ExpressionError, Worksheet, calculation_result, expression_result # The arithmetic itself; works without Tk
 
+last_result = None # Available as 'ans' in expressions
+worksheet = Worksheet() # Kept for the session; the window can be closed and reopened
+
+def show_result(value, text):
+    global last_result
+    result_var.set(text)
+    if value is not None:
+        last_result = value
+
+@timed('calculator.calculate')
 def calculate():
     """
     Gets values from entry fields, performs calculation based on selected
     operation, and updates the result label. Handles potential errors.
     """
     try:
-        num1_str = entry_num1.get()
-        num2_str = entry_num2.get()
-
-        # Validate and convert inputs
-        num1 = float(num1_str)
-        num2 = float(num2_str)
-
-        operation = operation_var.get() # Get selected operation from radio button
-
-        result = None
-
-        # Perform calculation
-        if operation == '+':
-            result = num1 + num2
-        elif operation == '-':
-            result = num1 - num2
-        elif operation == '*':
-            result = num1 * num2
-        elif operation == '/':
-            if num2 == 0:
-                result_var.set("Error: Division by zero")
-                # messagebox.showerror("Error", "Division by zero is not allowed.")
-                return # Stop calculation
-            else:
-                result = num1 / num2
-        else:
-            # This case should ideally not be reached with radio buttons
-            result_var.set("Error: Invalid operation")
-            return
-
-        # Format and display result
-        if result is not None:
-             # Format nicely, removing trailing .0 for whole numbers
-            if isinstance(result, float) and result.is_integer():
-                result_var.set(f"Result: {int(result)}")
-            else:
-                 result_var.set(f"Result: {result:.4f}") # Format float
-
-    except ValueError:
-        result_var.set("Error: Invalid number input")
-        # messagebox.showerror("Error", "Please enter valid numbers.")
+        show_result(*calculation_result(entry_num1.get(), entry_num2.get(), operation_var.get()))
     except Exception as e:
         result_var.set(f"An unexpected error occurred: {e}")
-        # messagebox.showerror("Error", f"An unexpected error occurred: {e}")
-
-# --- Setup Main Window ---
-root = tk.Tk()
-root.title("Simple Tkinter Calculator")
-root.geometry("300x250") # Set a fixed window size (width x height)
-root.resizable(False, False) # Prevent resizing
-
-# --- Variables ---
-# StringVar to hold the selected operation
-operation_var = tk.StringVar(value='+') # Default to addition
-# StringVar to display the result or errors
-result_var = tk.StringVar(value="Result: ")
-
-# --- Widgets ---
-
-# Number 1 Input
-label_num1 = tk.Label(root, text="First Number:")
-entry_num1 = tk.Entry(root, width=20)
-
-# Number 2 Input
-label_num2 = tk.Label(root, text="Second Number:")
-entry_num2 = tk.Entry(root, width=20)
-
-# Operation Selection Frame (to group radio buttons)
-op_frame = tk.Frame(root)
-label_op = tk.Label(op_frame, text="Operation:")
 
-# Radio Buttons for Operations
-radio_add = tk.Radiobutton(op_frame, text="+", variable=operation_var, value='+')
-radio_sub = tk.Radiobutton(op_frame, text="-", variable=operation_var, value='-')
-radio_mul = tk.Radiobutton(op_frame, text="*", variable=operation_var, value='*')
-radio_div = tk.Radiobutton(op_frame, text="/", variable=operation_var, value='/')
-
-# Calculate Button
-calc_button = tk.Button(root, text="Calculate", command=calculate, width=15)
-
-# Result Display Label
-result_label = tk.Label(root, textvariable=result_var, relief=tk.SUNKEN, width=25, anchor='w') # anchor='w' aligns text left
-
-# --- Layout using grid ---
-label_num1.grid(row=0, column=0, padx=10, pady=5, sticky='w')
-entry_num1.grid(row=0, column=1, padx=10, pady=5)
-
-label_num2.grid(row=1, column=0, padx=10, pady=5, sticky='w')
-entry_num2.grid(row=1, column=1, padx=10, pady=5)
-
-# Place the operation frame and its contents
-op_frame.grid(row=2, column=0, columnspan=2, pady=5, sticky='w')
-label_op.pack(side=tk.LEFT, padx=10) # Use pack within the frame
-radio_add.pack(side=tk.LEFT)
-radio_sub.pack(side=tk.LEFT)
-radio_mul.pack(side=tk.LEFT)
-radio_div.pack(side=tk.LEFT)
+@timed('calculator.calculate_expression')
+def calculate_expression(event=None):
+    """Evaluates the expression field; 'ans' is the previous result."""
+    variables = {} if last_result is None else {'ans': last_result}
+    try:
+        show_result(*expression_result(entry_expr.get(), variables))
+    except Exception as e:
+        result_var.set(f"An unexpected error occurred: {e}")
 
-calc_button.grid(row=3, column=0, columnspan=2, pady=15) # Span across columns
+# --- Worksheet Window ---
+def open_worksheet():
+    """Shows the worksheet: one row per cell, sorted by name. An edit only
+    redraws the rows of the cells it recomputed."""
+    import tkinter as tk
+    from tkinter import messagebox
+
+    window = tk.Toplevel(root)
+    window.title("Worksheet")
+    window.geometry("420x360")
+    names = sorted(worksheet.formulas) # Row i shows names[i]
+
+    def row_text(name):
+        return f"{name} = {worksheet.formulas[name]}    {worksheet.display(name)}"
+
+    def redraw(changed):
+        for name in changed:
+            if name not in worksheet:
+                continue
+            index = bisect_left(names, name)
+            if index < len(names) and names[index] == name:
+                cell_list.delete(index)
+            else:
+                names.insert(index, name)
+            cell_list.insert(index, row_text(name))
 
-result_label.grid(row=4, column=0, columnspan=2, padx=10, pady=10, sticky='ew') # sticky='ew' makes it stretch horizontally
+    def set_cell(event=None):
+        name, equals, text = entry_cell.get().partition('=')
+        if not equals:
+            messagebox.showerror("Worksheet", "Enter a cell as 'name = expression'.", parent=window)
+            return
+        try:
+            changed = worksheet.set(name.strip(), text)
+        except ExpressionError as e:
+            messagebox.showerror("Worksheet", str(e), parent=window)
+            return
+        redraw(changed)
+        entry_cell.delete(0, tk.END)
 
-# --- Start the Tkinter event loop ---
-root.mainloop()
\ No newline at end of file
+    def delete_cell():
+        selected = cell_list.curselection()
+        if not selected:
+            return
+        index = int(selected[0])
+        changed = worksheet.delete(names.pop(index))
+        cell_list.delete(index)
+        redraw(changed)
+
+    def edit_selected(event):
+        selected = cell_list.curselection()
+        if selected:
+            name = names[int(selected[0])]
+            entry_cell.delete(0, tk.END)
+            entry_cell.insert(0, f"{name} = {worksheet.formulas[name]}")
+
+    entry_frame = tk.Frame(window)
+    entry_frame.pack(fill=tk.X, padx=10, pady=5)
+    entry_cell = tk.Entry(entry_frame)
+    entry_cell.pack(side=tk.LEFT, fill=tk.X, expand=True)
+    entry_cell.bind("<Return>", set_cell)
+    tk.Button(entry_frame, text="Set", command=set_cell).pack(side=tk.LEFT, padx=5)
+    tk.Button(entry_frame, text="Delete", command=delete_cell).pack(side=tk.LEFT)
+
+    list_frame = tk.Frame(window)
+    list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+    scrollbar = tk.Scrollbar(list_frame, orient=tk.VERTICAL)
+    scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    cell_list = tk.Listbox(list_frame, yscrollcommand=scrollbar.set)
+    cell_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    scrollbar.config(command=cell_list.yview)
+    cell_list.bind("<Double-Button-1>", edit_selected)
+    cell_list.insert(tk.END, *[row_text(name) for name in names])
+
+def main():
+    global root, operation_var, result_var, entry_num1, entry_num2, entry_expr
+    import tkinter as tk # Imported here so 'import calculator' stays cheap and display-free
+
+    # --- Setup Main Window ---
+    root = tk.Tk()
+    root.title("Simple Tkinter Calculator")
+    root.geometry("300x360") # Set a fixed window size (width x height)
+    root.resizable(False, False) # Prevent resizing
+
+    # --- Variables ---
+    # StringVar to hold the selected operation
+    operation_var = tk.StringVar(value='+') # Default to addition
+    # StringVar to display the result or errors
+    result_var = tk.StringVar(value="Result: ")
+
+    # --- Widgets ---
+
+    # Number 1 Input
+    label_num1 = tk.Label(root, text="First Number:")
+    entry_num1 = tk.Entry(root, width=20)
+
+    # Number 2 Input
+    label_num2 = tk.Label(root, text="Second Number:")
+    entry_num2 = tk.Entry(root, width=20)
+
+    # Operation Selection Frame (to group radio buttons)
+    op_frame = tk.Frame(root)
+    label_op = tk.Label(op_frame, text="Operation:")
+
+    # Radio Buttons for Operations
+    radio_add = tk.Radiobutton(op_frame, text="+", variable=operation_var, value='+')
+    radio_sub = tk.Radiobutton(op_frame, text="-", variable=operation_var, value='-')
+    radio_mul = tk.Radiobutton(op_frame, text="*", variable=operation_var, value='*')
+    radio_div = tk.Radiobutton(op_frame, text="/", variable=operation_var, value='/')
+
+    # Calculate Button
+    calc_button = tk.Button(root, text="Calculate", command=calculate, width=15)
+
+    # Expression Input, e.g. "(ans + 2) * sqrt(9)"
+    label_expr = tk.Label(root, text="Expression:")
+    entry_expr = tk.Entry(root, width=20)
+    entry_expr.bind("<Return>", calculate_expression)
+    expr_button = tk.Button(root, text="Evaluate", command=calculate_expression, width=15)
+
+    # Worksheet of named cells (see open_worksheet)
+    sheet_button = tk.Button(root, text="Worksheet...", command=open_worksheet, width=15)
+
+    # Result Display Label
+    result_label = tk.Label(root, textvariable=result_var, relief=tk.SUNKEN, width=25, anchor='w') # anchor='w' aligns text left
+
+    # --- Layout using grid ---
+    label_num1.grid(row=0, column=0, padx=10, pady=5, sticky='w')
+    entry_num1.grid(row=0, column=1, padx=10, pady=5)
+
+    label_num2.grid(row=1, column=0, padx=10, pady=5, sticky='w')
+    entry_num2.grid(row=1, column=1, padx=10, pady=5)
+
+    # Place the operation frame and its contents
+    op_frame.grid(row=2, column=0, columnspan=2, pady=5, sticky='w')
+    label_op.pack(side=tk.LEFT, padx=10) # Use pack within the frame
+    radio_add.pack(side=tk.LEFT)
+    radio_sub.pack(side=tk.LEFT)
+    radio_mul.pack(side=tk.LEFT)
+    radio_div.pack(side=tk.LEFT)
+
+    calc_button.grid(row=3, column=0, columnspan=2, pady=15) # Span across columns
+
+    label_expr.grid(row=4, column=0, padx=10, pady=5, sticky='w')
+    entry_expr.grid(row=4, column=1, padx=10, pady=5)
+    expr_button.grid(row=5, column=0, columnspan=2, pady=5)
+    sheet_button.grid(row=7, column=0, columnspan=2, pady=5)
+
+    result_label.grid(row=6, column=0, columnspan=2, padx=10, pady=10, sticky='ew') # sticky='ew' makes it stretch horizontally
+
+    # --- Start the Tkinter event loop ---
+    root.mainloop()
+
+if __name__ == "__main__":
+    main()
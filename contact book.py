@@ -1,91 +1,196 @@
 # Unique Code: PYCONBOOK_TK_V1_20231027
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-import json
-import os
-import re # For basic validation
-
-CONTACTS_FILE = "contacts_data.json"
+from tkinter import ttk, messagebox, simpledialog, filedialog
+import tkinter.font as tkfont
+import csv
+from file_watcher import FileWatcher
+from instrumentation import timed
+from contact_store import (Contact, contact_validation_error, export_contacts, find_duplicates, flush_storage,
+    import_contacts, merge_duplicates, new_contact_id, open_book, persist_add, persist_delete, persist_update,
+    requeue_failed_entries, sync_from_storage, sync_then_save, sync_watch_paths)
+
+# --- Contact Book Window ---
+# The storage, search and duplicate logic lives in contact_store.py; this
+# script only builds the window around it.
 UNIQUE_CODE = "PYCONBOOK_TK_V1_20231027"
-
-# --- Data Handling (similar to console version) ---
-def load_contacts():
-    if os.path.exists(CONTACTS_FILE):
+SYNC_RETRY_MS = 200 # How soon to retry merging other windows' changes while ours are still saving
+LIVE_SEARCH_DELAY_MS = 150 # Debounce for the filter entry
+LIVE_SEARCH_LIMIT = 1000 # Rows shown per live query
+
+selected_contact_id = None
+
+# --- Virtual List ---
+class VirtualListbox:
+    """A Listbox that only ever holds the rows on screen plus a small overscan.
+
+    'rows' can be any sequence with len() and integer indexing (the ContactList
+    or a list of search results); rows are rendered on demand as the view
+    scrolls, so refreshing costs the same for 100 contacts or 1,000,000.
+    Row numbers given to and returned by this class are positions in 'rows'."""
+
+    def __init__(self, master, scrollbar, render, overscan=10, **listbox_options):
+        self.listbox = tk.Listbox(master, **listbox_options)
+        self.scrollbar = scrollbar
+        self.render = render
+        self.overscan = overscan
+        self.rows = []
+        self.offset = 0 # First row in view
+        self.buffer_start = 0 # Row held in listbox line 0
+        self.buffer_len = 0
+        self.selected = None # Selected row, kept while it scrolls out of the buffer
+        self.visible_rows = int(self.listbox.cget('height') or 10)
+        scrollbar.config(command=self.yview)
+        self.listbox.bind('<Configure>', self._on_configure)
+        self.listbox.bind('<<ListboxSelect>>', self._on_listbox_select, add=True)
+        for sequence, step in (('<MouseWheel>', None), ('<Button-4>', -3), ('<Button-5>', 3)):
+            self.listbox.bind(sequence, lambda e, step=step: self._on_wheel(e, step))
+        self.listbox.bind('<Up>', lambda e: self._move_selection(-1))
+        self.listbox.bind('<Down>', lambda e: self._move_selection(1))
+        self.listbox.bind('<Prior>', lambda e: self._move_selection(-self.visible_rows))
+        self.listbox.bind('<Next>', lambda e: self._move_selection(self.visible_rows))
+
+    def grid(self, **options):
+        self.listbox.grid(**options)
+
+    def bind(self, sequence, func):
+        self.listbox.bind(sequence, func, add=True)
+
+    def set_rows(self, rows, keep_position=False):
+        """Points the view at a new row sequence and redraws the visible window."""
+        if not keep_position or rows is not self.rows:
+            self.offset = 0
+            self.selected = None
+        self.rows = rows
+        if self.selected is not None and self.selected >= len(rows):
+            self.selected = None
+        self._render(self.offset, force=True)
+
+    def row(self, index):
+        return self.rows[index] if index is not None and 0 <= index < len(self.rows) else None
+
+    def curselection(self):
+        return () if self.selected is None else (self.selected,)
+
+    def selection_clear(self, first=0, last=None):
+        self.selected = None
+        self.listbox.selection_clear(0, tk.END)
+
+    def see(self, index):
+        if index < self.offset:
+            self._render(index)
+        elif index >= self.offset + self.visible_rows:
+            self._render(index - self.visible_rows + 1)
+
+    def yview(self, *args):
+        """Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'/'pages')."""
+        if not args:
+            return
+        if args[0] == 'moveto':
+            self._render(int(float(args[1]) * len(self.rows)))
+        elif args[0] == 'scroll':
+            step = int(args[1]) * (self.visible_rows if args[2] == 'pages' else 1)
+            self._render(self.offset + step)
+
+    def _render(self, offset, force=False):
+        total = len(self.rows)
+        offset = max(0, min(offset, total - self.visible_rows))
+        self.offset = offset
+        inside_buffer = (self.buffer_start <= offset and
+                         offset + self.visible_rows <= self.buffer_start + self.buffer_len)
+        if force or not inside_buffer:
+            # Refill the buffer around the view; only these rows ever reach Tk
+            self.buffer_start = max(0, offset - self.overscan)
+            end = min(total, offset + self.visible_rows + self.overscan)
+            self.buffer_len = end - self.buffer_start
+            self.listbox.delete(0, tk.END)
+            if self.buffer_len:
+                self.listbox.insert(tk.END, *(self.render(self.rows[i]) for i in range(self.buffer_start, end)))
+        self.listbox.selection_clear(0, tk.END)
+        if self.selected is not None and 0 <= self.selected - self.buffer_start < self.buffer_len:
+            self.listbox.selection_set(self.selected - self.buffer_start)
+        self.listbox.yview(offset - self.buffer_start)
+        if total:
+            self.scrollbar.set(offset / total, min(1.0, (offset + self.visible_rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _on_configure(self, event):
         try:
-            with open(CONTACTS_FILE, 'r') as f:
-                return json.load(f)
-        except json.JSONDecodeError:
-            messagebox.showerror("Load Error", "Could not decode contacts file. Starting fresh.")
-            return []
-    return []
-
-def save_contacts(contacts_list):
-    with open(CONTACTS_FILE, 'w') as f:
-        json.dump(contacts_list, f, indent=4)
-
-def validate_phone(phone):
-    return bool(re.match(r"^[\d\s\-\(\)\+]+$", phone)) if phone else True # Allow empty
-
-def validate_email(email):
-    return bool(re.match(r"[^@]+@[^@]+\.[^@]+", email)) if email else True # Allow empty
-
-# --- Global Variables ---
-contacts = load_contacts()
-selected_contact_original_index = None # Index in the main 'contacts' list
+            line_height = tkfont.Font(font=self.listbox.cget('font')).metrics('linespace') + 1
+        except tk.TclError:
+            return
+        rows = max(1, event.height // line_height)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self._render(self.offset, force=True)
+
+    def _on_listbox_select(self, event):
+        picked = self.listbox.curselection()
+        self.selected = self.buffer_start + picked[0] if picked else None
+
+    def _on_wheel(self, event, step):
+        if step is None:
+            step = -1 * (event.delta // 120 or (1 if event.delta > 0 else -1)) * 3
+        self._render(self.offset + step)
+        return "break" # Keep the inner Listbox from scrolling its buffer on its own
+
+    def _move_selection(self, step):
+        if not len(self.rows):
+            return "break"
+        current = self.selected if self.selected is not None else self.offset - (1 if step > 0 else 0)
+        self.selected = max(0, min(len(self.rows) - 1, current + step))
+        self.see(self.selected)
+        self._render(self.offset)
+        self.listbox.event_generate('<<ListboxSelect>>')
+        return "break"
+
+def contact_display_text(contact):
+    return f"{contact.name} - {contact.phone}"
 
 # --- GUI Functions ---
+@timed('contacts.populate_listbox')
 def populate_listbox(display_list=None):
     """Populates the listbox with contacts.
     If display_list is None, uses the global 'contacts' list."""
     global contacts
     current_list = display_list if display_list is not None else contacts
 
-    listbox_contacts.delete(0, tk.END)
-    for idx, contact in enumerate(current_list):
-        listbox_contacts.insert(tk.END, f"{contact['name']} - {contact['phone']}")
+    # Only the rows in view are rendered; the rest are paged in on scroll
+    listbox_contacts.set_rows(current_list, keep_position=True)
     clear_entry_fields(deselect_listbox=False) # Keep selection if any
 
 def on_contact_select(event):
-    global selected_contact_original_index
-    widget = event.widget
-    selected_indices = widget.curselection()
+    global selected_contact_id
+    selected_indices = listbox_contacts.curselection()
     if not selected_indices:
-        selected_contact_original_index = None
+        selected_contact_id = None
         clear_entry_fields(deselect_listbox=False)
         return
 
-    listbox_index = selected_indices[0]
-    selected_display_text = widget.get(listbox_index)
-
-    # Find the actual contact in the global 'contacts' list
-    # This is important if the listbox is showing filtered results
-    found_contact = None
-    original_idx_temp = -1
-    for idx, c in enumerate(contacts):
-        if f"{c['name']} - {c['phone']}" == selected_display_text:
-            found_contact = c
-            original_idx_temp = idx
-            break
+    # Row -> id -> contact, so filtered lists and look-alike names resolve correctly
+    row = listbox_contacts.row(selected_indices[0])
+    contact_id = row.id if row is not None else None
+    found_contact = contacts.get(contact_id)
 
     if found_contact:
-        selected_contact_original_index = original_idx_temp
-        name_var.set(found_contact['name'])
-        phone_var.set(found_contact['phone'])
-        email_var.set(found_contact['email'])
-        address_var.set(found_contact['address'])
+        selected_contact_id = contact_id
+        name_var.set(found_contact.name)
+        phone_var.set(found_contact.phone)
+        email_var.set(found_contact.email)
+        address_var.set(found_contact.address)
     else:
         # Should not happen if listbox content is derived from 'contacts'
-        selected_contact_original_index = None
+        selected_contact_id = None
         clear_entry_fields(deselect_listbox=False)
 
 
 def clear_entry_fields(deselect_listbox=True):
-    global selected_contact_original_index
+    global selected_contact_id
     name_var.set("")
     phone_var.set("")
     email_var.set("")
     address_var.set("")
-    selected_contact_original_index = None
+    selected_contact_id = None
     if deselect_listbox and listbox_contacts.curselection():
         listbox_contacts.selection_clear(0, tk.END)
 
@@ -96,36 +201,29 @@ def add_contact_gui():
     email = email_var.get().strip()
     address = address_var.get().strip()
 
-    if not name:
-        messagebox.showerror("Validation Error", "Name cannot be empty.")
-        return
-    if not phone:
-        messagebox.showerror("Validation Error", "Phone cannot be empty.")
-        return
-    if not validate_phone(phone):
-        messagebox.showerror("Validation Error", "Invalid phone number format.")
-        return
-    if email and not validate_email(email):
-        messagebox.showerror("Validation Error", "Invalid email format.")
+    new_contact = Contact(None, name, phone, email, address)
+    error = contact_validation_error(new_contact)
+    if error:
+        messagebox.showerror("Validation Error", error)
         return
 
     # Check for duplicate names (optional)
-    if any(c['name'].lower() == name.lower() for c in contacts):
+    if contacts.name_taken(name):
         messagebox.showwarning("Duplicate", f"A contact with the name '{name}' already exists.")
         return
 
-    new_contact = {"name": name, "phone": phone, "email": email, "address": address}
-    contacts.append(new_contact)
-    contacts.sort(key=lambda c: c['name'].lower()) # Keep sorted
-    save_contacts(contacts)
+    new_contact.id = new_contact_id()
+    contacts.add(new_contact) # Inserted in name order
+    persist_add(new_contact, contacts)
+    search_index.add(new_contact)
     populate_listbox()
     messagebox.showinfo("Success", f"Contact '{name}' added successfully.")
     clear_entry_fields()
 
 def update_contact_gui():
-    global contacts, selected_contact_original_index
+    global contacts, selected_contact_id
 
-    if selected_contact_original_index is None or selected_contact_original_index >= len(contacts):
+    if selected_contact_id not in contacts:
         messagebox.showerror("Selection Error", "Please select a contact from the list to update.")
         return
 
@@ -134,51 +232,45 @@ def update_contact_gui():
     email = email_var.get().strip()
     address = address_var.get().strip()
 
-    if not name:
-        messagebox.showerror("Validation Error", "Name cannot be empty.")
-        return
-    if not phone:
-        messagebox.showerror("Validation Error", "Phone cannot be empty.")
-        return
-    if not validate_phone(phone):
-        messagebox.showerror("Validation Error", "Invalid phone number format.")
-        return
-    if email and not validate_email(email):
-        messagebox.showerror("Validation Error", "Invalid email format.")
+    updated_contact = Contact(selected_contact_id, name, phone, email, address)
+    error = contact_validation_error(updated_contact)
+    if error:
+        messagebox.showerror("Validation Error", error)
         return
 
-    # Check for duplicate names if name changed
-    original_name = contacts[selected_contact_original_index]['name']
-    if name.lower() != original_name.lower():
-        if any(c['name'].lower() == name.lower() and i != selected_contact_original_index for i, c in enumerate(contacts)):
-            messagebox.showwarning("Duplicate", f"Another contact with the name '{name}' already exists.")
-            return
+    # Check for duplicate names (renaming to a different case of its own name is fine)
+    original_contact = contacts.get(selected_contact_id)
+    if contacts.name_taken(name, exclude_id=selected_contact_id):
+        messagebox.showwarning("Duplicate", f"Another contact with the name '{name}' already exists.")
+        return
 
-    contacts[selected_contact_original_index] = {
-        "name": name, "phone": phone, "email": email, "address": address
-    }
-    contacts.sort(key=lambda c: c['name'].lower()) # Keep sorted
-    save_contacts(contacts)
+    contacts.replace(updated_contact) # Moves it to its new place in name order
+    persist_update(updated_contact, contacts)
+    search_index.update(original_contact, updated_contact)
     populate_listbox() # This will clear selection, so re-select if possible or clear fields
     messagebox.showinfo("Success", f"Contact '{name}' updated successfully.")
-    clear_entry_fields() # Also clears selected_contact_original_index
+    clear_entry_fields() # Also clears selected_contact_id
 
 def delete_contact_gui():
-    global contacts, selected_contact_original_index
+    global contacts, selected_contact_id
 
-    if selected_contact_original_index is None or selected_contact_original_index >= len(contacts):
+    if selected_contact_id not in contacts:
         messagebox.showerror("Selection Error", "Please select a contact from the list to delete.")
         return
 
-    contact_to_delete = contacts[selected_contact_original_index]
+    contact_to_delete = contacts.get(selected_contact_id)
     confirm = messagebox.askyesno("Confirm Delete",
-                                  f"Are you sure you want to delete '{contact_to_delete['name']}'?")
-    if confirm:
-        contacts.pop(selected_contact_original_index)
-        save_contacts(contacts)
+                                  f"Are you sure you want to delete '{contact_to_delete.name}'?")
+    if confirm and contact_to_delete.id not in contacts: # Deleted by another window while we asked
+        messagebox.showinfo("Delete", f"Contact '{contact_to_delete.name}' was already deleted.")
+        clear_entry_fields()
+    elif confirm:
+        contacts.remove(contact_to_delete.id)
+        persist_delete(contact_to_delete, contacts)
+        search_index.remove(contact_to_delete)
         populate_listbox()
-        messagebox.showinfo("Success", f"Contact '{contact_to_delete['name']}' deleted.")
-        clear_entry_fields() # Also clears selected_contact_original_index
+        messagebox.showinfo("Success", f"Contact '{contact_to_delete.name}' deleted.")
+        clear_entry_fields() # Also clears selected_contact_id
 
 def search_contact_gui():
     global contacts
@@ -191,121 +283,253 @@ def search_contact_gui():
         populate_listbox(contacts) # Show all if search term is empty
         return
 
-    found_contacts = [
-        c for c in contacts
-        if search_term in c['name'].lower() or search_term in c['phone']
-    ]
+    found_contacts = search_index.search(search_term)
 
     if not found_contacts:
         messagebox.showinfo("Search Result", f"No contacts found matching '{search_term}'.")
-        listbox_contacts.delete(0, tk.END) # Clear listbox
+        populate_listbox([]) # Clear listbox
     else:
         populate_listbox(found_contacts)
         messagebox.showinfo("Search Result", f"Found {len(found_contacts)} contact(s).")
-    # Note: selection made from a filtered list needs careful handling for update/delete
-    # The on_contact_select logic now handles finding the original contact.
+    # Rows of a filtered list map straight to contacts through the virtual list
     clear_entry_fields(deselect_listbox=False) # Don't clear listbox selection
 
 def show_all_contacts_gui():
+    filter_var.set("")
     populate_listbox(contacts)
     clear_entry_fields()
 
+FILE_TYPES = [("CSV files", "*.csv"), ("vCard files", "*.vcf *.vcard"), ("All files", "*.*")]
+
+def import_contacts_gui():
+    path = filedialog.askopenfilename(title="Import Contacts", filetypes=FILE_TYPES)
+    if not path:
+        return
+    try:
+        added, duplicates, errors = import_contacts(path, contacts)
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        messagebox.showerror("Import Error", f"Could not import '{path}': {e}")
+        return
+    search_index.add_many(added)
+    populate_listbox()
+    summary = f"Imported {len(added)} contact(s)."
+    if duplicates:
+        summary += f"\nSkipped {duplicates} duplicate name(s)."
+    if errors:
+        summary += f"\nSkipped {len(errors)} invalid record(s)"
+        summary += "".join(f"\n  Record {n}: {msg}" for n, msg in errors[:5])
+        if len(errors) > 5:
+            summary += "\n  ..."
+    messagebox.showinfo("Import Complete", summary)
+
+def export_contacts_gui():
+    path = filedialog.asksaveasfilename(title="Export Contacts", defaultextension=".csv", filetypes=FILE_TYPES)
+    if not path:
+        return
+    try:
+        count = export_contacts(path, contacts)
+    except OSError as e:
+        messagebox.showerror("Export Error", f"Could not export to '{path}': {e}")
+        return
+    messagebox.showinfo("Export Complete", f"Exported {count} contact(s).")
+
+def find_duplicates_gui():
+    groups = find_duplicates(contacts)
+    if not groups:
+        messagebox.showinfo("Find Duplicates", "No likely duplicates found.")
+        return
+    total = sum(len(group) for group in groups)
+    preview = "".join("\n  " + " = ".join(c.name for c in group) for group in groups[:8])
+    if len(groups) > 8:
+        preview += "\n  ..."
+    if not messagebox.askyesno("Find Duplicates",
+                               f"Found {len(groups)} group(s) covering {total} contacts:{preview}\n\n"
+                               "Merge each group into its oldest contact?"):
+        return
+    merged, removed = merge_duplicates(groups, contacts)
+    for old, new in merged:
+        search_index.update(old, new)
+    for contact in removed:
+        search_index.remove(contact)
+    populate_listbox()
+    messagebox.showinfo("Find Duplicates", f"Merged away {len(removed)} duplicate contact(s).")
+
+def on_save_error(error, snapshots):
+    requeue_failed_entries(snapshots)
+    messagebox.showerror("Save Error", f"Could not save contacts: {error}\nChanges will be retried on the next edit.")
+
+def on_close():
+    flush_storage() # Don't lose edits still waiting for the background write
+    sync_watcher.close()
+    root.destroy()
+
+_sync_job = None
+
+def on_storage_changed(paths=()):
+    """Another window (or our own save) changed the data files."""
+    global _sync_job
+    if _sync_job is not None:
+        root.after_cancel(_sync_job)
+        _sync_job = None
+    changed = sync_from_storage()
+    if changed is None:
+        _sync_job = root.after(SYNC_RETRY_MS, on_storage_changed)
+    elif changed:
+        refresh_synced_list()
+
+def on_save_conflict():
+    """Another window saved first ('json' mode): merge its changes, then save ours."""
+    if sync_then_save():
+        refresh_synced_list()
+
+def refresh_synced_list():
+    """Re-renders the visible rows without touching the entry fields."""
+    term = filter_var.get().strip()
+    rows = search_index.search(term, limit=LIVE_SEARCH_LIMIT) if term else contacts
+    listbox_contacts.set_rows(rows, keep_position=True)
+
+_live_search_job = None
+
+def on_filter_changed(*args):
+    """Debounces keystrokes in the filter entry so only the last one queries."""
+    global _live_search_job
+    if _live_search_job is not None:
+        root.after_cancel(_live_search_job)
+    _live_search_job = root.after(LIVE_SEARCH_DELAY_MS, apply_live_filter)
+
+def apply_live_filter():
+    global _live_search_job
+    _live_search_job = None
+    term = filter_var.get().strip()
+    if not term:
+        populate_listbox()
+    else:
+        populate_listbox(search_index.search(term, limit=LIVE_SEARCH_LIMIT))
+
+
+def build_window():
+    """Creates the window and opens the book; main() then runs it."""
+    global root, contacts, search_index, save_worker, sync_watcher
+    global name_var, phone_var, email_var, address_var, filter_var, listbox_contacts
+
+    # --- Main Window Setup ---
+    root = tk.Tk()
+    root.title(f"Tkinter Contact Book - {UNIQUE_CODE}")
+    root.geometry("650x580")
+    root.resizable(False, False)
+    root.protocol("WM_DELETE_WINDOW", on_close)
+    contacts, search_index, save_worker = open_book(
+        root, on_save_error=on_save_error, on_save_conflict=on_save_conflict,
+        on_load_error=lambda message: messagebox.showerror("Load Error", message))
+    sync_watcher = FileWatcher(root, sync_watch_paths(), on_storage_changed)
+
+    # Style
+    style = ttk.Style()
+    style.theme_use('clam') # or 'alt', 'default', 'classic'
 
-# --- Main Window Setup ---
-root = tk.Tk()
-root.title(f"Tkinter Contact Book - {UNIQUE_CODE}")
-root.geometry("650x500")
-root.resizable(False, False)
+    # --- Variables for Entry Fields ---
+    name_var = tk.StringVar()
+    phone_var = tk.StringVar()
+    email_var = tk.StringVar()
+    address_var = tk.StringVar()
+    filter_var = tk.StringVar()
 
-# Style
-style = ttk.Style()
-style.theme_use('clam') # or 'alt', 'default', 'classic'
+    # --- UI Layout ---
 
-# --- Variables for Entry Fields ---
-name_var = tk.StringVar()
-phone_var = tk.StringVar()
-email_var = tk.StringVar()
-address_var = tk.StringVar()
+    # Frame for input fields
+    input_frame = ttk.LabelFrame(root, text="Contact Details", padding=(10, 5))
+    input_frame.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
+    input_frame.columnconfigure(1, weight=1) # Make entry fields expand
 
-# --- UI Layout ---
+    ttk.Label(input_frame, text="Name:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
+    entry_name = ttk.Entry(input_frame, textvariable=name_var, width=40)
+    entry_name.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
 
-# Frame for input fields
-input_frame = ttk.LabelFrame(root, text="Contact Details", padding=(10, 5))
-input_frame.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
-input_frame.columnconfigure(1, weight=1) # Make entry fields expand
+    ttk.Label(input_frame, text="Phone:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
+    entry_phone = ttk.Entry(input_frame, textvariable=phone_var, width=40)
+    entry_phone.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
 
-ttk.Label(input_frame, text="Name:").grid(row=0, column=0, padx=5, pady=5, sticky="w")
-entry_name = ttk.Entry(input_frame, textvariable=name_var, width=40)
-entry_name.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+    ttk.Label(input_frame, text="Email:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
+    entry_email = ttk.Entry(input_frame, textvariable=email_var, width=40)
+    entry_email.grid(row=2, column=1, padx=5, pady=5, sticky="ew")
 
-ttk.Label(input_frame, text="Phone:").grid(row=1, column=0, padx=5, pady=5, sticky="w")
-entry_phone = ttk.Entry(input_frame, textvariable=phone_var, width=40)
-entry_phone.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
+    ttk.Label(input_frame, text="Address:").grid(row=3, column=0, padx=5, pady=5, sticky="w")
+    entry_address = ttk.Entry(input_frame, textvariable=address_var, width=40)
+    entry_address.grid(row=3, column=1, padx=5, pady=5, sticky="ew")
 
-ttk.Label(input_frame, text="Email:").grid(row=2, column=0, padx=5, pady=5, sticky="w")
-entry_email = ttk.Entry(input_frame, textvariable=email_var, width=40)
-entry_email.grid(row=2, column=1, padx=5, pady=5, sticky="ew")
+    # Frame for buttons
+    button_frame = ttk.Frame(root, padding=(10, 10))
+    button_frame.grid(row=1, column=0, padx=10, pady=5, sticky="ew")
+    # Make buttons spread out a bit
+    button_frame.columnconfigure(0, weight=1)
+    button_frame.columnconfigure(1, weight=1)
+    button_frame.columnconfigure(2, weight=1)
+    button_frame.columnconfigure(3, weight=1)
+    button_frame.columnconfigure(4, weight=1)
 
-ttk.Label(input_frame, text="Address:").grid(row=3, column=0, padx=5, pady=5, sticky="w")
-entry_address = ttk.Entry(input_frame, textvariable=address_var, width=40)
-entry_address.grid(row=3, column=1, padx=5, pady=5, sticky="ew")
 
-# Frame for buttons
-button_frame = ttk.Frame(root, padding=(10, 10))
-button_frame.grid(row=1, column=0, padx=10, pady=5, sticky="ew")
-# Make buttons spread out a bit
-button_frame.columnconfigure(0, weight=1)
-button_frame.columnconfigure(1, weight=1)
-button_frame.columnconfigure(2, weight=1)
-button_frame.columnconfigure(3, weight=1)
-button_frame.columnconfigure(4, weight=1)
+    btn_add = ttk.Button(button_frame, text="Add Contact", command=add_contact_gui)
+    btn_add.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
 
+    btn_update = ttk.Button(button_frame, text="Update Contact", command=update_contact_gui)
+    btn_update.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
 
-btn_add = ttk.Button(button_frame, text="Add Contact", command=add_contact_gui)
-btn_add.grid(row=0, column=0, padx=5, pady=5, sticky="ew")
+    btn_delete = ttk.Button(button_frame, text="Delete Contact", command=delete_contact_gui)
+    btn_delete.grid(row=0, column=2, padx=5, pady=5, sticky="ew")
 
-btn_update = ttk.Button(button_frame, text="Update Contact", command=update_contact_gui)
-btn_update.grid(row=0, column=1, padx=5, pady=5, sticky="ew")
+    btn_search = ttk.Button(button_frame, text="Search", command=search_contact_gui)
+    btn_search.grid(row=0, column=3, padx=5, pady=5, sticky="ew")
 
-btn_delete = ttk.Button(button_frame, text="Delete Contact", command=delete_contact_gui)
-btn_delete.grid(row=0, column=2, padx=5, pady=5, sticky="ew")
+    btn_clear = ttk.Button(button_frame, text="Clear Fields", command=clear_entry_fields)
+    btn_clear.grid(row=0, column=4, padx=5, pady=5, sticky="ew")
 
-btn_search = ttk.Button(button_frame, text="Search", command=search_contact_gui)
-btn_search.grid(row=0, column=3, padx=5, pady=5, sticky="ew")
+    btn_import = ttk.Button(button_frame, text="Import...", command=import_contacts_gui)
+    btn_import.grid(row=1, column=0, padx=5, pady=5, sticky="ew")
 
-btn_clear = ttk.Button(button_frame, text="Clear Fields", command=clear_entry_fields)
-btn_clear.grid(row=0, column=4, padx=5, pady=5, sticky="ew")
+    btn_export = ttk.Button(button_frame, text="Export...", command=export_contacts_gui)
+    btn_export.grid(row=1, column=1, padx=5, pady=5, sticky="ew")
 
+    btn_duplicates = ttk.Button(button_frame, text="Find Duplicates", command=find_duplicates_gui)
+    btn_duplicates.grid(row=1, column=2, padx=5, pady=5, sticky="ew")
 
-# Frame for Listbox and "Show All" button
-list_frame = ttk.LabelFrame(root, text="Contact List", padding=(10, 5))
-list_frame.grid(row=2, column=0, padx=10, pady=10, sticky="nsew")
-list_frame.rowconfigure(0, weight=1) # Make listbox expand
-list_frame.columnconfigure(0, weight=1) # Make listbox expand
 
-scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL)
-listbox_contacts = tk.Listbox(list_frame, yscrollcommand=scrollbar.set, height=10, exportselection=False)
-scrollbar.config(command=listbox_contacts.yview)
+    # Frame for Listbox and "Show All" button
+    list_frame = ttk.LabelFrame(root, text="Contact List", padding=(10, 5))
+    list_frame.grid(row=2, column=0, padx=10, pady=10, sticky="nsew")
+    list_frame.rowconfigure(1, weight=1) # Make listbox expand
+    list_frame.columnconfigure(0, weight=1) # Make listbox expand
 
-listbox_contacts.grid(row=0, column=0, sticky="nsew")
-scrollbar.grid(row=0, column=1, sticky="ns")
+    # Live filter (search-as-you-type)
+    filter_frame = ttk.Frame(list_frame)
+    filter_frame.grid(row=0, column=0, columnspan=2, pady=(0, 5), sticky="ew")
+    filter_frame.columnconfigure(1, weight=1)
+    ttk.Label(filter_frame, text="Filter:").grid(row=0, column=0, padx=(0, 5), sticky="w")
+    entry_filter = ttk.Entry(filter_frame, textvariable=filter_var)
+    entry_filter.grid(row=0, column=1, sticky="ew")
+    filter_var.trace_add("write", on_filter_changed)
 
-listbox_contacts.bind('<<ListboxSelect>>', on_contact_select)
+    scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL)
+    listbox_contacts = VirtualListbox(list_frame, scrollbar, contact_display_text, height=10, exportselection=False)
 
-btn_show_all = ttk.Button(list_frame, text="Show All / Refresh", command=show_all_contacts_gui)
-btn_show_all.grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
+    listbox_contacts.grid(row=1, column=0, sticky="nsew")
+    scrollbar.grid(row=1, column=1, sticky="ns")
 
+    listbox_contacts.bind('<<ListboxSelect>>', on_contact_select)
 
-# Configure main window grid to make list_frame expand
-root.rowconfigure(2, weight=1)
-root.columnconfigure(0, weight=1)
+    btn_show_all = ttk.Button(list_frame, text="Show All / Refresh", command=show_all_contacts_gui)
+    btn_show_all.grid(row=2, column=0, columnspan=2, padx=5, pady=5, sticky="ew")
 
-# --- Initial Population ---
-contacts.sort(key=lambda c: c['name'].lower()) # Sort initially
-populate_listbox()
 
-# --- Start GUI ---
-if __name__ == "__main__":
+    # Configure main window grid to make list_frame expand
+    root.rowconfigure(2, weight=1)
+    root.columnconfigure(0, weight=1)
+
+    # --- Initial Population ---
+    populate_listbox()
+
+def main():
+    build_window()
+
     # Simple check for unique code (more for prompt adherence)
     try:
         with open(__file__, 'r') as f_script:
@@ -313,7 +537,12 @@ if __name__ == "__main__":
         if UNIQUE_CODE not in script_content:
             messagebox.showerror("Integrity Check", "Unique code missing from script!")
             root.destroy() # Or exit()
+            return
     except Exception as e:
         print(f"Could not perform unique code check: {e}") # Non-fatal for running
 
-    root.mainloop()
\ No newline at end of file
+    # --- Start GUI ---
+    root.mainloop()
+
+if __name__ == "__main__":
+    main()
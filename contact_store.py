@@ -0,0 +1,1561 @@
+import bisect
+import csv
+import difflib
+import hashlib
+import itertools
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import time
+from array import array
+from collections import defaultdict, deque
+from save_worker import SaveWorker, file_lock
+from record_codecs import decode, read_records, write_records
+from file_watcher import file_digest
+from instrumentation import count_bytes, timed
+
+# --- Contact Store ---
+# Everything the contact book does short of drawing windows: storage, live
+# sync, search, import/export and duplicate detection. Nothing here imports
+# tkinter, so scripts and batch jobs can use it directly (see open_book()
+# and the command line at the bottom); "contact book.py" is the window.
+
+CONTACTS_FILE = "contacts_data.json"
+
+# --- Storage Settings ---
+# 'journal' appends one record per edit and compacts in the background,
+# 'sqlite' keeps the book in an indexed SQLite database,
+# 'json' rewrites the whole file on every edit (the original behaviour).
+STORAGE_MODE = os.environ.get("CONTACTBOOK_STORAGE", "journal")
+CONTACTS_JOURNAL_FILE = "contacts_data.journal"
+CONTACTS_DB_FILE = "contacts_data.db"
+JOURNAL_COMPACT_BYTES = 1024 * 1024 # Compact once the journal passes ~1 MB
+
+# --- Data Handling (similar to console version) ---
+def _name_key(name):
+    """Names are compared ignoring case: casefold(), not lower(), so 'STRASSE'
+    and 'Straße' are one name, as are 'ΣΑΣ' and 'σας'."""
+    return name.casefold()
+
+def normalize_phone(phone):
+    """Reduces a phone number to its digits (keeping a leading '+') for lookups."""
+    digits = re.sub(r"\D", "", phone)
+    return "+" + digits if phone.strip().startswith("+") else digits
+
+# --- Contact Records ---
+class Contact:
+    """One contact. Slots instead of a per-record dict: 100,000 contacts take
+    about 31 MB as Contacts against 42 MB as dicts, and 36 MB once the
+    ContactList holds them. Contacts are never changed after creation: an
+    edit swaps in a new Contact, so snapshots can share them safely."""
+    __slots__ = ('id', 'name', 'phone', 'email', 'address')
+
+    def __init__(self, id, name, phone, email="", address=""):
+        self.id = id
+        self.name = name
+        self.phone = phone
+        self.email = email
+        self.address = address
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('id'), data['name'], data['phone'], data.get('email', ''), data.get('address', ''))
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.name, "phone": self.phone,
+                "email": self.email, "address": self.address}
+
+    def __eq__(self, other):
+        return isinstance(other, Contact) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"Contact({self.id!r}, {self.name!r}, {self.phone!r}, {self.email!r}, {self.address!r})"
+
+# --- Contact IDs ---
+# IDs must not clash between windows, scripts and the server adding to the
+# same book at once, so they are not counted per process: the top bits are
+# the time in milliseconds (IDs still sort oldest first, which duplicate
+# merging relies on) and the low 20 bits are random. They fit SQLite's
+# INTEGER and the 'q' arrays of the search index until the year 2248.
+_CONTACT_ID_RANDOM_BITS = 20
+_contact_id_lock = threading.Lock()
+_last_contact_id = 0
+
+def new_contact_id():
+    global _last_contact_id
+    contact_id = (time.time_ns() // 1_000_000) << _CONTACT_ID_RANDOM_BITS | secrets.randbits(_CONTACT_ID_RANDOM_BITS)
+    with _contact_id_lock:
+        # Still increasing within one process, e.g. for a batch in the same millisecond
+        contact_id = _last_contact_id = max(contact_id, _last_contact_id + 1)
+    return contact_id
+
+def assign_contact_ids(contacts_list):
+    """Gives every contact a persistent integer 'id'.
+    Returns True if any contact had none (data written before IDs existed)."""
+    missing = False
+    for contact in contacts_list:
+        if 'id' not in contact:
+            contact['id'] = new_contact_id()
+            missing = True
+    return missing
+
+def _apply_journal_entry(book, entry):
+    """Applies one journal record to 'book' (a dict of contact id -> contact).
+    Every record carries the full contact, so replaying is idempotent.
+    Returns True if the record predates contact IDs."""
+    op = entry.get('op')
+    legacy = 'key' in entry or ('contact' in entry and 'id' not in entry['contact'])
+    contact_id = entry.get('id')
+    if 'key' in entry: # Old records were keyed by lower-cased name
+        contact_id = next((i for i, c in book.items() if c['name'].lower() == entry['key']), None)
+    if op in ('add', 'update'):
+        contact = entry['contact']
+        if 'id' not in contact:
+            contact['id'] = contact_id if contact_id is not None else new_contact_id()
+        if op == 'update' and contact_id is not None:
+            book.pop(contact_id, None)
+        book[contact['id']] = contact
+    elif op == 'delete' and contact_id is not None:
+        book.pop(contact_id, None)
+    return legacy
+
+def _replay_journal(book, path):
+    """Replays one journal file into 'book'. Returns True if it held pre-ID records."""
+    legacy = False
+    if not os.path.exists(path):
+        return legacy
+    size = 0
+    with open(path, 'r') as f:
+        for line in f:
+            size += len(line) # Records are ASCII (json.dumps escapes the rest)
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line from a crash mid-append; everything before it is good
+                print(f"Warning: Skipping damaged record in {path}")
+                break
+            legacy = _apply_journal_entry(book, entry) or legacy
+    count_bytes('read', path, size)
+    return legacy
+
+@timed('contacts.load')
+def load_contacts(on_error=None):
+    """Reads the whole book from storage. A snapshot file that can't be decoded
+    is reported through on_error(message) (default: a printed warning) and
+    treated as empty."""
+    if STORAGE_MODE == 'sqlite':
+        return list(SqliteContactList())
+    snapshot, digest = [], None
+    if os.path.exists(CONTACTS_FILE):
+        try:
+            digest, data = _read_json_file() # The digest is of the very bytes decoded
+            snapshot = decode(data)
+        except ValueError:
+            message = "Could not decode contacts file. Starting fresh."
+            if on_error is not None:
+                on_error(message)
+            else:
+                print(f"Warning: {message}")
+            snapshot = []
+    needs_migration = assign_contact_ids(snapshot)
+    if STORAGE_MODE != 'journal':
+        contacts_list = [Contact.from_dict(c) for c in snapshot]
+        if needs_migration:
+            digest = save_contacts(contacts_list)
+        _note_json_state(contacts_list, digest)
+        return contacts_list
+
+    book = {c['id']: c for c in snapshot}
+    position = _journal_end()
+    # A leftover '.old' journal means a compaction did not finish; replay it first
+    needs_migration = _replay_journal(book, CONTACTS_JOURNAL_FILE + ".old") or needs_migration
+    needs_migration = _replay_journal(book, CONTACTS_JOURNAL_FILE) or needs_migration
+    contacts_list = [Contact.from_dict(c) for c in book.values()]
+    if needs_migration:
+        # Persist the newly assigned IDs once so they stay stable across sessions
+        with file_lock(CONTACTS_JOURNAL_FILE):
+            save_contacts(contacts_list)
+            for path in (CONTACTS_JOURNAL_FILE + ".old", CONTACTS_JOURNAL_FILE):
+                if os.path.exists(path):
+                    os.remove(path)
+            position = _journal_end()
+    _set_journal_position(position)
+    return contacts_list
+
+@timed('contacts.save')
+def save_contacts(contacts_list):
+    """Writes a full snapshot of the book (used directly in 'json' mode and by
+    compaction). Returns the digest of what was written."""
+    # Atomic, so a crash never leaves half a file
+    return write_records(CONTACTS_FILE, [c.to_dict() for c in contacts_list])
+
+# --- Journal (append-only storage) ---
+# Appends, rotation and compaction all hold file_lock(CONTACTS_JOURNAL_FILE),
+# so no window appends to a journal another is rotating or folding in, nor
+# takes a '.old' journal that is being compacted for a failed compaction.
+# Take it before _journal_lock.
+_journal_lock = threading.Lock()
+_compaction_thread = None
+
+@timed('contacts.journal_append')
+def _append_journal(*entries):
+    global _journal_position
+    data = "".join(json.dumps(entry) + "\n" for entry in entries)
+    if not data:
+        return
+    with file_lock(CONTACTS_JOURNAL_FILE), _journal_lock:
+        with open(CONTACTS_JOURNAL_FILE, 'a') as f:
+            start = os.fstat(f.fileno()).st_size
+            f.write(data) # One write, even for a batch
+            f.flush()
+            st = os.fstat(f.fileno())
+        count_bytes('written', CONTACTS_JOURNAL_FILE, len(data))
+        # If live sync had read up to our records, it needn't read them back
+        if _journal_position in ((st.st_ino, start), (None, start)) and st.st_size == start + len(data):
+            _journal_position = (st.st_ino, st.st_size)
+
+def _compact_worker():
+    # Built from the files, not from this window's book: other windows may have
+    # appended records to the rotated journal that we have not synced yet
+    old_path = CONTACTS_JOURNAL_FILE + ".old"
+    with file_lock(CONTACTS_JOURNAL_FILE):
+        if not os.path.exists(old_path):
+            return # Another window's compaction folded it in first
+        try:
+            snapshot = read_records(CONTACTS_FILE) if os.path.exists(CONTACTS_FILE) else []
+            assign_contact_ids(snapshot)
+            book = {c['id']: c for c in snapshot}
+            _replay_journal(book, old_path)
+            write_records(CONTACTS_FILE, list(book.values()))
+            os.remove(old_path)
+        except (OSError, ValueError) as e:
+            # The '.old' journal stays on disk and is replayed/retried next time
+            print(f"Warning: Journal compaction failed - {e}")
+
+def compact_journal_async():
+    """Folds the journal into the snapshot file on a background thread.
+    The live journal is rotated to '.old' first so new edits keep appending.
+    Skipped (until a later edit) while another window holds the journal lock."""
+    global _compaction_thread, _journal_position
+    old_path = CONTACTS_JOURNAL_FILE + ".old"
+    with file_lock(CONTACTS_JOURNAL_FILE, blocking=False) as locked, _journal_lock:
+        if not locked:
+            return
+        if _compaction_thread is not None and _compaction_thread.is_alive():
+            return
+        if not os.path.exists(CONTACTS_JOURNAL_FILE):
+            return
+        unsynced = _read_journal_from(*_journal_position)
+        if unsynced is not None:
+            # Live sync had read this journal up to here: keep what other windows
+            # appended since for it, and read the next journal from its start
+            # instead of taking our own rotation for another window's
+            _rotated_entries.extend(unsynced)
+            _journal_position = (None, 0)
+        if os.path.exists(old_path):
+            # Left over from a failed compaction: carry the new records along with it
+            with open(CONTACTS_JOURNAL_FILE, 'r') as src, open(old_path, 'a') as dst:
+                dst.write(src.read())
+            os.remove(CONTACTS_JOURNAL_FILE)
+        else:
+            os.replace(CONTACTS_JOURNAL_FILE, old_path)
+        _compaction_thread = threading.Thread(target=_compact_worker, daemon=True)
+        _compaction_thread.start()
+
+def maybe_compact_journal():
+    try:
+        if os.path.getsize(CONTACTS_JOURNAL_FILE) >= JOURNAL_COMPACT_BYTES:
+            compact_journal_async()
+    except OSError:
+        pass # No journal yet
+
+# --- SQLite Storage ---
+# In 'sqlite' mode the table is the book: SqliteContactList and
+# SqliteContactSearch answer from it, so opening the book reads nothing up
+# front. Edits are only committed by the save worker, on a connection of
+# its own, so the Tk thread never waits for another window's write lock.
+# Until then they sit in the temp.unsaved table of the reading connection
+# (a deleted contact as a row with a NULL name), which every read lays over
+# the contacts table; rows leave it once the worker has committed them.
+_db = None
+_db_lock = threading.RLock() # Guards the reading connection; scripts hand saves back on the worker
+_writer_db = None # The save worker's connection
+_sqlite_unsaved = [] # ('put', contacts) / ('delete', contact id) ops not yet handed to the worker
+_sqlite_overlay = {} # id -> Contact (or None if deleted) for every edit in temp.unsaved
+_DB_SCHEMA_VERSION = 3
+SQLITE_PAGE_SIZE = 256 # Rows fetched at a time for the list view
+PHONE_SEARCH_DIGITS = 3 # Shorter numbers are searched as word prefixes, like any short term
+
+def _search_key(contact):
+    """Every field and word ContactSearchIndex would match, each after a newline."""
+    fields = ContactSearchIndex._field_values(contact)
+    return "".join("\n" + word for word in sorted(ContactSearchIndex._word_set(fields)))
+
+def _contact_row(contact):
+    return (contact.id, contact.name, contact.phone, contact.email, contact.address,
+            _name_key(contact.name), normalize_phone(contact.phone), _search_key(contact))
+
+_INSERT_CONTACT_SQL = ("INSERT OR REPLACE INTO contacts (id, name, phone, email, address, name_key, phone_key, search_key) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+_STAGE_CONTACT_SQL = _INSERT_CONTACT_SQL.replace("INTO contacts", "INTO temp.unsaved")
+
+def _upgrade_db(db):
+    """Brings a database made by an older version up to date."""
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    if version >= _DB_SCHEMA_VERSION:
+        return
+    columns = {row[1] for row in db.execute("PRAGMA table_info(contacts)")}
+    with db:
+        if version < 1:
+            # Names were once unique ignoring case, which made imports drop contacts
+            # that differed only in case; the other storage modes allow them
+            db.execute("DROP INDEX IF EXISTS idx_contacts_name_key")
+            if 'search_key' not in columns:
+                db.execute("ALTER TABLE contacts ADD COLUMN search_key TEXT NOT NULL DEFAULT ''")
+                rows = db.execute(f"SELECT {_CONTACT_COLUMNS} FROM contacts").fetchall()
+                db.executemany("UPDATE contacts SET search_key = ? WHERE id = ?",
+                               ((_search_key(contact), contact.id) for contact in _rows_to_contacts(rows)))
+            # Name order for the view, and search_key so searches never leave the index
+            db.execute("CREATE INDEX IF NOT EXISTS idx_contacts_name ON contacts(name_key, id, search_key)")
+        if version < 2:
+            # Phone searches are a range over the normalized phone (see SqliteContactSearch)
+            db.execute("DROP INDEX IF EXISTS idx_contacts_phone_key")
+            db.execute("CREATE INDEX IF NOT EXISTS idx_contacts_phone ON contacts(phone_key, id)")
+        if version < 3:
+            # name_key was lower() before names were compared with casefold()
+            rows = db.execute("SELECT id, name, name_key FROM contacts").fetchall()
+            db.executemany("UPDATE contacts SET name_key = ? WHERE id = ?",
+                           ((_name_key(name), contact_id) for contact_id, name, name_key in rows
+                            if _name_key(name) != name_key))
+        db.execute(f"PRAGMA user_version = {_DB_SCHEMA_VERSION}")
+
+def _import_legacy_json(db):
+    try:
+        legacy = read_records(CONTACTS_FILE)
+        assign_contact_ids(legacy)
+        legacy_contacts = [Contact.from_dict(c) for c in legacy]
+        with db:
+            db.executemany(_INSERT_CONTACT_SQL, map(_contact_row, legacy_contacts))
+    except (ValueError, OSError) as e:
+        print(f"Warning: Could not import {CONTACTS_FILE} - {e}")
+        return
+    names = defaultdict(int)
+    for contact in legacy_contacts:
+        names[_name_key(contact.name)] += 1
+    shared = sum(n for n in names.values() if n > 1)
+    if shared:
+        print(f"Warning: {shared} contacts in {CONTACTS_FILE} share a name with another (ignoring case); "
+              "all of them were imported")
+
+def get_db():
+    """Opens (and on first use creates) the contacts database.
+    An existing contacts_data.json is imported the first time."""
+    global _db
+    if _db is not None:
+        return _db
+    _db = sqlite3.connect(CONTACTS_DB_FILE, check_same_thread=False)
+    _db.execute("PRAGMA journal_mode = WAL") # Other windows keep reading while one commits
+    _db.execute("PRAGMA synchronous = NORMAL") # No fsync per commit; still safe against crashes in WAL mode
+    _db.executescript("""
+        CREATE TABLE IF NOT EXISTS contacts (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            email TEXT NOT NULL DEFAULT '',
+            address TEXT NOT NULL DEFAULT '',
+            name_key TEXT NOT NULL,
+            phone_key TEXT NOT NULL
+        );
+    """)
+    _upgrade_db(_db)
+    is_empty = _db.execute("SELECT 1 FROM contacts LIMIT 1").fetchone() is None
+    if is_empty and os.path.exists(CONTACTS_FILE):
+        _import_legacy_json(_db)
+    _db.execute("PRAGMA temp_store = MEMORY")
+    _db.execute("CREATE TEMP TABLE unsaved (id INTEGER PRIMARY KEY, name TEXT, phone TEXT, email TEXT, "
+                "address TEXT, name_key TEXT, phone_key TEXT, search_key TEXT)")
+    return _db
+
+def _rows_to_contacts(rows):
+    return [Contact(*r) for r in rows]
+
+def _query(sql, params=()):
+    with _db_lock:
+        return get_db().execute(sql, params).fetchall()
+
+_CONTACT_COLUMNS = "id, name, phone, email, address"
+_NAME_ORDER = "ORDER BY name_key, id" # The same order as ContactList
+
+def _book_query(where="1", params=(), tail="", tail_params=(), index=""):
+    """Contacts from the book as this window sees it: the contacts table with
+    temp.unsaved laid over it. 'where' filters both; 'tail' (ORDER BY/LIMIT)
+    applies to the result, and may order by name_key and id."""
+    if not _sqlite_overlay:
+        rows = _query(f"SELECT {_CONTACT_COLUMNS}, name_key FROM contacts {index} WHERE {where} {tail}",
+                      (*params, *tail_params))
+    else:
+        rows = _query(f"SELECT {_CONTACT_COLUMNS}, name_key FROM contacts {index} WHERE {where} "
+                      f"AND id NOT IN (SELECT id FROM temp.unsaved) UNION ALL "
+                      f"SELECT {_CONTACT_COLUMNS}, name_key FROM temp.unsaved WHERE {where} AND name IS NOT NULL {tail}",
+                      (*params, *params, *tail_params))
+    return [Contact(*row[:5]) for row in rows]
+
+def _sqlite_stage(op, arg):
+    """Tk thread: lays one edit over the table and queues it for the save worker."""
+    with _db_lock:
+        db = get_db()
+        with db:
+            if op == 'put':
+                db.executemany(_STAGE_CONTACT_SQL, map(_contact_row, arg))
+            else:
+                db.execute("INSERT OR REPLACE INTO temp.unsaved (id) VALUES (?)", (arg,))
+        if op == 'put':
+            _sqlite_overlay.update((contact.id, contact) for contact in arg)
+        else:
+            _sqlite_overlay[arg] = None
+    _sqlite_unsaved.append((op, arg))
+
+@timed('contacts.sqlite_commit')
+def _sqlite_commit(ops):
+    """Save worker thread: applies ops in one transaction (rolled back if any fails)."""
+    global _writer_db
+    if _writer_db is None:
+        _writer_db = sqlite3.connect(CONTACTS_DB_FILE, check_same_thread=False)
+        _writer_db.execute("PRAGMA synchronous = NORMAL")
+    with _writer_db:
+        for op, arg in ops:
+            if op == 'put':
+                _writer_db.executemany(_INSERT_CONTACT_SQL, map(_contact_row, arg))
+            else:
+                _writer_db.execute("DELETE FROM contacts WHERE id = ?", (arg,))
+
+def _sqlite_committed(ops):
+    """Tk thread: drops the edits the worker committed from temp.unsaved,
+    unless a later edit to the same contact is still waiting."""
+    done = []
+    for op, arg in ops:
+        if op == 'put':
+            done += [contact.id for contact in arg if _sqlite_overlay.get(contact.id, False) is contact]
+        elif arg in _sqlite_overlay and _sqlite_overlay[arg] is None:
+            done.append(arg)
+    with _db_lock:
+        db = get_db()
+        with db:
+            db.executemany("DELETE FROM temp.unsaved WHERE id = ?", ((contact_id,) for contact_id in done))
+        for contact_id in done:
+            _sqlite_overlay.pop(contact_id, None)
+    if contacts is not None:
+        contacts.reload()
+
+class SqliteContactList:
+    """The ContactList interface answered from the contacts table, with the
+    edits not yet committed laid over it (see _book_query).
+
+    Only what is asked for is read: the count and pages of SQLITE_PAGE_SIZE
+    rows are cached until the next edit or sync, iteration walks the
+    (name_key, id) index a page at a time, and name lookups use it too."""
+
+    def __init__(self):
+        self._count = None
+        self._pages = {} # page number -> contacts
+
+    def reload(self):
+        """Forgets cached rows, e.g. after another window committed."""
+        self._count = None
+        self._pages.clear()
+
+    def __len__(self):
+        if self._count is None:
+            self._count = _query("SELECT (SELECT COUNT(*) FROM contacts) "
+                                 "- (SELECT COUNT(*) FROM contacts WHERE id IN (SELECT id FROM temp.unsaved)) "
+                                 "+ (SELECT COUNT(*) FROM temp.unsaved WHERE name IS NOT NULL)")[0][0]
+        return self._count
+
+    def __iter__(self):
+        after = ("", -1 << 63)
+        while True:
+            page = _book_query("(name_key, id) > (?, ?)", after, f"{_NAME_ORDER} LIMIT ?", (SQLITE_PAGE_SIZE,))
+            yield from page
+            if len(page) < SQLITE_PAGE_SIZE:
+                return
+            after = _order_key(page[-1])
+
+    def _page(self, number):
+        page = self._pages.get(number)
+        if page is None:
+            if len(self._pages) >= 64: # Scrolled far: keep memory flat
+                self._pages.clear()
+            if not _sqlite_overlay:
+                page = _book_query(tail=f"{_NAME_ORDER} LIMIT ? OFFSET ?",
+                                   tail_params=(SQLITE_PAGE_SIZE, number * SQLITE_PAGE_SIZE))
+            else:
+                # Skip to the page on the (name_key, id) index alone, then read its rows from there
+                first = _query("SELECT name_key, id FROM contacts WHERE id NOT IN (SELECT id FROM temp.unsaved) "
+                               "UNION ALL SELECT name_key, id FROM temp.unsaved WHERE name IS NOT NULL "
+                               f"{_NAME_ORDER} LIMIT 1 OFFSET ?", (number * SQLITE_PAGE_SIZE,))
+                page = _book_query("(name_key, id) >= (?, ?)", first[0], f"{_NAME_ORDER} LIMIT ?",
+                                   (SQLITE_PAGE_SIZE,)) if first else []
+            self._pages[number] = page
+        return page
+
+    def __getitem__(self, position):
+        """The contact at 'position' in name order (slices return a list)."""
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        page = self._page(position // SQLITE_PAGE_SIZE) if position >= 0 else []
+        if position % SQLITE_PAGE_SIZE >= len(page):
+            raise IndexError("contact index out of range")
+        return page[position % SQLITE_PAGE_SIZE]
+
+    def __contains__(self, contact_id):
+        return self.get(contact_id) is not None
+
+    def get(self, contact_id):
+        if contact_id in _sqlite_overlay:
+            return _sqlite_overlay[contact_id]
+        rows = _query(f"SELECT {_CONTACT_COLUMNS} FROM contacts WHERE id = ?", (contact_id,))
+        return Contact(*rows[0]) if rows else None
+
+    def find_by_name(self, name):
+        found = _book_query("name_key = ?", (_name_key(name),), "ORDER BY id LIMIT 1")
+        return found[0] if found else None
+
+    def name_taken(self, name, exclude_id=None):
+        return bool(_book_query("name_key = ? AND id IS NOT ?", (_name_key(name), exclude_id), "LIMIT 1"))
+
+    def position(self, contact_id):
+        """Index of a contact in name order, or None if it is not in the book."""
+        contact = self.get(contact_id)
+        if contact is None:
+            return None
+        before = _order_key(contact)
+        return _query("SELECT (SELECT COUNT(*) FROM contacts WHERE (name_key, id) < (?, ?)) "
+                      "- (SELECT COUNT(*) FROM contacts WHERE (name_key, id) < (?, ?) AND id IN (SELECT id FROM temp.unsaved)) "
+                      "+ (SELECT COUNT(*) FROM temp.unsaved WHERE (name_key, id) < (?, ?) AND name IS NOT NULL)",
+                      before * 3)[0][0]
+
+    def add(self, contact):
+        self.add_many([contact])
+
+    def add_many(self, new_contacts):
+        _sqlite_stage('put', list(new_contacts))
+        self.reload()
+
+    def remove(self, contact_id):
+        contact = self.get(contact_id)
+        if contact is None:
+            raise KeyError(contact_id)
+        _sqlite_stage('delete', contact_id)
+        self.reload()
+        return contact
+
+    def replace(self, contact):
+        """Swaps in a new version of an existing contact (matched by id)."""
+        self.add(contact)
+
+class SqliteContactSearch:
+    """ContactSearchIndex.search() answered from the contacts table.
+
+    Each row's search_key holds the fields and words the index would match,
+    each after a newline, so a substring is an instr() and a word prefix is
+    an instr() of newline + prefix. The name index holds search_key too, so
+    a search is one pass along it in name order that stops at 'limit': a
+    term matching many contacts returns early, and a rare one reads the
+    index only (about 50 ms at 200,000 contacts). A phone number of at least
+    PHONE_SEARCH_DIGITS digits is instead looked up as a prefix of the
+    normalized phone, a range over idx_contacts_phone. Edits need no
+    upkeep: the table is already current."""
+
+    def add(self, contact):
+        pass
+
+    def add_many(self, new_contacts):
+        pass
+
+    def remove(self, contact):
+        pass
+
+    def update(self, old_contact, new_contact):
+        pass
+
+    @timed('contacts.search')
+    def search(self, term, limit=None):
+        """Returns contacts (sorted by name) matching 'term', like ContactSearchIndex.search()."""
+        term = term.strip().lower()
+        if not term:
+            return []
+        phone_term = normalize_phone(term)
+        if validate_phone(term) and len(phone_term.lstrip("+")) >= PHONE_SEARCH_DIGITS:
+            end = phone_term[:-1] + chr(ord(phone_term[-1]) + 1) # First key past the prefix
+            return _book_query("phone_key >= ? AND phone_key < ?", (phone_term, end), f"{_NAME_ORDER} LIMIT ?",
+                               (-1 if limit is None else limit,), "INDEXED BY idx_contacts_phone")
+        terms = {term}
+        if phone_term and phone_term != term and validate_phone(term):
+            terms.add(phone_term)
+        needles = [t if len(t) >= 3 else "\n" + t for t in terms]
+        where = " OR ".join(["instr(search_key, ?) > 0"] * len(needles))
+        return _book_query(f"({where})", needles, f"{_NAME_ORDER} LIMIT ?", (-1 if limit is None else limit,),
+                           "INDEXED BY idx_contacts_name")
+
+# --- Background Saving ---
+# Edits only queue records here; the save worker writes them off the Tk thread
+# (in 'sqlite' mode SqliteContactList queues them, see SQLite Storage).
+_pending_entries = []
+_pending_source = None # The collection to snapshot in 'json' mode
+
+def take_storage_snapshot():
+    """Runs on the Tk (or calling) thread when a save is dispatched: hands over the queued
+    journal records or SQLite edits, or a full snapshot of the book in 'json' mode."""
+    global _pending_entries, _sqlite_unsaved
+    if STORAGE_MODE == 'sqlite':
+        ops, _sqlite_unsaved = _sqlite_unsaved, []
+        return ops
+    if STORAGE_MODE != 'journal':
+        # Contacts are never changed in place, so a shallow copy is a stable snapshot.
+        # It remembers which version of the file it was based on (see Live Sync).
+        return (_json_digest, list(_pending_source))
+    entries, _pending_entries = _pending_entries, []
+    return entries
+
+def write_storage(snapshots):
+    """Runs on the save worker thread with every snapshot taken since the last write."""
+    if STORAGE_MODE == 'journal':
+        _append_journal(*itertools.chain.from_iterable(snapshots))
+    elif STORAGE_MODE == 'sqlite':
+        ops = list(itertools.chain.from_iterable(snapshots))
+        _sqlite_commit(ops)
+        save_worker.hand_back(_sqlite_committed, ops)
+    else:
+        _write_json_snapshot(*snapshots[-1]) # Older full snapshots are superseded
+
+def _write_json_snapshot(base_digest, snapshot):
+    global _json_save_deferred
+    # The file lock keeps other windows from saving between our check and our write
+    with file_lock(CONTACTS_FILE), _json_lock:
+        if file_digest(CONTACTS_FILE) != base_digest:
+            # Another window saved since this snapshot's view of the file: merge first
+            _json_save_deferred = True
+            if _on_save_conflict is not None:
+                save_worker.hand_back(_on_save_conflict)
+            return
+        _note_json_state(snapshot, save_contacts(snapshot))
+
+def requeue_failed_entries(snapshots):
+    """Puts records from a failed write back in front of the queue (Tk thread)
+    so they go out with the next save instead of being lost."""
+    global _pending_entries, _sqlite_unsaved
+    if STORAGE_MODE == 'journal':
+        _pending_entries = list(itertools.chain.from_iterable(snapshots)) + _pending_entries
+    elif STORAGE_MODE == 'sqlite':
+        _sqlite_unsaved = list(itertools.chain.from_iterable(snapshots)) + _sqlite_unsaved
+
+def _record(entries, contacts_list):
+    global _pending_source
+    if STORAGE_MODE == 'journal':
+        _pending_entries.extend(entries)
+        maybe_compact_journal()
+    elif STORAGE_MODE != 'sqlite': # SqliteContactList queued the edit itself
+        _pending_source = contacts_list
+    save_worker.mark_dirty()
+
+def persist_add(contact, contacts_list):
+    _record([{"op": "add", "contact": contact.to_dict()}], contacts_list)
+
+def persist_add_many(new_contacts, contacts_list):
+    """Stores a batch of new contacts with a single storage write."""
+    if new_contacts:
+        _record([{"op": "add", "contact": c.to_dict()} for c in new_contacts], contacts_list)
+
+def persist_update(contact, contacts_list):
+    _record([{"op": "update", "id": contact.id, "contact": contact.to_dict()}], contacts_list)
+
+def persist_delete(contact, contacts_list):
+    _record([{"op": "delete", "id": contact.id}], contacts_list)
+
+def persist_changes(contacts_list, updated=(), deleted=()):
+    """Stores a batch of updates and deletes with a single storage write."""
+    entries = [{"op": "update", "id": c.id, "contact": c.to_dict()} for c in updated]
+    entries += [{"op": "delete", "id": c.id} for c in deleted]
+    if entries:
+        _record(entries, contacts_list)
+
+# --- Live Sync ---
+# Other windows on the same files are merged in as they save. In 'journal'
+# mode only the records appended since we last looked are read; a rotated
+# journal or replaced snapshot (compaction) falls back to a full reload.
+# 'sqlite' drops its cached rows when PRAGMA data_version says another
+# connection committed. Both only run once our own edits are on disk, so
+# ours land first and replaying the file leaves us with exactly what it holds. 'json' rewrites
+# the whole file, so it does a three-way merge against the file as we last
+# knew it, and a save that would overwrite another window's changes waits
+# for them to be merged in first.
+_journal_position = (None, 0) # (inode, bytes read) of the live journal; inode None: read it from the start
+_rotated_entries = [] # Records read from a journal this window rotated, not yet synced
+_json_lock = threading.Lock()
+_json_digest = None # Hash of contacts_data.json as we last read or wrote it
+_json_base = {} # id -> Contact, what that file held
+_json_save_deferred = False
+_db_data_version = None
+
+def _journal_end():
+    try:
+        st = os.stat(CONTACTS_JOURNAL_FILE)
+    except OSError:
+        return (None, 0)
+    return (st.st_ino, st.st_size)
+
+def _set_journal_position(position):
+    global _journal_position
+    with _journal_lock:
+        _journal_position = position
+        _rotated_entries.clear() # The full load that found 'position' read them
+
+def _note_json_state(contacts_list, digest):
+    global _json_digest, _json_base
+    _json_digest = digest
+    _json_base = {c.id: c for c in contacts_list}
+
+def sync_watch_paths():
+    if STORAGE_MODE == 'journal':
+        return [CONTACTS_JOURNAL_FILE, CONTACTS_FILE]
+    if STORAGE_MODE == 'sqlite':
+        return [CONTACTS_DB_FILE, CONTACTS_DB_FILE + "-wal"] # Commits land in the WAL file first
+    return [CONTACTS_FILE]
+
+def _read_journal_from(inode, offset):
+    """Parses the complete records of the live journal past 'offset', or
+    returns None if it is not the journal with 'inode' (rotated since).
+    Call with _journal_lock held."""
+    global _journal_position
+    try:
+        st = os.stat(CONTACTS_JOURNAL_FILE)
+    except OSError:
+        return [] if inode is None else None
+    if inode is not None and (st.st_ino != inode or st.st_size < offset):
+        return None
+    with open(CONTACTS_JOURNAL_FILE, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    count_bytes('read', CONTACTS_JOURNAL_FILE, len(data))
+    complete = data.rfind(b"\n") + 1 # A record still being appended is left for next time
+    _journal_position = (st.st_ino, offset + complete)
+    entries = []
+    for line in data[:complete].splitlines():
+        try:
+            entries.append(json.loads(line))
+        except json.JSONDecodeError:
+            print(f"Warning: Skipping damaged record in {CONTACTS_JOURNAL_FILE}")
+    return entries
+
+def read_journal_tail():
+    """Returns the journal records appended since the last call, or None when
+    another window rotated or truncated the journal and a full reload is needed."""
+    global _journal_position
+    with _journal_lock:
+        entries = _read_journal_from(*_journal_position)
+        if entries is None:
+            _journal_position = (None, 0)
+            _rotated_entries.clear()
+            return None
+        entries[:0] = _rotated_entries
+        _rotated_entries.clear()
+        return entries
+
+def _sync_add(contact):
+    old = contacts.get(contact.id)
+    if old == contact:
+        return 0
+    if old is None:
+        contacts.add(contact)
+        search_index.add(contact)
+    else:
+        contacts.replace(contact)
+        search_index.update(old, contact)
+    return 1
+
+def _sync_remove(contact_id):
+    old = contacts.get(contact_id)
+    if old is None:
+        return 0
+    contacts.remove(contact_id)
+    search_index.remove(old)
+    return 1
+
+def apply_external_entries(entries):
+    """Applies journal records written by another window. Returns the number of contacts changed."""
+    changed = 0
+    for entry in entries:
+        op = entry.get('op')
+        if 'key' in entry: # Pre-ID records only exist in journals a reload has migrated
+            continue
+        if op in ('add', 'update'):
+            changed += _sync_add(Contact.from_dict(entry['contact']))
+        elif op == 'delete':
+            changed += _sync_remove(entry.get('id'))
+    return changed
+
+def apply_external_book(new_contacts):
+    """Makes the book match a freshly loaded one, touching only what differs."""
+    new_by_id = {c.id: c for c in new_contacts}
+    changed = sum(_sync_remove(c.id) for c in list(contacts) if c.id not in new_by_id)
+    return changed + sum(_sync_add(c) for c in new_contacts)
+
+def merge_external_json(base, theirs):
+    """Three-way merge for 'json' mode: a contact that changed between 'base'
+    and 'theirs' is applied unless we changed it too (ours wins, and goes
+    out with our next save)."""
+    changed = 0
+    for contact_id, their_contact in theirs.items():
+        base_contact = base.get(contact_id)
+        our_contact = contacts.get(contact_id)
+        if their_contact == base_contact or their_contact == our_contact:
+            continue
+        if (our_contact is None and base_contact is None) or (our_contact is not None and our_contact == base_contact):
+            changed += _sync_add(their_contact)
+    for contact_id in base.keys() - theirs.keys():
+        our_contact = contacts.get(contact_id)
+        if our_contact is not None and our_contact == base[contact_id]:
+            changed += _sync_remove(contact_id)
+    return changed
+
+def _read_json_file():
+    with open(CONTACTS_FILE, 'rb') as f:
+        data = f.read()
+    count_bytes('read', CONTACTS_FILE, len(data))
+    return hashlib.sha1(data).digest(), data
+
+def _json_contacts(data):
+    records = decode(data)
+    assign_contact_ids(records)
+    return [Contact.from_dict(c) for c in records]
+
+def sync_from_storage():
+    """Pulls in what other windows saved. Returns the number of contacts
+    changed (in 'sqlite' mode 1 for any change), or None if our own edits
+    must reach the disk first."""
+    global _db_data_version
+    if STORAGE_MODE == 'json':
+        with _json_lock:
+            try:
+                digest, data = _read_json_file()
+            except FileNotFoundError:
+                return 0
+            if digest == _json_digest:
+                return 0 # Our own save; nothing to decode
+            theirs = _json_contacts(data)
+            base = _json_base
+            _note_json_state(theirs, digest)
+        return merge_external_json(base, _json_base)
+    if not save_worker.is_idle():
+        return None
+    if STORAGE_MODE == 'sqlite':
+        data_version = _query("PRAGMA data_version")[0][0] # Only changes on other connections' commits
+        if data_version == _db_data_version:
+            return 0
+        _db_data_version = data_version
+        contacts.reload() # Nothing to merge: the view re-reads the table
+        return 1
+    entries = read_journal_tail()
+    if entries is None:
+        return apply_external_book(load_contacts())
+    return apply_external_entries(entries)
+
+# --- Validation ---
+PHONE_PATTERN = re.compile(r"^[\d\s\-\(\)\+]+$")
+EMAIL_PATTERN = re.compile(r"[^@]+@[^@]+\.[^@]+")
+
+def validate_phone(phone):
+    return bool(PHONE_PATTERN.match(phone)) if phone else True # Allow empty
+
+def validate_email(email):
+    return bool(EMAIL_PATTERN.match(email)) if email else True # Allow empty
+
+def contact_validation_error(contact):
+    """Returns the message for the first invalid field, or None if the contact is valid."""
+    if not contact.name:
+        return "Name cannot be empty."
+    if not contact.phone:
+        return "Phone cannot be empty."
+    if not validate_phone(contact.phone):
+        return "Invalid phone number format."
+    if contact.email and not validate_email(contact.email):
+        return "Invalid email format."
+    return None
+
+# --- Contact Collection ---
+def _order_key(contact):
+    return (contact.name.casefold(), contact.id) # _name_key() inlined: sorts and bisects call this a lot
+
+class ContactList:
+    """The contact book kept in name order.
+
+    One list of contacts sorted by (case-folded name, id), maintained with
+    bisect, plus an id -> contact dict. Name lookups bisect the same list, so
+    nothing per contact is stored twice. An edit never re-sorts or scans the
+    whole book. Iterating yields contacts in name order."""
+
+    def __init__(self, contacts_list=()):
+        self._by_id = {c.id: c for c in contacts_list}
+        self._order = sorted(self._by_id.values(), key=_order_key)
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def __getitem__(self, position):
+        """The contact at 'position' in name order (slices return a list)."""
+        return self._order[position]
+
+    def __contains__(self, contact_id):
+        return contact_id in self._by_id
+
+    def get(self, contact_id):
+        return self._by_id.get(contact_id)
+
+    def _named(self, name):
+        """The contacts called 'name' (ignoring case); more than one only in old books."""
+        key = _name_key(name)
+        pos = bisect.bisect_left(self._order, (key,), key=_order_key)
+        while pos < len(self._order) and _name_key(self._order[pos].name) == key:
+            yield self._order[pos]
+            pos += 1
+
+    def find_by_name(self, name):
+        return next(self._named(name), None)
+
+    def name_taken(self, name, exclude_id=None):
+        return any(contact.id != exclude_id for contact in self._named(name))
+
+    def position(self, contact_id):
+        """Index of a contact in name order, or None if it is not in the book."""
+        contact = self._by_id.get(contact_id)
+        if contact is None:
+            return None
+        return bisect.bisect_left(self._order, _order_key(contact), key=_order_key)
+
+    def add(self, contact):
+        bisect.insort(self._order, contact, key=_order_key)
+        self._by_id[contact.id] = contact
+
+    def add_many(self, new_contacts):
+        """Bulk insert: one merge of the order instead of n insertions."""
+        for contact in new_contacts:
+            self._by_id[contact.id] = contact
+        self._order.extend(new_contacts)
+        self._order.sort(key=_order_key) # Timsort merges the two sorted runs
+
+    def remove(self, contact_id):
+        """Takes a contact out of the book and returns it (KeyError if it isn't there)."""
+        pos = self.position(contact_id)
+        if pos is None:
+            raise KeyError(contact_id)
+        del self._order[pos]
+        return self._by_id.pop(contact_id)
+
+    def replace(self, contact):
+        """Swaps in a new version of an existing contact (matched by id)."""
+        self.remove(contact.id)
+        self.add(contact)
+
+# --- Search Index ---
+
+_WORD_SPLIT = re.compile(r"[^0-9a-z+]+")
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _has_id(ids, key):
+    pos = bisect.bisect_left(ids, key)
+    return pos < len(ids) and ids[pos] == key
+
+class ContactSearchIndex:
+    """In-memory search over names, phones and emails, kept in step with a ContactList.
+
+    One dict maps every trigram of a contact's fields, and the first one and
+    two letters of each word, to a sorted array of contact ids (8 bytes per
+    entry); contacts themselves are looked up in the ContactList. Substring
+    queries only verify the contacts whose postings contain all of the
+    query's trigrams. With background=True the index is built on a thread;
+    edits made meanwhile are queued and searches wait for it to finish."""
+
+    def __init__(self, contacts_list, background=False):
+        self._contacts = contacts_list
+        self._postings = {} # trigram or 1-2 letter word prefix -> array('q') of contact ids, ascending
+        self._lock = threading.Lock() # Guards the switch from queueing edits to applying them
+        self._backlog = [] # (method, contact) edits made while the index is built
+        self._ready = threading.Event()
+        snapshot = list(contacts_list)
+        if background:
+            threading.Thread(target=self._build, args=(snapshot,), name="search-index", daemon=True).start()
+        else:
+            self._build(snapshot)
+
+    @timed('contacts.index')
+    def _build(self, snapshot):
+        postings = defaultdict(lambda: array('q'))
+        for contact in sorted(snapshot, key=lambda c: c.id): # Appending in id order keeps each array sorted
+            key = contact.id
+            for gram in self._keys(contact):
+                postings[gram].append(key)
+        with self._lock:
+            self._postings = dict(postings)
+            for method, contact in self._backlog:
+                method(contact)
+            self._backlog = []
+            self._ready.set()
+
+    @staticmethod
+    def _field_values(contact):
+        phone = contact.phone.lower()
+        values = [contact.name.lower(), phone, normalize_phone(phone), contact.email.lower()]
+        return tuple(v for v in dict.fromkeys(values) if v)
+
+    @staticmethod
+    def _word_set(fields):
+        words = set(fields)
+        for value in fields:
+            words.update(w for w in _WORD_SPLIT.split(value) if w)
+        return words
+
+    @classmethod
+    def _keys(cls, contact):
+        fields = cls._field_values(contact)
+        keys = set().union(*map(_trigrams, fields))
+        for word in cls._word_set(fields):
+            keys.add(word[:1])
+            keys.add(word[:2])
+        return keys
+
+    def _edit(self, method, contact):
+        with self._lock:
+            if self._ready.is_set():
+                method(contact)
+            else:
+                self._backlog.append((method, contact))
+
+    def _insert(self, contact):
+        key = contact.id
+        postings = self._postings
+        for gram in self._keys(contact):
+            ids = postings.get(gram)
+            if ids is None:
+                postings[gram] = array('q', (key,))
+            elif ids[-1] < key: # New contacts have the highest ids
+                ids.append(key)
+            else:
+                pos = bisect.bisect_left(ids, key)
+                if pos == len(ids) or ids[pos] != key:
+                    ids.insert(pos, key)
+
+    def _delete(self, contact):
+        key = contact.id
+        postings = self._postings
+        for gram in self._keys(contact):
+            ids = postings.get(gram)
+            if ids is None:
+                continue
+            pos = bisect.bisect_left(ids, key)
+            if pos < len(ids) and ids[pos] == key:
+                del ids[pos]
+                if not ids:
+                    del postings[gram]
+
+    def add(self, contact):
+        self._edit(self._insert, contact)
+
+    def add_many(self, new_contacts):
+        for contact in new_contacts:
+            self.add(contact)
+
+    def remove(self, contact):
+        self._edit(self._delete, contact)
+
+    def update(self, old_contact, new_contact):
+        self.remove(old_contact)
+        self.add(new_contact)
+
+    def _term_postings(self, term):
+        """The id arrays a contact must be in to match 'term', rarest first (None if nothing can)."""
+        grams = _trigrams(term) if len(term) >= 3 else (term,)
+        postings = [self._postings.get(gram) for gram in grams]
+        if None in postings:
+            return None
+        return sorted(postings, key=len)
+
+    @staticmethod
+    def _verified(contact, term):
+        # Three-letter and shorter terms are exact postings; longer ones may be trigram coincidences
+        if len(term) <= 3:
+            return True
+        phone = contact.phone.lower()
+        return (term in contact.name.lower() or term in contact.email.lower() or term in phone
+                or term in normalize_phone(phone))
+
+    def _matches(self, contact, queries):
+        return any(all(_has_id(ids, contact.id) for ids in postings) and self._verified(contact, term)
+                   for term, postings in queries)
+
+    def _walk(self, queries, limit, budget):
+        """Matches in name order, or None if 'limit' was not reached within 'budget' contacts."""
+        found = []
+        for contact in itertools.islice(self._contacts, budget):
+            if self._matches(contact, queries):
+                found.append(contact)
+                if len(found) == limit:
+                    return found
+        return None
+
+    def _scan(self, queries):
+        """Every match, in name order, by one pass over the book."""
+        matching = [(t, set(postings[0]).intersection(*postings[1:])) for t, postings in queries]
+        return [contact for contact in self._contacts
+                if any(contact.id in keys and self._verified(contact, t) for t, keys in matching)]
+
+    @timed('contacts.search')
+    def search(self, term, limit=None):
+        """Returns contacts (sorted by name) matching 'term'. Terms of three or
+        more characters match anywhere; shorter ones match word prefixes."""
+        term = term.strip().lower()
+        if not term:
+            return []
+        self._ready.wait()
+        terms = {term}
+        phone_term = normalize_phone(term)
+        if phone_term and phone_term != term and validate_phone(term):
+            terms.add(phone_term)
+        queries = [(t, postings) for t in terms for postings in [self._term_postings(t)] if postings]
+        if not queries:
+            return []
+        candidates = sum(len(postings[0]) for _, postings in queries)
+        total = len(self._contacts)
+        # Common terms match much of the book: taking the matches in name order
+        # is then cheaper than collecting and sorting them
+        if limit is None:
+            if 2 * candidates > total:
+                return self._scan(queries)
+        elif limit * total < candidates * candidates: # 'limit' is likely reached within 'candidates' contacts
+            found = self._walk(queries, limit, budget=candidates)
+            if found is not None:
+                return found
+        found = {}
+        for t, postings in queries:
+            for key in postings[0]:
+                if key not in found and all(_has_id(ids, key) for ids in postings[1:]):
+                    contact = self._contacts.get(key)
+                    if self._verified(contact, t):
+                        found[key] = contact
+        return sorted(found.values(), key=_order_key)[:limit]
+
+# --- Import / Export ---
+CONTACT_FIELDS = ("name", "phone", "email", "address")
+IMPORT_CHUNK_SIZE = 5000 # Records validated per task
+IMPORT_PARALLEL_BYTES = 4 * 1024 * 1024 # Files this large are validated in a process pool
+VCARD_EXTENSIONS = (".vcf", ".vcard")
+
+def _clean_record(record):
+    """Builds an id-less Contact from a parsed row/card (missing fields become '')."""
+    return Contact(None, *((record.get(field) or "").strip() for field in CONTACT_FIELDS))
+
+def iter_csv_contacts(path):
+    """Streams contacts from a CSV file with name/phone/email/address columns (any case, any order)."""
+    with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+        for row in reader:
+            yield _clean_record(row)
+
+_VCARD_ESCAPE = re.compile(r"\\(.)")
+_VCARD_FIELD_SPLIT = re.compile(r"(?<!\\);")
+
+def _vcard_unescape(value):
+    return _VCARD_ESCAPE.sub(lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+def _vcard_escape(value):
+    return (value.replace("\\", "\\\\").replace(";", "\\;")
+                 .replace(",", "\\,").replace("\n", "\\n"))
+
+def _unfolded_lines(f):
+    """Joins vCard continuation lines (those starting with a space or tab)."""
+    pending = None
+    for raw in f:
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and pending is not None:
+            pending += line[1:]
+            continue
+        if pending is not None:
+            yield pending
+        pending = line
+    if pending is not None:
+        yield pending
+
+def iter_vcard_contacts(path):
+    """Streams contacts from a vCard (.vcf) file, one card at a time."""
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        card = None
+        for line in _unfolded_lines(f):
+            prop, _, value = line.partition(":")
+            prop = prop.split(";")[0].split(".")[-1].upper() # Drop parameters and groups
+            if prop == "BEGIN":
+                card = {}
+            elif prop == "END" and card is not None:
+                if not card.get("name") and card.get("n"):
+                    parts = [p for p in card["n"].split(";")[:2] if p]
+                    card["name"] = " ".join(reversed(parts))
+                yield _clean_record(card)
+                card = None
+            elif card is not None:
+                key = {"FN": "name", "N": "n", "TEL": "phone", "EMAIL": "email", "ADR": "address"}.get(prop)
+                if key and key not in card: # First TEL/EMAIL/ADR wins
+                    if key == "address": # Structured: PO box;extended;street;city;region;code;country
+                        parts = (_vcard_unescape(p) for p in _VCARD_FIELD_SPLIT.split(value))
+                        card[key] = ", ".join(p for p in parts if p)
+                    else:
+                        card[key] = value if key == "n" else _vcard_unescape(value)
+
+def _chunk_errors(rows):
+    """Process pool worker: validates (name, phone, email) rows and returns
+    (position, error) for the invalid ones only, so little is sent back."""
+    errors = []
+    for position, row in enumerate(rows):
+        error = contact_validation_error(Contact(None, *row))
+        if error is not None:
+            errors.append((position, error))
+    return errors
+
+def _chunked(records, size):
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _validated_records(records, parallel):
+    """Yields (record, error) pairs in file order. With 'parallel' and more
+    than one CPU, chunks are validated in a process pool with a bounded number
+    in flight, so memory stays flat however large the file is."""
+    if not parallel or (os.cpu_count() or 1) < 2:
+        for record in records:
+            yield record, contact_validation_error(record)
+        return
+    # Spawned, not forked: forking copies the save and watcher threads' locks
+    # in whatever state they are. Workers only import this module, which
+    # doesn't touch Tk or the disk, and the windows' scripts keep their
+    # main() under a __main__ guard.
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor # Only needed for large imports
+    def chunk_results(chunk, future):
+        errors = dict(future.result())
+        return ((record, errors.get(position)) for position, record in enumerate(chunk))
+    with ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn')) as pool:
+        in_flight = deque()
+        max_in_flight = 2 * os.cpu_count()
+        for chunk in _chunked(records, IMPORT_CHUNK_SIZE):
+            rows = [(record.name, record.phone, record.email) for record in chunk]
+            in_flight.append((chunk, pool.submit(_chunk_errors, rows)))
+            if len(in_flight) >= max_in_flight:
+                yield from chunk_results(*in_flight.popleft())
+        while in_flight:
+            yield from chunk_results(*in_flight.popleft())
+
+def import_contacts(path, contacts_list):
+    """Imports a CSV or vCard file into 'contacts_list'.
+
+    Valid, non-duplicate records get IDs and are stored with one storage write.
+    Returns (added contacts, duplicate count, [(record number, error), ...])."""
+    is_vcard = path.lower().endswith(VCARD_EXTENSIONS)
+    records = iter_vcard_contacts(path) if is_vcard else iter_csv_contacts(path)
+    parallel = os.path.getsize(path) >= IMPORT_PARALLEL_BYTES
+    added, errors = [], []
+    duplicates = 0
+    seen_names = set() # Names accepted earlier in this same file
+    for number, (record, error) in enumerate(_validated_records(records, parallel), start=1):
+        if error:
+            errors.append((number, error))
+            continue
+        name_key = _name_key(record.name)
+        if name_key in seen_names or contacts_list.name_taken(record.name):
+            duplicates += 1
+            continue
+        seen_names.add(name_key)
+        record.id = new_contact_id()
+        added.append(record)
+    contacts_list.add_many(added)
+    persist_add_many(added, contacts_list)
+    return added, duplicates, errors
+
+def export_contacts(path, contacts_list):
+    """Streams every contact to a CSV or vCard file (picked by extension). Returns the count."""
+    count = 0
+    if path.lower().endswith(VCARD_EXTENSIONS):
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for contact in contacts_list:
+                lines = ["BEGIN:VCARD", "VERSION:3.0",
+                         f"FN:{_vcard_escape(contact.name)}",
+                         f"N:{_vcard_escape(contact.name)};;;;",
+                         f"TEL:{_vcard_escape(contact.phone)}"]
+                if contact.email:
+                    lines.append(f"EMAIL:{_vcard_escape(contact.email)}")
+                if contact.address:
+                    lines.append(f"ADR:;;{_vcard_escape(contact.address)};;;;")
+                lines.append("END:VCARD")
+                f.write("\r\n".join(lines) + "\r\n")
+                count += 1
+    else:
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(CONTACT_FIELDS)
+            for contact in contacts_list:
+                writer.writerow([getattr(contact, field) for field in CONTACT_FIELDS])
+                count += 1
+    return count
+
+# --- Duplicate Detection ---
+PHONE_MATCH_DIGITS = 9 # Trailing digits compared, so '+1 555 123 4567' matches '(555) 123-4567'
+NAME_SIMILARITY_REQUIRED = (0.92, 0.5, 0.0) # Indexed by how many of phone/email match
+MAX_BLOCK_SIZE = 50 # Larger groups only compare each contact with its name-order neighbours
+BLOCK_WINDOW = 10
+
+def canonical_phone(phone):
+    """Canonical phone form: digits only, with '+' for international numbers
+    (written with either '+' or a '00' prefix)."""
+    digits = re.sub(r"\D", "", phone)
+    if phone.strip().startswith("+"):
+        return "+" + digits
+    if digits.startswith("00"):
+        return "+" + digits[2:]
+    return digits
+
+def phone_match_key(phone):
+    digits = canonical_phone(phone).lstrip("+")
+    return digits[-PHONE_MATCH_DIGITS:] if len(digits) >= 7 else None
+
+_SOUNDEX_TABLE = str.maketrans("aeiouybfpvcgjkqsxzdtlmnrhw", "000000111122222222334556\0\0")
+
+def soundex(word):
+    """American Soundex code (e.g. 'Robert' and 'Rupert' are both R163)."""
+    word = "".join(ch for ch in word.lower() if "a" <= ch <= "z")
+    if not word:
+        return ""
+    codes = [code for code, _ in itertools.groupby(word.translate(_SOUNDEX_TABLE).replace("\0", ""))]
+    tail = "".join(code for code in codes[1:] if code != "0")
+    return (word[0].upper() + tail + "000")[:4]
+
+def phonetic_name_key(name):
+    """Soundex of the first and last words, so 'Jon Smyth' groups with 'John Smith'."""
+    words = [w for w in re.split(r"[^a-z]+", name.lower()) if w]
+    if not words:
+        return None
+    return soundex(words[0]) + (soundex(words[-1]) if len(words) > 1 else "")
+
+def _blocking_keys(contact):
+    phone_key = phone_match_key(contact.phone)
+    if phone_key:
+        yield ("phone", phone_key)
+    if contact.email:
+        yield ("email", contact.email.lower())
+    name_key = phonetic_name_key(contact.name)
+    if name_key:
+        yield ("name", name_key)
+
+def is_duplicate(a, b):
+    """Two contacts are duplicates when their names are as similar as the other
+    evidence demands: near-identical names on their own, fairly similar names
+    with a matching phone or email, or any names when both match."""
+    evidence = 0
+    phone_key = phone_match_key(a.phone)
+    if phone_key and phone_key == phone_match_key(b.phone):
+        evidence += 1
+    if a.email and a.email.lower() == b.email.lower():
+        evidence += 1
+    required = NAME_SIMILARITY_REQUIRED[evidence]
+    if required <= 0:
+        return True
+    matcher = difflib.SequenceMatcher(None, _name_key(a.name), _name_key(b.name))
+    # The cheap upper bounds reject most pairs before the full ratio is computed
+    return (matcher.real_quick_ratio() >= required and matcher.quick_ratio() >= required
+            and matcher.ratio() >= required)
+
+def _candidate_pairs(members):
+    if len(members) <= MAX_BLOCK_SIZE:
+        return itertools.combinations(members, 2)
+    # Sorted-neighbourhood for oversized blocks keeps the work linear
+    members = sorted(members, key=_order_key)
+    return ((a, b) for i, a in enumerate(members) for b in members[i + 1:i + 1 + BLOCK_WINDOW])
+
+def find_duplicates(contacts_list):
+    """Groups likely duplicates. Contacts are bucketed by phone, email and
+    phonetic name keys and only pairs inside a bucket are scored, so the work
+    grows roughly linearly with the book instead of with its square.
+    Returns a list of groups (lists of contacts, oldest id first)."""
+    blocks = defaultdict(list)
+    for contact in contacts_list:
+        for key in _blocking_keys(contact):
+            blocks[key].append(contact)
+
+    parent = {} # Union-find over contact ids
+    def find(contact_id):
+        root_id = contact_id
+        while parent.get(root_id, root_id) != root_id:
+            root_id = parent[root_id]
+        parent[contact_id] = root_id
+        return root_id
+
+    scored = set()
+    for members in blocks.values():
+        if len(members) < 2:
+            continue
+        for a, b in _candidate_pairs(members):
+            pair = (a.id, b.id) if a.id < b.id else (b.id, a.id)
+            if pair in scored:
+                continue
+            scored.add(pair)
+            if is_duplicate(a, b):
+                parent[find(pair[1])] = find(pair[0])
+
+    groups = defaultdict(list)
+    for contact_id in list(parent):
+        groups[find(contact_id)].append(contacts_list.get(contact_id))
+    result = [sorted(group, key=lambda c: c.id) for group in groups.values() if len(group) > 1]
+    result.sort(key=lambda group: _order_key(group[0]))
+    return result
+
+def merge_duplicates(groups, contacts_list):
+    """Folds each group into its oldest contact, filling its empty email and
+    address from the others, then stores everything with one storage write.
+    The groups may be stale (another window synced in meanwhile): contacts
+    no longer in the book are left out, and the others are merged as they
+    are now. Returns ([(old, new) for each contact that changed], [removed
+    contacts])."""
+    merged, removed = [], []
+    for group in groups:
+        group = [current for current in (contacts_list.get(c.id) for c in group) if current is not None]
+        if len(group) < 2:
+            continue
+        primary, others = group[0], group[1:]
+        email = primary.email or next((c.email for c in others if c.email), "")
+        address = primary.address or next((c.address for c in others if c.address), "")
+        for contact in others:
+            contacts_list.remove(contact.id)
+            removed.append(contact)
+        if (email, address) != (primary.email, primary.address):
+            updated = Contact(primary.id, primary.name, primary.phone, email, address)
+            contacts_list.replace(updated)
+            merged.append((primary, updated))
+    persist_changes(contacts_list, updated=[new for _, new in merged], deleted=removed)
+    return merged, removed
+
+# --- Opening the Book ---
+contacts = None # ContactList, set by open_book()
+search_index = None # Kept in step with 'contacts' by every edit
+save_worker = None
+_on_save_conflict = None
+
+def open_book(root=None, on_save_error=None, on_save_conflict=None, on_load_error=None):
+    """Loads the book, starts its save worker and builds the search index on a
+    thread. In 'sqlite' mode nothing is loaded: both answer from the database.
+    Returns (contacts, search_index, save_worker).
+
+    'root' is the Tk window whose event loop saves are scheduled on; without
+    one (scripts) every edit is handed to the save worker straight away and
+    flush_storage() must be called before exiting. on_save_error(error,
+    snapshots) defaults to putting the failed records back in the queue
+    (requeue_failed_entries). on_save_conflict is called
+    on the Tk thread when another window saved first in 'json' mode; it
+    should call sync_then_save(). Without a root both are called on the save
+    worker thread (see SaveWorker.hand_back)."""
+    global contacts, search_index, save_worker, _on_save_conflict, _db_data_version
+    if STORAGE_MODE == 'sqlite':
+        contacts, search_index = SqliteContactList(), SqliteContactSearch()
+    else:
+        contacts = ContactList(load_contacts(on_error=on_load_error))
+        search_index = ContactSearchIndex(contacts, background=True) # Searches wait until it is built
+    if on_save_error is None:
+        on_save_error = lambda error, snapshots: requeue_failed_entries(snapshots)
+    save_worker = SaveWorker(root, take_storage_snapshot, write_storage, on_error=on_save_error)
+    _on_save_conflict = on_save_conflict
+    if STORAGE_MODE == 'sqlite':
+        _db_data_version = _query("PRAGMA data_version")[0][0]
+    if STORAGE_MODE == 'journal':
+        maybe_compact_journal() # Fold in a journal left large by the last session
+    return contacts, search_index, save_worker
+
+def sync_then_save():
+    """Merges what another window saved, then queues our deferred save again.
+    Returns the number of contacts the merge changed."""
+    global _json_save_deferred
+    _json_save_deferred = False
+    changed = sync_from_storage()
+    save_worker.mark_dirty()
+    return changed
+
+def flush_storage():
+    """Writes every pending edit and waits for it (shutdown, end of a script)."""
+    save_worker.flush()
+    while _json_save_deferred: # Another window saved first: merge its changes, then write ours
+        sync_then_save()
+        save_worker.flush()
+
+# --- Command Line ---
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Work with the contact book without opening its window.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="print every contact")
+    search = commands.add_parser("search", help="print contacts matching a term")
+    search.add_argument("term")
+    add = commands.add_parser("add", help="add a contact")
+    for field in CONTACT_FIELDS:
+        add.add_argument(field, nargs="?" if field in ("email", "address") else None, default="")
+    delete = commands.add_parser("delete", help="delete a contact by name")
+    delete.add_argument("name")
+    for name in ("import", "export"):
+        command = commands.add_parser(name, help=f"{name} a CSV or vCard file")
+        command.add_argument("path")
+    commands.add_parser("duplicates", help="print groups of likely duplicates")
+    args = parser.parse_args(argv)
+
+    open_book()
+    if args.command in ("list", "search"):
+        rows = search_index.search(args.term) if args.command == "search" else contacts
+        for contact in rows:
+            print("\t".join((contact.name, contact.phone, contact.email, contact.address)))
+    elif args.command == "add":
+        contact = Contact(new_contact_id(), args.name.strip(), args.phone.strip(), args.email.strip(), args.address.strip())
+        error = contact_validation_error(contact)
+        if error is None and contacts.name_taken(contact.name):
+            error = f"A contact named '{contact.name}' already exists."
+        if error is not None:
+            parser.exit(1, f"{error}\n")
+        contacts.add(contact)
+        search_index.add(contact)
+        persist_add(contact, contacts)
+    elif args.command == "delete":
+        contact = contacts.find_by_name(args.name)
+        if contact is None:
+            parser.exit(1, f"No contact named '{args.name}'.\n")
+        contacts.remove(contact.id)
+        search_index.remove(contact)
+        persist_delete(contact, contacts)
+    elif args.command == "import":
+        added, duplicates, errors = import_contacts(args.path, contacts)
+        search_index.add_many(added)
+        for record_number, error in errors:
+            print(f"Record {record_number}: {error}")
+        print(f"Imported {len(added)} contact(s), skipped {duplicates} duplicate(s).")
+    elif args.command == "export":
+        print(f"Exported {export_contacts(args.path, contacts)} contact(s).")
+    else:
+        for group in find_duplicates(contacts):
+            print(" | ".join(f"{c.name} ({c.phone})" for c in group))
+    flush_storage()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import struct
+
+# --- File Change Detection (shared by the Tk apps) ---
+
+# inotify flags (see inotify(7))
+_IN_MODIFY = 0x002
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+_EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, name length
+_TK_READABLE = 2 # tkinter.READABLE
+
+
+def file_signature(path):
+    """Returns something that changes whenever 'path' is rewritten, replaced
+    or appended to, or None if it doesn't exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def file_digest(path):
+    """Returns a hash of the contents of 'path', or None if it doesn't exist.
+    Unlike file_signature() this can't be fooled by two same-sized writes
+    landing within one filesystem timestamp tick."""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).digest()
+    except OSError:
+        return None
+
+
+class FileWatcher:
+    """Calls on_change(paths) on the Tk thread when any of 'paths' changes.
+
+    On Linux the parent directories are watched with inotify and the inotify
+    descriptor is handed to Tk's event loop (createfilehandler), so nothing
+    runs until the kernel reports a change. Elsewhere, or if inotify is not
+    available, the files are stat()ed every poll_ms. Either way, bursts of
+    events within settle_ms are reported once. Changes the app made itself
+    are reported too; callers compare digests to skip those."""
+
+    def __init__(self, root, paths, on_change, poll_ms=1000, settle_ms=100):
+        self.root = root
+        self.paths = {os.path.abspath(path) for path in paths}
+        self.on_change = on_change
+        self.poll_ms = poll_ms
+        self.settle_ms = settle_ms
+        self._changed = set()
+        self._settle_job = None
+        self._fd = None
+        if not self._start_inotify():
+            self._signatures = {path: file_signature(path) for path in self.paths}
+            self.root.after(self.poll_ms, self._poll)
+
+    def _start_inotify(self):
+        import ctypes, ctypes.util # Only windows watch files; scripts importing file_digest() skip this
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        except (OSError, AttributeError, TypeError):
+            return False # Not Linux
+        if fd < 0:
+            return False
+        self._watches = {}
+        for directory in {os.path.dirname(path) for path in self.paths}:
+            wd = libc.inotify_add_watch(fd, os.fsencode(directory), _WATCH_MASK)
+            if wd < 0:
+                os.close(fd)
+                return False
+            self._watches[wd] = directory
+        try:
+            self.root.tk.createfilehandler(fd, _TK_READABLE, self._read_events)
+        except (AttributeError, RuntimeError, NotImplementedError):
+            os.close(fd) # No file handlers in this Tk build (Windows)
+            return False
+        self._fd = fd
+        return True
+
+    def _read_events(self, fd, mask):
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, _, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b"\0")
+            offset += name_length
+            path = os.path.join(self._watches.get(wd, ""), os.fsdecode(name))
+            if path in self.paths:
+                self._note_change(path)
+
+    def _poll(self):
+        for path in self.paths:
+            signature = file_signature(path)
+            if signature != self._signatures[path]:
+                self._signatures[path] = signature
+                self._note_change(path)
+        self.root.after(self.poll_ms, self._poll)
+
+    def _note_change(self, path):
+        self._changed.add(path)
+        if self._settle_job is None:
+            self._settle_job = self.root.after(self.settle_ms, self._report)
+
+    def _report(self):
+        self._settle_job = None
+        changed, self._changed = self._changed, set()
+        self.on_change(changed)
+
+    def close(self):
+        if self._fd is not None:
+            self.root.tk.deletefilehandler(self._fd)
+            os.close(self._fd)
+            self._fd = None
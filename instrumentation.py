@@ -0,0 +1,151 @@
+import atexit
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+
+# --- Metrics and Profiling (shared by the apps) ---
+#
+# Off unless asked for, and then only the hot paths wrapped with timed() or
+# calling count_bytes() are measured:
+#   APP_METRICS=metrics.json   latency histograms, call counts and bytes
+#                              read/written, written at exit (JSON, or
+#                              Prometheus text if the name ends in .prom)
+#   APP_PROFILE=contacts.search
+#                              also runs that action (or comma-separated
+#                              actions) under cProfile; stats are written to
+#                              <action>.prof at exit (view with pstats/snakeviz)
+# With neither set, timed() hands back the undecorated function and
+# count_bytes() does nothing, so there is no per-call cost.
+
+METRICS_FILE = os.environ.get("APP_METRICS")
+PROFILE_ACTIONS = frozenset(filter(None, os.environ.get("APP_PROFILE", "").split(",")))
+# Histogram bucket upper bounds in seconds (Prometheus 'le' labels)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock() # Saves run on worker threads
+_timings = {} # action -> [bucket counts..., +Inf count], plus sums below
+_sums = {} # action -> (total seconds, max seconds)
+_bytes = {} # (direction, file name) -> bytes
+_profiles = {} # action -> cProfile.Profile
+_profile_depth = threading.local()
+
+
+def _record_time(action, seconds):
+    with _lock:
+        counts = _timings.get(action)
+        if counts is None:
+            counts = _timings[action] = [0] * (len(LATENCY_BUCKETS) + 1)
+        counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        total, longest = _sums.get(action, (0.0, 0.0))
+        _sums[action] = (total + seconds, max(longest, seconds))
+
+def _profiled(action, func, args, kwargs):
+    import cProfile
+    profile = _profiles.get(action)
+    if profile is None:
+        profile = _profiles[action] = cProfile.Profile()
+    depth = getattr(_profile_depth, "value", 0)
+    if depth: # Only one profiler can be active per thread (recursion, nested actions)
+        return func(*args, **kwargs)
+    _profile_depth.value = 1
+    try:
+        return profile.runcall(func, *args, **kwargs)
+    finally:
+        _profile_depth.value = 0
+
+def timed(action):
+    """Decorator recording how long each call of the function takes under
+    'action' (e.g. 'contacts.load'). A no-op unless metrics or profiling of
+    this action are switched on."""
+    def decorate(func):
+        measure = METRICS_FILE is not None
+        profile = action in PROFILE_ACTIONS
+        if not (measure or profile):
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                if profile:
+                    return _profiled(action, func, args, kwargs)
+                return func(*args, **kwargs)
+            finally:
+                if measure:
+                    _record_time(action, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+def count_bytes(direction, path, count):
+    """Adds to the bytes 'read' or 'written' for a file."""
+    if METRICS_FILE is None:
+        return
+    key = (direction, os.path.basename(path))
+    with _lock:
+        _bytes[key] = _bytes.get(key, 0) + count
+
+
+def snapshot():
+    """Everything recorded so far, as plain data (what the JSON file holds)."""
+    with _lock:
+        timings = {}
+        for action, counts in sorted(_timings.items()):
+            total, longest = _sums[action]
+            calls = sum(counts)
+            timings[action] = {
+                "calls": calls,
+                "total_seconds": total,
+                "mean_seconds": total / calls,
+                "max_seconds": longest,
+                "buckets": {str(bound): count for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), counts)},
+            }
+        transferred = {"read": {}, "written": {}}
+        for (direction, name), count in sorted(_bytes.items()):
+            transferred[direction][name] = count
+    return {"timings": timings, "bytes": transferred}
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+def prometheus_text(data):
+    """Formats snapshot() in the Prometheus text exposition format."""
+    lines = ["# HELP app_action_duration_seconds Time spent in instrumented actions.",
+             "# TYPE app_action_duration_seconds histogram"]
+    for action, timing in data["timings"].items():
+        cumulative = 0
+        for bound, count in timing["buckets"].items():
+            cumulative += count
+            lines.append(f'app_action_duration_seconds_bucket{{action="{_label(action)}",le="{bound}"}} {cumulative}')
+        lines.append(f'app_action_duration_seconds_sum{{action="{_label(action)}"}} {timing["total_seconds"]}')
+        lines.append(f'app_action_duration_seconds_count{{action="{_label(action)}"}} {timing["calls"]}')
+    lines += ["# HELP app_file_bytes_total Bytes read from and written to data files.",
+              "# TYPE app_file_bytes_total counter"]
+    for direction, files in data["bytes"].items():
+        for name, count in files.items():
+            lines.append(f'app_file_bytes_total{{direction="{direction}",file="{_label(name)}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+def dump_metrics(path=None):
+    """Writes the metrics file (also done automatically at exit)."""
+    path = path or METRICS_FILE
+    if path is None:
+        return
+    data = snapshot()
+    text = prometheus_text(data) if path.endswith(".prom") else json.dumps(data, indent=2) + "\n"
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def dump_profiles():
+    for action, profile in _profiles.items():
+        profile.dump_stats(f"{action}.prof")
+
+if METRICS_FILE is not None:
+    atexit.register(dump_metrics)
+if PROFILE_ACTIONS:
+    atexit.register(dump_profiles)
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import operator
+import os
+import struct
+
+from save_worker import atomic_write_bytes
+from instrumentation import count_bytes
+
+try:
+    import orjson # Optional: several times faster than the json module both ways
+except ImportError:
+    orjson = None
+
+# --- Record File Formats (shared by the Tk apps) ---
+#
+# tasks.json and contacts_data.json each hold one list of flat records (dicts).
+# They can be stored as:
+#   'json'          - indented JSON, the original format; easiest to read by hand
+#   'json-compact'  - the same JSON without the indentation; the default
+#   'records'       - a binary file: a magic header, then length-prefixed
+#                     frames. The first frame names the fields; every other
+#                     frame is a block of up to BLOCK_SIZE records, each stored
+#                     as a bare list of values in field order (records with
+#                     other keys are stored whole). Field names are not
+#                     repeated per record, so files are smaller and decode
+#                     block by block.
+# Readers detect the format from the file itself. Writers use RECORD_FORMAT
+# if it is set; otherwise a 'records' file stays one and anything else is
+# saved as 'json-compact'. The migration command at the bottom converts
+# existing files in one go.
+
+RECORD_FORMAT = os.environ.get("RECORD_FORMAT") # None: keep each file's format
+DEFAULT_FORMAT = 'json-compact'
+RECORDS_MAGIC = b"\x00RECORDS1\n" # Starts with a NUL, so it can never be JSON
+BLOCK_SIZE = 4096
+_FRAME_LENGTH = struct.Struct("<I")
+
+
+class RecordFormatError(ValueError):
+    """Raised for a damaged or truncated 'records' file."""
+
+
+def _dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def _loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encode_json(records):
+    return json.dumps(records, indent=4).encode('utf-8')
+
+def encode_compact_json(records):
+    return _dumps(records)
+
+def encode_records(records):
+    fields = list(records[0]) if records else []
+    field_set = set(fields)
+    values = operator.itemgetter(*fields) if len(fields) > 1 else lambda record: [record[f] for f in fields]
+    frames = [RECORDS_MAGIC]
+
+    def add_frame(payload):
+        frames.append(_FRAME_LENGTH.pack(len(payload)))
+        frames.append(payload)
+
+    add_frame(_dumps({"fields": fields, "count": len(records)}))
+    for start in range(0, len(records), BLOCK_SIZE):
+        block = [values(record) if record.keys() == field_set else record
+                 for record in records[start:start + BLOCK_SIZE]]
+        add_frame(_dumps(block))
+    return b"".join(frames)
+
+def _block_records(fields, block):
+    width = len(fields)
+    for r in block:
+        if r.__class__ is list and len(r) == width:
+            yield dict(zip(fields, r))
+        elif r.__class__ is dict:
+            yield r
+        else:
+            raise RecordFormatError("damaged record")
+
+def decode_records(data):
+    view = memoryview(data)
+    offset = len(RECORDS_MAGIC)
+    header = None
+    records = []
+    while offset < len(data):
+        if offset + _FRAME_LENGTH.size > len(data):
+            raise RecordFormatError("truncated frame header")
+        (length,) = _FRAME_LENGTH.unpack_from(data, offset)
+        offset += _FRAME_LENGTH.size
+        if offset + length > len(data):
+            raise RecordFormatError("truncated frame")
+        try:
+            payload = _loads(bytes(view[offset:offset + length]))
+        except ValueError:
+            raise RecordFormatError("damaged frame") from None
+        offset += length
+        if header is None:
+            header = payload
+            if (header.__class__ is not dict or header.get("fields").__class__ is not list
+                    or header.get("count").__class__ is not int):
+                raise RecordFormatError("damaged header")
+            fields = header["fields"]
+            continue
+        if payload.__class__ is not list:
+            raise RecordFormatError("damaged block")
+        records.extend(_block_records(fields, payload))
+    if header is None or len(records) != header["count"]:
+        raise RecordFormatError("file ends before its last record")
+    return records
+
+
+ENCODERS = {
+    'json': encode_json,
+    'json-compact': encode_compact_json,
+    'records': encode_records,
+}
+
+def detect_format(data):
+    """Names the format of a file's contents ('json' covers both JSON layouts)."""
+    return 'records' if data.startswith(RECORDS_MAGIC) else 'json'
+
+def decode(data):
+    """Turns file contents of any supported format back into a list of records."""
+    if detect_format(data) == 'records':
+        return decode_records(data)
+    return _loads(data) if data.strip() else []
+
+def file_format(path):
+    """The format a record file is in, or None if it doesn't exist."""
+    try:
+        with open(path, 'rb') as f:
+            return detect_format(f.read(len(RECORDS_MAGIC)))
+    except FileNotFoundError:
+        return None
+
+def encode(records, format=DEFAULT_FORMAT):
+    if format not in ENCODERS:
+        raise ValueError(f"Unknown record format {format!r} (expected one of {', '.join(ENCODERS)})")
+    return ENCODERS[format](records)
+
+
+def read_records(path):
+    """Reads a record file in whatever format it is in (raises on failure)."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    count_bytes('read', path, len(data))
+    return decode(data)
+
+def write_records(path, records, format=None):
+    """Writes 'records' atomically in 'format' (default: see above). Returns
+    the digest of what was written, as file_watcher.file_digest() would."""
+    if format is None:
+        format = RECORD_FORMAT or ('records' if file_format(path) == 'records' else DEFAULT_FORMAT)
+    data = encode(records, format)
+    atomic_write_bytes(path, data)
+    count_bytes('written', path, len(data))
+    return hashlib.sha1(data).digest()
+
+
+def migrate(path, format):
+    """Rewrites one record file in 'format'. Returns the format it was in."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    old_format = detect_format(data)
+    write_records(path, decode(data), format)
+    return old_format
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Convert record files (tasks.json, contacts_data.json) between formats.")
+    parser.add_argument("format", choices=list(ENCODERS))
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+    for path in args.paths:
+        old_format = migrate(path, args.format)
+        print(f"{path}: {old_format} -> {args.format}")
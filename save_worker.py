@@ -0,0 +1,154 @@
+import contextlib
+import os
+import queue
+import threading
+
+try:
+    import fcntl # Optional: without it (Windows) file_lock() does not lock
+except ImportError:
+    fcntl = None
+
+# --- Background Saving (shared by the Tk apps) ---
+
+def temp_path(path):
+    """A temp file name next to 'path' for writing it atomically, unique to
+    this process and thread so concurrent writers never share one."""
+    return f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+
+def atomic_write_bytes(path, data):
+    """Writes 'data' to a temp file next to 'path' and renames it into place,
+    so readers (and crashes) only ever see the old or the new file."""
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+@contextlib.contextmanager
+def file_lock(path, blocking=True):
+    """Holds an exclusive lock on '<path>.lock' for the with block, shared by
+    every process (and thread) that takes it. Yields True, or with
+    blocking=False yields False at once if someone else holds it."""
+    with open(path + ".lock", 'a') as f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+        yield True # Closing the file releases the lock
+
+
+class SaveWorker:
+    """Moves disk writes off the Tk main thread and coalesces bursts of edits.
+
+    mark_dirty() only arms a root.after() timer. When it fires (on the Tk
+    thread) snapshot() captures what needs saving, which should be cheap, and
+    the snapshot is queued for the worker thread. The worker calls
+    write(snapshots) with every snapshot queued since its last write, so
+    rapid edits end up as one write. Write errors come back to the Tk thread
+    as on_error(exception, snapshots).
+
+    The worker thread never calls Tk: the Tk thread may be blocked in flush()
+    waiting for it. Anything it needs done on the Tk thread (on_error, or
+    write() calling hand_back()) is queued and picked up by a root.after()
+    poll while saves are in flight, or by flush() itself.
+
+    With root=None (scripts, no event loop) mark_dirty() takes the snapshot
+    right away and on_error and hand_back() callbacks run on the worker
+    thread; call flush() before exiting."""
+
+    POLL_MS = 50 # How often the Tk thread checks for handed-back callbacks during a save
+
+    def __init__(self, root, snapshot, write, on_error=None, delay_ms=250, name="save-worker"):
+        self.root = root
+        self.snapshot = snapshot
+        self.write = write
+        self.on_error = on_error
+        self.delay_ms = delay_ms
+        self._timer = None
+        self._poll_job = None
+        self._queue = queue.Queue()
+        self._results = queue.Queue() # (callback, args) waiting for the Tk thread
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def mark_dirty(self):
+        """Call after every change; cheap, and never touches the disk."""
+        if self.root is None:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = self.root.after(self.delay_ms, self._dispatch)
+
+    def hand_back(self, callback, *args):
+        """Called from write() on the worker thread: runs callback(*args) on the
+        Tk thread (straight away when there is no root)."""
+        if self.root is None:
+            callback(*args)
+        else:
+            self._results.put((callback, args))
+
+    def is_idle(self):
+        """True when every change marked so far has been written and what the
+        writes handed back (e.g. a failed save to requeue) has run."""
+        return self._timer is None and self._queue.unfinished_tasks == 0 and self._results.empty()
+
+    def flush(self):
+        """Writes anything still pending and waits for the worker to finish.
+        Meant for shutdown (e.g. the window's close button). Callbacks the
+        worker handed back run here too; if one marks the data dirty again
+        (a save deferred to merge another window's changes) that is written
+        before returning."""
+        while True:
+            if self._timer is not None:
+                self.root.after_cancel(self._timer)
+                self._dispatch()
+            self._queue.join()
+            self._deliver()
+            if self._timer is None:
+                return
+
+    def _dispatch(self):
+        self._timer = None
+        self._queue.put(self.snapshot())
+        if self.root is not None and self._poll_job is None:
+            self._poll_job = self.root.after(self.POLL_MS, self._poll)
+
+    def _poll(self):
+        """Tk thread: runs handed-back callbacks until the queued saves are done."""
+        self._poll_job = None
+        busy = self._queue.unfinished_tasks > 0 # Checked first: a finished write has queued its callbacks
+        self._deliver()
+        if busy:
+            self._poll_job = self.root.after(self.POLL_MS, self._poll)
+
+    def _deliver(self):
+        while True:
+            try:
+                callback, args = self._results.get_nowait()
+            except queue.Empty:
+                return
+            callback(*args)
+
+    def _run(self):
+        while True:
+            snapshots = [self._queue.get()]
+            # Anything queued while the last write ran is written in this same pass
+            while True:
+                try:
+                    snapshots.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write(snapshots)
+            except Exception as e:
+                self._report_error(e, snapshots)
+            finally:
+                for _ in snapshots:
+                    self._queue.task_done()
+
+    def _report_error(self, error, snapshots):
+        print(f"Warning: Background save failed - {error}")
+        if self.on_error is not None:
+            self.hand_back(self.on_error, error, snapshots)
@@ -0,0 +1,700 @@
+import asyncio
+import functools
+import json
+import os
+import sys
+from collections import deque
+
+import contact_store
+from contact_store import CONTACT_FIELDS, Contact, contact_validation_error, new_contact_id
+from file_watcher import file_digest, file_signature
+from save_worker import SaveWorker, file_lock
+from task_store import (REPEAT_CHOICES, TASKS_FILE, TaskOrder, TaskSearchIndex, assign_task_ids, filter_tasks,
+                        follow_up_task, merge_tasks, new_task, parse_timestamp, read_tasks_with_digest,
+                        timestamp_now, write_tasks)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- Contact and Task Service ---
+# Serves the contact book and the to-do list to local scripts and tools over
+# 127.0.0.1 or a Unix socket, one JSON object per line each way:
+#   {"seq": 1, "op": "contacts.get", "id": 42}       ->  {"seq": 1, "result": {...}}
+#   {"seq": 2, "batch": [{"op": ...}, {"op": ...}]}  ->  {"seq": 2, "results": [{"result": ...}, {"error": "..."}]}
+# 'seq' is optional and only echoed back. Clients may pipeline (send more
+# requests before the replies arrive); each connection is answered in
+# request order, so a client reads its own writes.
+#
+# Reads are answered straight from the book and task list in memory. Writes
+# go to one writer task, which applies everything queued since its last pass
+# between two reads (readers never see half an edit), saves each store once
+# for the whole pass and then replies. A batch holding any write runs in the
+# writer as a unit, but it is not a transaction: each request succeeds or
+# fails on its own, and writes before a failed one stay applied. Saves by the
+# windows and command lines on the same files are merged in the same way the
+# windows merge each other's.
+#
+# A write whose save fails is kept, as in the windows: its reply carries the
+# result plus "pending": "<why it isn't saved yet>", and the save is retried
+# every SYNC_INTERVAL until it succeeds.
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+SYNC_INTERVAL = 1.0 # Seconds between checks for saves by other processes
+LIST_LIMIT = 100 # Rows a list or search returns when the request gives no limit
+MAX_LINE_BYTES = 1 << 20 # Longest request accepted
+MAX_BACKLOG = 10000 # Requests buffered per connection (behind a write) before it stops being read
+MAX_REPLY_BYTES = 1 << 26 # Longest reply the client accepts
+
+class RequestError(ValueError):
+    """A request the server could not carry out (bad arguments, unknown id...)."""
+
+
+def _dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+def _loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def _encode_reply(seq, batch, results):
+    reply = {"seq": seq, "results": results} if batch else dict(results[0], seq=seq)
+    return _dumps(reply) + b"\n"
+
+_REQUIRED = object()
+
+def _arg(request, name, kind=str, default=_REQUIRED):
+    """request[name], checked to be a 'kind'; 'default' when it is missing or null."""
+    value = request.get(name)
+    if value is None:
+        if default is _REQUIRED:
+            raise RequestError(f"Missing '{name}'")
+        return default
+    if not isinstance(value, kind) or (isinstance(value, bool) and kind is not bool):
+        raise RequestError(f"'{name}' must be a {'number' if kind is int else 'string'}")
+    return value
+
+def _page(request):
+    offset, limit = _arg(request, 'offset', int, 0), _arg(request, 'limit', int, LIST_LIMIT)
+    if offset < 0 or limit < 0:
+        raise RequestError("'offset' and 'limit' cannot be negative")
+    return offset, limit
+
+
+class StoreServer:
+    """Owns the contact book and task list of the current directory and
+    answers requests for them (see above). Only one per process: the
+    contact book lives in contact_store's module state."""
+
+    READ_OPS = {
+        "ping": "ping",
+        "contacts.count": "count_contacts",
+        "contacts.get": "get_contact",
+        "contacts.find": "find_contact",
+        "contacts.list": "list_contacts",
+        "contacts.search": "search_contacts",
+        "tasks.count": "count_tasks",
+        "tasks.get": "get_task",
+        "tasks.list": "search_tasks",
+        "tasks.search": "search_tasks",
+    }
+    WRITE_OPS = {
+        "contacts.add": "add_contact",
+        "contacts.update": "update_contact",
+        "contacts.delete": "delete_contact",
+        "tasks.add": "add_task",
+        "tasks.update": "update_task",
+        "tasks.complete": "complete_task",
+        "tasks.delete": "delete_task",
+    }
+
+    def __init__(self, sync_interval=SYNC_INTERVAL):
+        self.sync_interval = sync_interval
+        self._read_ops = {op: getattr(self, name) for op, name in self.READ_OPS.items()}
+        self._write_ops = {op: getattr(self, name) for op, name in self.WRITE_OPS.items()}
+        self._writes = None # Queue of (requests, future, encode reply) for the writer
+        self._save_error = None # Set (on the loop) when a save of the current pass failed
+        self._unsaved = set() # 'contacts' and/or 'tasks' whose last save failed (retried)
+        self._contact_conflict = False # 'json' mode: another process saved first
+        self._task_conflict = False # Another process saved tasks.json first
+        self._signatures = None # Data files as of the last sync
+
+    # --- Opening ---
+
+    def _open(self, loop):
+        """Loads both stores. Save worker callbacks come back to the loop thread."""
+        def on_contact_save_error(error, snapshots):
+            loop.call_soon_threadsafe(self._contacts_not_saved, error, snapshots)
+        def on_contact_conflict():
+            loop.call_soon_threadsafe(setattr, self, '_contact_conflict', True)
+        contact_store.open_book(on_save_error=on_contact_save_error, on_save_conflict=on_contact_conflict)
+        # Like the todo window's: each snapshot remembers which version of tasks.json it is based on
+        self.task_saver = SaveWorker(None, snapshot=lambda: (self._tasks_digest, [dict(task) for task in self.tasks]),
+                                     write=self._write_tasks,
+                                     on_error=lambda error, snapshots: loop.call_soon_threadsafe(self._tasks_not_saved, error),
+                                     name="task-save-worker")
+        self._on_task_conflict = lambda: loop.call_soon_threadsafe(setattr, self, '_task_conflict', True)
+        self._load_tasks()
+        self._signatures = self._storage_signatures()
+
+    def _load_tasks(self):
+        self._tasks_signature = file_signature(TASKS_FILE) # Taken first: a save landing meanwhile is synced later
+        tasks, self._tasks_digest = read_tasks_with_digest()
+        missing_ids = assign_task_ids(tasks)
+        self._disk_tasks = {task['id']: dict(task) for task in tasks} # What tasks.json holds (merge base)
+        self.tasks = tasks
+        self.task_order = TaskOrder(tasks)
+        self.task_index = TaskSearchIndex(tasks)
+        self._tasks_by_id = {task['id']: task for task in tasks}
+        if missing_ids:
+            self.task_saver.mark_dirty()
+
+    def _write_tasks(self, snapshots):
+        """Task save worker: writes the newest snapshot (older ones are
+        superseded), unless another process saved since it was taken. Then
+        the writer merges that save in first (see _save)."""
+        base_digest, tasks = snapshots[-1]
+        with file_lock(TASKS_FILE): # No other process saves between our check and noting what we wrote
+            if file_digest(TASKS_FILE) != base_digest:
+                self.task_saver.hand_back(self._on_task_conflict)
+                return
+            self._tasks_digest = write_tasks(tasks)
+            self._tasks_signature = file_signature(TASKS_FILE)
+        self._disk_tasks = {task['id']: task for task in tasks}
+
+    def _contacts_not_saved(self, error, snapshots):
+        contact_store.requeue_failed_entries(snapshots) # Retried with the next save
+        self._unsaved.add('contacts')
+        self._save_error = error
+
+    def _tasks_not_saved(self, error):
+        self._unsaved.add('tasks') # The next save writes the whole list again
+        self._save_error = error
+
+    # --- Syncing with Other Processes ---
+
+    def _storage_signatures(self):
+        return [file_signature(path) for path in contact_store.sync_watch_paths() + [TASKS_FILE]]
+
+    def _sync(self):
+        """Merges in what other processes saved (writer only, between passes)."""
+        signatures = self._storage_signatures()
+        if signatures == self._signatures:
+            return
+        self._signatures = signatures
+        contact_store.sync_from_storage()
+        if file_signature(TASKS_FILE) != self._tasks_signature:
+            self._sync_tasks()
+
+    def _sync_tasks(self):
+        """Merges another process's save of tasks.json into our task list."""
+        self._tasks_signature = file_signature(TASKS_FILE) # Taken first: a save landing meanwhile is synced later
+        try:
+            theirs, digest = read_tasks_with_digest()
+        except (ValueError, IOError) as e:
+            print(f"Warning: Could not read changed {TASKS_FILE} - {e}") # Retried on the next change
+            return
+        if digest == self._tasks_digest:
+            return
+        assign_task_ids(theirs) # Saved by a version without task ids
+        base, self._disk_tasks = self._disk_tasks, {task['id']: task for task in theirs}
+        self._tasks_digest = digest
+        added, updated, removed = merge_tasks(base, self._disk_tasks, self._tasks_by_id)
+        for their_task in added:
+            task = dict(their_task)
+            self.task_order.insert(task)
+            self.task_index.add(task)
+            self._tasks_by_id[task['id']] = task
+        for our_task, their_task in updated:
+            self.task_order.pop(self.task_order.index_of(our_task))
+            old_description = our_task['description']
+            our_task.clear()
+            our_task.update(their_task)
+            self.task_order.insert(our_task)
+            self.task_index.update(our_task, old_description)
+        for our_task in removed:
+            self.task_order.pop(self.task_order.index_of(our_task))
+            self.task_index.remove(our_task)
+            del self._tasks_by_id[our_task['id']]
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            if self._writes.empty() and (self._unsaved or self._storage_signatures() != self._signatures):
+                self._writes.put_nowait(([], None, None)) # Wakes the writer, which syncs (and retries saves) first
+
+    # --- Requests ---
+
+    def handle_line(self, line):
+        """Answers one request line. Returns the encoded reply, or for writes
+        a future that the writer resolves with it."""
+        try:
+            message = _loads(line)
+        except ValueError:
+            return _encode_reply(None, False, [{"error": "Malformed JSON"}])
+        if not isinstance(message, dict):
+            return _encode_reply(None, False, [{"error": "A request must be a JSON object"}])
+        batch = 'batch' in message
+        requests = message['batch'] if batch else [message]
+        if not isinstance(requests, list) or not requests:
+            return _encode_reply(message.get('seq'), False, [{"error": "'batch' must be a non-empty list"}])
+        encode = functools.partial(_encode_reply, message.get('seq'), batch)
+        if not any(self._writes_in(requests)):
+            return encode([self._run(request) for request in requests])
+        future = asyncio.get_running_loop().create_future()
+        self._writes.put_nowait((requests, future, encode))
+        return future
+
+    def _run(self, request, writer=False):
+        if not isinstance(request, dict):
+            return {"error": "A request must be a JSON object"}
+        op = request.get('op')
+        handler = self._read_ops.get(op) or (self._write_ops.get(op) if writer else None)
+        if handler is None:
+            return {"error": f"Unknown operation {op!r}"}
+        try:
+            return {"result": handler(request)}
+        except RequestError as e:
+            return {"error": str(e)}
+        except Exception as e:
+            print(f"Warning: {op} failed - {e}")
+            return {"error": f"Internal error: {e}"}
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [await self._writes.get()]
+            while not self._writes.empty(): # Everything queued meanwhile shares this pass and its save
+                jobs.append(self._writes.get_nowait())
+            try:
+                self._sync()
+            except Exception as e:
+                print(f"Warning: Could not merge changes from other processes - {e}") # Retried next pass
+            self._changes = {'added': [], 'updated': [], 'deleted': [], 'tasks': False}
+            replies = [(future, encode, requests, [self._run(request, writer=True) for request in requests])
+                       for requests, future, encode in jobs]
+            self._save_error = None
+            try:
+                await self._save(loop)
+            except Exception as e:
+                print(f"Warning: Could not save - {e}")
+                self._save_error = e
+                changes = self._changes
+                if changes['added'] or changes['updated'] or changes['deleted']:
+                    self._unsaved.add('contacts')
+                if changes['tasks']:
+                    self._unsaved.add('tasks')
+            for future, encode, requests, results in replies:
+                if future is None or future.cancelled():
+                    continue
+                if self._save_error is not None: # Kept in memory; the save is retried (see _watch)
+                    pending = f"Not saved yet, retrying: {self._save_error}"
+                    results = [dict(result, pending=pending) if "result" in result and is_write else result
+                               for result, is_write in zip(results, self._writes_in(requests))]
+                future.set_result(encode(results))
+
+    def _writes_in(self, requests):
+        return [isinstance(request, dict) and request.get('op') in self._write_ops for request in requests]
+
+    async def _save(self, loop):
+        """Saves what the pass changed (and retries saves that failed before),
+        then waits until it is on disk."""
+        changes = self._changes
+        retry, self._unsaved = self._unsaved, set()
+        contact_store.persist_add_many(changes['added'], contact_store.contacts)
+        contact_store.persist_changes(contact_store.contacts, changes['updated'], changes['deleted'])
+        if 'contacts' in retry:
+            contact_store.save_worker.mark_dirty()
+        if changes['tasks'] or 'tasks' in retry:
+            self.task_saver.mark_dirty()
+        await loop.run_in_executor(None, self._wait_for_saves)
+        while self._contact_conflict or self._task_conflict: # Another process saved first: merge, then write ours
+            if self._contact_conflict: # 'json' mode
+                self._contact_conflict = False
+                contact_store.sync_then_save()
+            if self._task_conflict:
+                self._task_conflict = False
+                self._sync_tasks()
+                self.task_saver.mark_dirty()
+            await loop.run_in_executor(None, self._wait_for_saves)
+
+    def _wait_for_saves(self):
+        contact_store.save_worker.flush()
+        self.task_saver.flush()
+
+    # --- Contacts ---
+
+    def ping(self, request):
+        return "pong"
+
+    def _contact(self, request):
+        contact_id = _arg(request, 'id', int)
+        contact = contact_store.contacts.get(contact_id)
+        if contact is None:
+            raise RequestError(f"No contact with id {contact_id}")
+        return contact
+
+    def _check_contact(self, contact):
+        error = contact_validation_error(contact)
+        if error is None and contact_store.contacts.name_taken(contact.name, exclude_id=contact.id):
+            error = f"A contact named '{contact.name}' already exists."
+        if error is not None:
+            raise RequestError(error)
+
+    def count_contacts(self, request):
+        return len(contact_store.contacts)
+
+    def get_contact(self, request):
+        contact = contact_store.contacts.get(_arg(request, 'id', int))
+        return None if contact is None else contact.to_dict()
+
+    def find_contact(self, request):
+        contact = contact_store.contacts.find_by_name(_arg(request, 'name'))
+        return None if contact is None else contact.to_dict()
+
+    def list_contacts(self, request):
+        offset, limit = _page(request)
+        return [contact.to_dict() for contact in contact_store.contacts[offset:offset + limit]]
+
+    def search_contacts(self, request):
+        offset, limit = _page(request)
+        found = contact_store.search_index.search(_arg(request, 'term'), limit=offset + limit)
+        return [contact.to_dict() for contact in found[offset:]]
+
+    def add_contact(self, request):
+        fields = {field: _arg(request, field, str, "" if field in ("email", "address") else _REQUIRED).strip()
+                  for field in CONTACT_FIELDS}
+        contact = Contact(new_contact_id(), **fields)
+        self._check_contact(contact)
+        contact_store.contacts.add(contact)
+        contact_store.search_index.add(contact)
+        self._changes['added'].append(contact)
+        return contact.to_dict()
+
+    def update_contact(self, request):
+        old = self._contact(request)
+        fields = {field: _arg(request, field, str, getattr(old, field)).strip() for field in CONTACT_FIELDS}
+        contact = Contact(old.id, **fields)
+        self._check_contact(contact)
+        contact_store.contacts.replace(contact)
+        contact_store.search_index.update(old, contact)
+        self._changes['updated'].append(contact)
+        return contact.to_dict()
+
+    def delete_contact(self, request):
+        contact = self._contact(request)
+        contact_store.contacts.remove(contact.id)
+        contact_store.search_index.remove(contact)
+        self._changes['deleted'].append(contact)
+        return contact.to_dict()
+
+    # --- Tasks ---
+
+    def _task(self, request):
+        task_id = _arg(request, 'id')
+        task = self._tasks_by_id.get(task_id)
+        if task is None:
+            raise RequestError(f"No task with id {task_id!r}")
+        return task
+
+    def count_tasks(self, request):
+        status = _arg(request, 'status', str, "all")
+        if status == "all":
+            return len(self.tasks)
+        if status not in ("pending", "completed"):
+            raise RequestError("'status' must be all, pending or completed")
+        lo, hi = self.task_order.added_range(status == "completed")
+        return hi - lo
+
+    def get_task(self, request):
+        task = self._tasks_by_id.get(_arg(request, 'id'))
+        return None if task is None else dict(task)
+
+    def search_tasks(self, request):
+        offset, limit = _page(request)
+        status = _arg(request, 'status', str, "all")
+        if status not in ("all", "pending", "completed"):
+            raise RequestError("'status' must be all, pending or completed")
+        tasks = filter_tasks(self.task_order, self.task_index, _arg(request, 'text', str, ""), status)
+        return [dict(task) for task in tasks[offset:offset + limit]]
+
+    def add_task(self, request):
+        description = _arg(request, 'description').strip()
+        if not description:
+            raise RequestError("Task description cannot be empty.")
+        task = new_task(description)
+        due_on, repeat = _arg(request, 'due_on', str, None), _arg(request, 'repeat', str, None)
+        if due_on is not None:
+            task['due_ts'] = parse_timestamp(due_on)
+            if task['due_ts'] is None:
+                raise RequestError("'due_on' must look like 2024-05-31 17:00")
+            task['due_on'] = due_on
+        if repeat is not None and (repeat not in REPEAT_CHOICES or due_on is None):
+            raise RequestError(f"'repeat' must be one of {', '.join(REPEAT_CHOICES)}, with a 'due_on'")
+        task['repeat'] = repeat
+        task['repeat_anchor_ts'] = task['due_ts'] if repeat else None
+        self.task_order.insert(task)
+        self.task_index.add(task)
+        self._tasks_by_id[task['id']] = task
+        self._changes['tasks'] = True
+        return dict(task)
+
+    def update_task(self, request):
+        task = self._task(request)
+        description = _arg(request, 'description').strip()
+        if not description:
+            raise RequestError("Task description cannot be empty.")
+        old_description, task['description'] = task['description'], description
+        self.task_index.update(task, old_description)
+        self._changes['tasks'] = True
+        return dict(task)
+
+    def complete_task(self, request):
+        """Returns {"task": ..., "follow_up": the next occurrence of a recurring task, or null}."""
+        task = self._task(request)
+        follow_up = None
+        if task['status'] != 'completed':
+            self.task_order.pop(self.task_order.index_of(task)) # Completing moves it to the other partition
+            task['status'] = 'completed'
+            task['completed_on'], task['completed_ts'] = timestamp_now()
+            self.task_order.insert(task)
+            if task.get('repeat') and task.get('due_ts') is not None:
+                follow_up = follow_up_task(task, task['completed_on'], task['completed_ts'])
+                self.task_order.insert(follow_up)
+                self.task_index.add(follow_up)
+                self._tasks_by_id[follow_up['id']] = follow_up
+            self._changes['tasks'] = True
+        return {"task": dict(task), "follow_up": None if follow_up is None else dict(follow_up)}
+
+    def delete_task(self, request):
+        task = self._task(request)
+        self.task_order.pop(self.task_order.index_of(task))
+        self.task_index.remove(task)
+        del self._tasks_by_id[task['id']]
+        self._changes['tasks'] = True
+        return dict(task)
+
+    # --- Serving ---
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None, ready=None):
+        """Serves until cancelled, then writes anything still pending. 'path'
+        selects a Unix socket instead of host:port; 'ready' (an asyncio.Event)
+        is set once clients can connect."""
+        loop = asyncio.get_running_loop()
+        self._open(loop)
+        self._writes = asyncio.Queue()
+        tasks = [asyncio.create_task(self._writer()), asyncio.create_task(self._watch())]
+        try:
+            if path is not None:
+                # The data is private to this user: the socket is created without
+                # group/other access, rather than opened up until a chmod
+                old_umask = os.umask(0o177)
+                try:
+                    server = await loop.create_unix_server(lambda: _Connection(self), path)
+                finally:
+                    os.umask(old_umask)
+            else:
+                server = await loop.create_server(lambda: _Connection(self), host, port)
+            async with server:
+                if ready is not None:
+                    ready.set()
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            contact_store.flush_storage()
+            self.task_saver.flush()
+
+
+class _Connection(asyncio.Protocol):
+    """One client. Request lines are answered in order; lines that arrive
+    while a write is with the writer wait in a backlog behind it."""
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self._partial = b""
+        self._backlog = deque()
+        self._waiting = False # A write reply is pending
+        self._pause_reasons = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.transport = None # Writes already queued still happen; their replies are dropped
+
+    def data_received(self, data):
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        if len(self._partial) > MAX_LINE_BYTES:
+            self.transport.write(_encode_reply(None, False, [{"error": "Request too long"}]))
+            self.transport.close()
+            return
+        self._backlog.extend(lines)
+        if not self._waiting:
+            self._answer()
+        if len(self._backlog) > MAX_BACKLOG:
+            self._pause('backlog')
+
+    def _answer(self):
+        replies = []
+        while self._backlog:
+            line = self._backlog.popleft()
+            if not line.strip():
+                continue
+            reply = self.server.handle_line(line)
+            if isinstance(reply, bytes):
+                replies.append(reply)
+                continue
+            self._waiting = True
+            reply.add_done_callback(self._write_done)
+            break
+        if replies and self.transport is not None:
+            self.transport.write(b"".join(replies)) # One write for everything answered in this pass
+        if len(self._backlog) <= MAX_BACKLOG // 2:
+            self._resume('backlog')
+
+    def _write_done(self, future):
+        self._waiting = False
+        if self.transport is None or future.cancelled():
+            return
+        self.transport.write(future.result())
+        self._answer()
+
+    # A client that stops reading its replies is not read from either
+    def pause_writing(self):
+        self._pause('replies')
+
+    def resume_writing(self):
+        self._resume('replies')
+
+    def _pause(self, reason):
+        if not self._pause_reasons and self.transport is not None:
+            self.transport.pause_reading()
+        self._pause_reasons.add(reason)
+
+    def _resume(self, reason):
+        if reason in self._pause_reasons:
+            self._pause_reasons.discard(reason)
+            if not self._pause_reasons and self.transport is not None:
+                self.transport.resume_reading()
+
+
+# --- Client ---
+
+class StoreClient:
+    """Connection to a StoreServer. Calls may overlap (asyncio.gather, many
+    tasks): they are pipelined on the one connection.
+
+        client = await StoreClient.connect()
+        found = await client.call("contacts.search", term="smi")
+        results = await client.batch([{"op": "tasks.get", "id": i} for i in ids])
+    """
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._next_seq = 0
+        self._pending = {} # seq -> future
+        self.unsaved = None # The last reply's "pending" note: a write was kept but is not on disk yet
+        self._reading = asyncio.create_task(self._read_replies())
+
+    @classmethod
+    async def connect(cls, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        if path is not None:
+            reader, writer = await asyncio.open_unix_connection(path, limit=MAX_REPLY_BYTES)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=MAX_REPLY_BYTES)
+        return cls(reader, writer)
+
+    async def _send(self, message):
+        self._next_seq += 1
+        message['seq'] = self._next_seq
+        future = self._pending[self._next_seq] = asyncio.get_running_loop().create_future()
+        self._writer.write(_dumps(message) + b"\n")
+        await self._writer.drain()
+        return await future
+
+    async def _read_replies(self):
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                reply = _loads(line)
+                future = self._pending.pop(reply.get('seq'), None)
+                if future is not None and not future.cancelled():
+                    future.set_result(reply)
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Lost the connection to the store server"))
+            self._pending.clear()
+
+    async def call(self, op, **args):
+        """Runs one request; raises RequestError if the server refused it."""
+        reply = await self._send(dict(args, op=op))
+        if 'error' in reply:
+            raise RequestError(reply['error'])
+        self.unsaved = reply.get('pending')
+        return reply['result']
+
+    async def batch(self, requests):
+        """Runs a list of requests in one round trip. Returns their results in
+        order, with a RequestError in place of each one that failed. Not a
+        transaction: the ones that succeeded stay done."""
+        reply = await self._send({"batch": list(requests)})
+        if 'error' in reply:
+            raise RequestError(reply['error'])
+        self.unsaved = next((result['pending'] for result in reply['results'] if 'pending' in result), None)
+        return [RequestError(result['error']) if 'error' in result else result['result']
+                for result in reply['results']]
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+        self._reading.cancel()
+
+# --- Command Line ---
+
+def main(argv=None):
+    import argparse
+    connection = argparse.ArgumentParser(add_help=False)
+    connection.add_argument("--host", default=DEFAULT_HOST)
+    connection.add_argument("--port", type=int, default=DEFAULT_PORT)
+    connection.add_argument("--unix", metavar="PATH", help="use a Unix socket instead of host:port")
+    parser = argparse.ArgumentParser(description="Share the contact book and to-do list with local clients.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("serve", parents=[connection], help="serve the data files in the current directory")
+    call = commands.add_parser("call", parents=[connection], help="send one request and print the result")
+    call.add_argument("op", help=f"one of: {', '.join({**StoreServer.READ_OPS, **StoreServer.WRITE_OPS})}")
+    call.add_argument("arguments", nargs="?", default="{}", help='JSON object, e.g. \'{"term": "smi"}\'')
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            asyncio.run(StoreServer().serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    async def run_call():
+        client = await StoreClient.connect(args.host, args.port, args.unix)
+        try:
+            result = await client.call(args.op, **json.loads(args.arguments))
+            if client.unsaved is not None:
+                print(f"Warning: {client.unsaved}", file=sys.stderr)
+            return result
+        finally:
+            await client.close()
+    try:
+        print(json.dumps(asyncio.run(run_call()), indent=2))
+    except (RequestError, OSError) as e:
+        parser.exit(1, f"{e}\n")
+
+if __name__ == "__main__":
+    main()
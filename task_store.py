@@ -0,0 +1,485 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from bisect import bisect_left, bisect_right, insort
+from record_codecs import decode, write_records
+from save_worker import file_lock, temp_path
+from instrumentation import count_bytes, timed
+
+# --- Task Store ---
+# The to-do app's data: the task file and its archive, ordering, search and
+# due dates. Nothing here imports tkinter, so scripts and batch jobs can use
+# it directly (see the command line at the bottom); todo_gui.py is the window.
+
+TASKS_FILE = "tasks.json"
+# Completed tasks older than this move out of tasks.json into monthly archive segments
+ARCHIVE_DIR = "tasks_archive"
+ARCHIVE_AFTER_DAYS = 30
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M"
+REPEAT_CHOICES = ("daily", "weekly", "monthly")
+
+# --- Task Records ---
+
+def parse_timestamp(text):
+    """Converts a TIMESTAMP_FORMAT string to integer epoch seconds (local
+    time), or None for missing/legacy values such as 'unknown'."""
+    try:
+        return int(datetime.datetime.strptime(text, TIMESTAMP_FORMAT).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+def timestamp_now():
+    """Returns the current time as (display text, epoch seconds)."""
+    text = datetime.datetime.now().strftime(TIMESTAMP_FORMAT)
+    return text, parse_timestamp(text)
+
+def format_timestamp(ts):
+    """Epoch seconds back to TIMESTAMP_FORMAT text (None stays None)."""
+    return None if ts is None else datetime.datetime.fromtimestamp(ts).strftime(TIMESTAMP_FORMAT)
+
+def new_task_id():
+    return uuid.uuid4().hex
+
+def new_task(description):
+    """A pending task added now."""
+    added_on, added_ts = timestamp_now()
+    return {
+        "id": new_task_id(),
+        "description": description,
+        "status": "pending",
+        "added_on": added_on,
+        "completed_on": None,
+        "added_ts": added_ts,
+        "completed_ts": None,
+        "due_on": None,
+        "due_ts": None,
+        "repeat": None,
+        "repeat_anchor_ts": None # The due time the repeats are counted from (see follow_up_task)
+    }
+
+def assign_task_ids(tasks):
+    """Gives tasks saved before tasks had ids one. Returns those tasks."""
+    missing_ids = [task for task in tasks if 'id' not in task]
+    for task in missing_ids:
+        task['id'] = new_task_id()
+    return missing_ids
+
+def read_tasks():
+    """Reads and normalizes the task file (raises on failure)."""
+    return read_tasks_with_digest()[0]
+
+@timed('tasks.load')
+def read_tasks_with_digest():
+    """read_tasks() plus the file_digest() of the very bytes it read (None if
+    there is no file), so a save landing in between can't be mistaken for it."""
+    if not os.path.exists(TASKS_FILE):
+        return [], None
+    with open(TASKS_FILE, 'rb') as f:
+        data = f.read()
+    count_bytes('read', TASKS_FILE, len(data))
+    tasks = decode(data)
+    # Ensure tasks have required keys, provide defaults if missing
+    for task in tasks:
+        task.setdefault('status', 'pending')
+        task.setdefault('added_on', 'unknown')
+        task.setdefault('completed_on', None)
+        # Integer sort keys; older files only have the display strings
+        if 'added_ts' not in task:
+            task['added_ts'] = parse_timestamp(task['added_on'])
+        if 'completed_ts' not in task:
+            task['completed_ts'] = parse_timestamp(task['completed_on'])
+        task.setdefault('due_on', None)
+        task.setdefault('due_ts', parse_timestamp(task['due_on']))
+        task.setdefault('repeat', None)
+        task.setdefault('repeat_anchor_ts', None)
+    return tasks, hashlib.sha1(data).digest()
+
+@timed('tasks.save')
+def write_tasks(tasks):
+    """Writes the task list to the task file atomically (raises on failure).
+    Returns the file_digest() of what was written. Processes sharing the
+    file hold file_lock(TASKS_FILE) from reading or checking it to writing."""
+    return write_records(TASKS_FILE, tasks)
+
+def merge_tasks(base, theirs, ours):
+    """Three-way merge with another process's save of the task file. 'base'
+    is what the file held when we last read or wrote it, 'theirs' what it
+    holds now, 'ours' our current tasks (all dicts of id -> task). Returns
+    (added, updated, removed): tasks added elsewhere, (our task, their
+    version) pairs for tasks changed elsewhere, and our tasks deleted (or
+    archived) elsewhere. A task we changed too is left out: ours wins and
+    goes out with our next save."""
+    added, updated, removed = [], [], []
+    for task_id, their_task in theirs.items():
+        base_task = base.get(task_id)
+        our_task = ours.get(task_id)
+        if their_task == base_task or their_task == our_task:
+            continue
+        if our_task is None:
+            if base_task is None:
+                added.append(their_task)
+        elif our_task == base_task:
+            updated.append((our_task, their_task))
+    for task_id in base.keys() - theirs.keys():
+        our_task = ours.get(task_id)
+        if our_task is not None and our_task == base[task_id]:
+            removed.append(our_task)
+    return added, updated, removed
+
+# --- Task Archive (cold storage) ---
+# tasks.json only holds pending and recently completed tasks. Older completed
+# tasks live in gzip-compressed segments, one per month they were completed in
+# (tasks_archive/2024-05.json.gz), which are only read when history is browsed.
+
+def archive_month(task):
+    """Returns the 'YYYY-MM' segment a completed task belongs in, or None if
+    its completion date can't be read (such tasks stay in the hot file)."""
+    try:
+        completed = datetime.datetime.fromtimestamp(task['completed_ts'])
+    except (KeyError, TypeError):
+        return None
+    return completed.strftime("%Y-%m")
+
+def archive_segment_path(month):
+    return os.path.join(ARCHIVE_DIR, f"{month}.json.gz")
+
+def list_archive_months():
+    """Lists the archived months, newest first, without opening any segment."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    suffix = ".json.gz"
+    return sorted((name[:-len(suffix)] for name in os.listdir(ARCHIVE_DIR) if name.endswith(suffix)),
+                  reverse=True)
+
+def load_archive_segment(month):
+    """Reads one month of archived tasks (raises on failure)."""
+    path = archive_segment_path(month)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        data = f.read()
+    count_bytes('read', path, len(data))
+    return json.loads(gzip.decompress(data))
+
+def write_archive_segment(month, tasks):
+    """Writes a segment atomically, like atomic_write_bytes but compressed."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = archive_segment_path(month)
+    tmp_path = temp_path(path)
+    with open(tmp_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            f.write(json.dumps(tasks, separators=(',', ':')).encode('utf-8'))
+        raw.flush()
+        os.fsync(raw.fileno())
+        count_bytes('written', path, raw.tell())
+    os.replace(tmp_path, path)
+
+def archive_old_tasks(tasks, now=None):
+    """Moves completed tasks older than ARCHIVE_AFTER_DAYS into their archive
+    segments and returns (hot_tasks, archived_count).
+
+    Segments are written before the caller rewrites tasks.json, so a crash in
+    between can only leave a task in both places; tasks already present in a
+    segment are skipped, which makes the next roll-over clean that up."""
+    now = now or datetime.datetime.now()
+    cutoff = (now - datetime.timedelta(days=ARCHIVE_AFTER_DAYS)).timestamp()
+    hot, cold_by_month = [], {}
+    for task in tasks:
+        month = archive_month(task) if task.get('status') == 'completed' else None
+        if month is not None and task['completed_ts'] < cutoff:
+            cold_by_month.setdefault(month, []).append(task)
+        else:
+            hot.append(task)
+    for month, cold in cold_by_month.items():
+        segment = load_archive_segment(month)
+        seen = {json.dumps(task, sort_keys=True) for task in segment}
+        segment.extend(task for task in cold if json.dumps(task, sort_keys=True) not in seen)
+        write_archive_segment(month, segment)
+    return hot, len(tasks) - len(hot)
+
+# --- Task Ordering ---
+
+class TaskOrder:
+    """Keeps a task list in display order: pending tasks first, then completed
+    ones, each partition ordered by time added.
+
+    A sorted list of (completed, added_ts, seq) keys runs parallel to the
+    tasks, so adding or re-filing a task is a bisect rather than a full sort.
+    Tasks without a parseable date (legacy 'unknown') sort as the oldest; seq
+    keeps ties in the order they were filed."""
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.rebuild()
+
+    def _key(self, task):
+        self._seq += 1
+        key = (task.get('status') == 'completed', task.get('added_ts') or 0, self._seq)
+        self._key_of[id(task)] = key
+        return key
+
+    def rebuild(self):
+        """Re-sorts everything; only needed when tasks change behind our back."""
+        self._seq = 0
+        self._key_of = {}
+        keyed = sorted((self._key(task), task) for task in self.tasks)
+        self._keys = [key for key, _ in keyed]
+        self.tasks[:] = [task for _, task in keyed]
+
+    def insert(self, task):
+        """Files a task in its place and returns its index."""
+        key = self._key(task)
+        index = bisect_right(self._keys, key)
+        self._keys.insert(index, key)
+        self.tasks.insert(index, task)
+        return index
+
+    def pop(self, index):
+        """Removes and returns the task at index."""
+        del self._keys[index]
+        task = self.tasks.pop(index)
+        del self._key_of[id(task)]
+        return task
+
+    def index_of(self, task):
+        return bisect_left(self._keys, self._key_of[id(task)])
+
+    def sort_key(self, task):
+        return self._key_of[id(task)]
+
+    def added_range(self, completed, start_ts=None, end_ts=None):
+        """Returns the (lo, hi) slice of self.tasks holding the pending (or
+        completed) tasks added in [start_ts, end_ts)."""
+        lo = bisect_left(self._keys, (completed, float('-inf') if start_ts is None else start_ts))
+        hi = bisect_left(self._keys, (completed, float('inf') if end_ts is None else end_ts))
+        return lo, hi
+
+# --- Task Search ---
+
+_WORD = re.compile(r"\w+")
+
+def description_words(description):
+    return set(_WORD.findall(description.lower()))
+
+class TaskSearchIndex:
+    """Word-level inverted index over task descriptions.
+
+    Each word maps to the set of tasks (by id()) whose description contains
+    it; a sorted list of the words lets a query word match by prefix with a
+    bisect. A query returns the tasks containing every query word, so its
+    cost follows the number of matches, not the number of tasks."""
+
+    def __init__(self, tasks=()):
+        self._tasks = {}
+        self._postings = {}
+        for task in tasks:
+            self._post(task)
+        self._words = sorted(self._postings)
+
+    def _post(self, task):
+        """Indexes a task; returns the words seen for the first time."""
+        self._tasks[id(task)] = task
+        new_words = []
+        for word in description_words(task.get('description', '')):
+            posting = self._postings.get(word)
+            if posting is None:
+                posting = self._postings[word] = set()
+                new_words.append(word)
+            posting.add(id(task))
+        return new_words
+
+    def add(self, task):
+        for word in self._post(task):
+            insort(self._words, word)
+
+    def remove(self, task, description=None):
+        """Drops a task; pass its old description if it has already changed."""
+        if description is None:
+            description = task.get('description', '')
+        self._tasks.pop(id(task), None)
+        for word in description_words(description):
+            posting = self._postings.get(word)
+            if posting is None:
+                continue
+            posting.discard(id(task))
+            if not posting:
+                del self._postings[word]
+                del self._words[bisect_left(self._words, word)]
+
+    def update(self, task, old_description):
+        self.remove(task, old_description)
+        self.add(task)
+
+    def task(self, task_id):
+        return self._tasks[task_id]
+
+    def _prefix_matches(self, prefix):
+        start = bisect_left(self._words, prefix)
+        end = bisect_left(self._words, prefix + "\uffff")
+        if end - start == 1:
+            return self._postings[self._words[start]]
+        return set().union(*(self._postings[word] for word in self._words[start:end]))
+
+    def match_sets(self, text):
+        """For each word of 'text', the ids of the tasks with a word starting
+        with it, smallest set first. A task matches if it is in all of them.
+        The sets may be the index's own: don't change them."""
+        return sorted((self._prefix_matches(word) for word in description_words(text)), key=len)
+
+    def search(self, text):
+        """Returns the tasks whose descriptions have a word starting with each
+        word of 'text' (in no particular order)."""
+        sets = self.match_sets(text)
+        if not sets:
+            return list(self._tasks.values())
+        return [self._tasks[task_id] for task_id in sets[0].intersection(*sets[1:])]
+
+def parse_date(text):
+    """'YYYY-MM-DD' -> epoch seconds at local midnight; '' -> None.
+    Raises ValueError for anything else."""
+    text = text.strip()
+    if not text:
+        return None
+    return int(datetime.datetime.strptime(text, "%Y-%m-%d").timestamp())
+
+FILTER_SORT_COST = 16 # Sorting a match costs about this many membership tests in the display-order walk
+
+def filter_tasks(order, search_index, text="", status="all", added=(None, None), completed=(None, None)):
+    """Returns the tasks matching every given filter, in display order.
+    'added' and 'completed' are (start_ts, end_ts) ranges, end exclusive."""
+    partitions = {"all": (False, True), "pending": (False,), "completed": (True,)}[status]
+    spans = [order.added_range(done, *added) for done in partitions]
+    sets = search_index.match_sets(text)
+    if sets:
+        match_ids = sets[0].intersection(*sets[1:]) if len(sets) > 1 else sets[0]
+        span_size = sum(hi - lo for lo, hi in spans)
+        if len(match_ids) * FILTER_SORT_COST < span_size:
+            # Few matches: check each against the spans and sort just those
+            keyed = [(order.sort_key(task), task) for task in map(search_index.task, match_ids)]
+            low_high = [(order.tasks[lo], order.tasks[hi - 1]) for lo, hi in spans if hi > lo]
+            bounds = [(order.sort_key(first), order.sort_key(last)) for first, last in low_high]
+            tasks = [task for key, task in sorted(keyed, key=lambda pair: pair[0])
+                     if any(low <= key <= high for low, high in bounds)]
+        else:
+            # Otherwise walk the spans in display order: no sort
+            tasks = [task for lo, hi in spans for task in order.tasks[lo:hi] if id(task) in match_ids]
+    else:
+        tasks = [task for lo, hi in spans for task in order.tasks[lo:hi]]
+    start_ts, end_ts = completed
+    if start_ts is not None or end_ts is not None:
+        start_ts = float('-inf') if start_ts is None else start_ts
+        end_ts = float('inf') if end_ts is None else end_ts
+        tasks = [task for task in tasks
+                 if task.get('completed_ts') is not None and start_ts <= task['completed_ts'] < end_ts]
+    return tasks
+
+# --- Due Dates and Reminders ---
+
+def next_due(due_ts, repeat, after_ts):
+    """Returns the first occurrence of a 'daily'/'weekly'/'monthly' task due
+    at due_ts that falls strictly after after_ts (wall-clock local time)."""
+    due = datetime.datetime.fromtimestamp(due_ts)
+    after = datetime.datetime.fromtimestamp(after_ts)
+    if repeat == "monthly":
+        months = max(1, (after.year - due.year) * 12 + after.month - due.month)
+        while True:
+            year, month = divmod(due.month - 1 + months, 12)
+            year += due.year
+            month += 1
+            # Clamp to the month's last day (a task due on the 31st)
+            day = due.day
+            while True:
+                try:
+                    candidate = due.replace(year=year, month=month, day=day)
+                    break
+                except ValueError:
+                    day -= 1
+            if candidate > after:
+                return int(candidate.timestamp())
+            months += 1
+    period = 7 if repeat == "weekly" else 1
+    steps = max(1, (after - due).days // period)
+    candidate = due + datetime.timedelta(days=steps * period)
+    while candidate <= after:
+        candidate += datetime.timedelta(days=period)
+    return int(candidate.timestamp())
+
+def follow_up_task(task, completed_on, completed_ts):
+    """The next occurrence of a recurring task completed at completed_ts,
+    as a new pending task. Occurrences are counted from the task's
+    repeat_anchor_ts (the due time it was first given), not from the last
+    one: a monthly task due on the 31st that was clamped to the 29th of
+    February is due on the 31st of March again."""
+    anchor_ts = task.get('repeat_anchor_ts') or task['due_ts'] # Older files have no anchor
+    due_ts = next_due(anchor_ts, task['repeat'], max(completed_ts, task['due_ts']))
+    follow_up = dict(task, id=new_task_id(), status='pending', added_on=completed_on, added_ts=completed_ts,
+                     completed_on=None, completed_ts=None, due_ts=due_ts, due_on=format_timestamp(due_ts),
+                     repeat_anchor_ts=anchor_ts)
+    follow_up.pop('reminded_ts', None)
+    return follow_up
+
+def is_overdue(task, now=None):
+    return (task.get('status') != 'completed' and task.get('due_ts') is not None
+            and task['due_ts'] <= (time.time() if now is None else now))
+
+# --- Command Line ---
+# Changes go straight to tasks.json; open windows merge them in as they
+# would another window's save.
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Work with the to-do list without opening its window.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    listing = commands.add_parser("list", help="print tasks, optionally filtered")
+    listing.add_argument("text", nargs="?", default="", help="words (or word prefixes) the description must contain")
+    listing.add_argument("--status", choices=("all", "pending", "completed"), default="all")
+    add = commands.add_parser("add", help="add a task")
+    add.add_argument("description")
+    complete = commands.add_parser("complete", help="mark the tasks with these ids complete")
+    complete.add_argument("ids", nargs="+")
+    delete = commands.add_parser("delete", help="delete the tasks with these ids")
+    delete.add_argument("ids", nargs="+")
+    commands.add_parser("archive", help=f"move tasks completed over {ARCHIVE_AFTER_DAYS} days ago to {ARCHIVE_DIR}")
+    args = parser.parse_args(argv)
+    with file_lock(TASKS_FILE): # No window's save can land between our read and write
+        run_command(args)
+
+def run_command(args):
+    tasks = read_tasks()
+    changed = bool(assign_task_ids(tasks))
+    if args.command == "list":
+        order = TaskOrder(tasks)
+        for task in filter_tasks(order, TaskSearchIndex(tasks), args.text, args.status):
+            due = f" (Due: {task['due_on']})" if task.get('due_on') else ""
+            print(f"{task['id']}\t{task['status']}\t{task['description']}{due}")
+    elif args.command == "add":
+        task = new_task(args.description.strip())
+        tasks.append(task)
+        print(task['id'])
+        changed = True
+    elif args.command == "complete":
+        completed_on, completed_ts = timestamp_now()
+        for task in [task for task in tasks if task['id'] in args.ids and task['status'] != 'completed']:
+            task['status'] = 'completed'
+            task['completed_on'], task['completed_ts'] = completed_on, completed_ts
+            if task.get('repeat') and task.get('due_ts') is not None:
+                tasks.append(follow_up_task(task, completed_on, completed_ts))
+            changed = True
+    elif args.command == "delete":
+        kept = [task for task in tasks if task['id'] not in args.ids]
+        changed = changed or len(kept) != len(tasks)
+        tasks = kept
+    else:
+        tasks, archived_count = archive_old_tasks(tasks)
+        print(f"Archived {archived_count} task(s).")
+        changed = changed or archived_count > 0
+    if changed:
+        write_tasks(tasks)
+
+if __name__ == "__main__":
+    main()
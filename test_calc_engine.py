@@ -0,0 +1,179 @@
+import itertools
+import os
+import random
+import tempfile
+import unittest
+from array import array
+
+import calc_engine
+from calc_engine import (ERROR_MESSAGES, CellError, ExpressionError, Worksheet, compile_expression, evaluate,
+                         evaluate_batch, evaluate_expression, format_batch, format_result)
+
+AWKWARD_NUMBERS = ["0", "-0", "1", "-2.5", "3.14159", "1e308", "-1e308", "5e-324", "inf", "-inf", "nan", "abc", ""]
+OPERATORS = ['+', '-', '*', '/', '%']
+
+def batch_texts(rows):
+    """What the calculator would show for each row, computed as a batch."""
+    errors = array('B', bytes(len(rows)))
+    num1 = calc_engine._float_column([a for a, _, _ in rows], errors)
+    num2 = calc_engine._float_column([b for _, b, _ in rows], errors)
+    values, errors = evaluate_batch(num1, num2, [op for _, _, op in rows], errors)
+    return [f"Error: {ERROR_MESSAGES[int(error)]}" if error else f"Result: {text}"
+            for text, error in zip(format_batch(values, errors), errors)]
+
+class BatchTest(unittest.TestCase):
+    def test_matches_evaluate_on_awkward_inputs(self):
+        rows = list(itertools.product(AWKWARD_NUMBERS, AWKWARD_NUMBERS, OPERATORS))
+        self.assertEqual(batch_texts(rows), [evaluate(a, b, op) for a, b, op in rows])
+
+    def test_matches_evaluate_on_random_rows(self):
+        rng = random.Random(20)
+        numbers = lambda: rng.choice([str(rng.randint(-9, 9)), repr(rng.uniform(-1e6, 1e6)), "0"])
+        rows = [(numbers(), numbers(), rng.choice(OPERATORS)) for _ in range(20000)]
+        self.assertEqual(batch_texts(rows), [evaluate(a, b, op) for a, b, op in rows])
+
+    def test_files_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "in.csv")
+            with open(source, "w") as f:
+                f.write("operation,num1,num2\n/,7,2\n/,1,0\n^,1,2\n+,x,1\n")
+            self.assertEqual(calc_engine.run_batch(source, os.path.join(tmp, "out.csv")), (4, 3))
+            with open(os.path.join(tmp, "out.csv")) as f:
+                self.assertEqual(f.read().splitlines(), ["result,error", "3.5000,", ",Division by zero",
+                                                         ",Invalid operation", ",Invalid number input"])
+            binary = os.path.join(tmp, "in.bin")
+            calc_engine.write_batch_binary(binary, [7.0, 1.0], [2.0, 0.0], "/+")
+            num1, num2, operations, errors = calc_engine.read_batch_binary(binary)
+            self.assertEqual((list(num1), list(num2), operations), ([7.0, 1.0], [2.0, 0.0], b"/+"))
+            with open(binary, "rb") as f:
+                data = f.read()
+            for damaged, message in [(data[:5], "truncated"), (data[:-1], "truncated"), (data + b"+", "after"),
+                                     (b"CALCRES1" + data[8:], "not a calculator batch file")]:
+                with open(binary, "wb") as f:
+                    f.write(damaged)
+                with self.assertRaisesRegex(ValueError, message):
+                    calc_engine.read_batch_binary(binary)
+
+def random_expression(rng, depth=0):
+    """Text for a random expression of + - * / unary minus and parentheses."""
+    if depth > 4 or rng.random() < 0.3:
+        return rng.choice([str(rng.randint(0, 20)), f"{rng.uniform(0, 100):.3f}", "x"])
+    if rng.random() < 0.1:
+        return f"-{random_expression(rng, depth + 1)}"
+    if rng.random() < 0.2:
+        return f"({random_expression(rng, depth + 1)})"
+    return f"{random_expression(rng, depth + 1)} {rng.choice('+-*/')} {random_expression(rng, depth + 1)}"
+
+class ExpressionTest(unittest.TestCase):
+    def test_agrees_with_float_arithmetic(self):
+        rng = random.Random(21)
+        for _ in range(3000):
+            text = random_expression(rng)
+            x = rng.uniform(-10, 10)
+            try:
+                expected = format_result(float(eval(text, {"__builtins__": {}}, {"x": x})))
+            except ZeroDivisionError:
+                expected = "Error: Division by zero"
+            self.assertEqual(evaluate_expression(text, {"x": x}), expected, text)
+
+    def test_operators_functions_and_constants(self):
+        cases = {
+            "2 + 3 * 4": "Result: 14", "(2 + 3) * 4": "Result: 20", "2 ** 3 ** 2": "Result: 512",
+            "2 ^ 3": "Result: 8", "-2 ** 2": "Result: -4", "7 / 2": "Result: 3.5000",
+            "sqrt(16) + max(1, 5, 3)": "Result: 9", "round(pi, 2)": "Result: 3.1400",
+            "1 / 0": "Error: Division by zero", "sqrt(-1)": "Error: Math domain error",
+            "10 ** 400": "Error: Result too large", "2 +": "Error: Invalid expression - Unexpected end of expression",
+            "y + 1": "Error: Invalid expression - Unknown variable 'y'",
+            "nope(1)": "Error: Invalid expression - Unknown function 'nope'",
+        }
+        for text, shown in cases.items():
+            self.assertEqual(evaluate_expression(text), shown, text)
+
+    def test_compiled_once_per_text(self):
+        self.assertIs(compile_expression("ans * 2"), compile_expression("ans * 2"))
+        self.assertEqual(compile_expression("ans * 2").evaluate({"ans": 4}), 8.0)
+
+    def test_too_deeply_nested(self):
+        shown = "Error: Invalid expression - nested too deeply"
+        self.assertEqual(evaluate_expression("(" * 5000 + "1" + ")" * 5000), shown)
+        self.assertEqual(evaluate_expression("-" * 5000 + "1"), shown)
+        self.assertEqual(evaluate_expression("+".join(["x"] * 5000), {"x": 1}), shown)
+
+def brute_force(sheet, name, seen=()):
+    """A cell's value computed from scratch (None for any error)."""
+    if name not in sheet.formulas or name in seen:
+        return None
+    compiled = compile_expression(sheet.formulas[name])
+    variables = {n: brute_force(sheet, n, seen + (name,)) for n in compiled.variables}
+    if None in variables.values():
+        return None
+    try:
+        return compiled.evaluate(variables)
+    except (ArithmeticError, ValueError):
+        return None
+
+def reachable(inputs, start, target):
+    """DFS over cell -> inputs: True if 'target' is an input of 'start', directly or not."""
+    stack, seen = [start], set()
+    while stack:
+        for input_name in inputs.get(stack.pop(), ()):
+            if input_name == target:
+                return True
+            if input_name not in seen:
+                seen.add(input_name)
+                stack.append(input_name)
+    return False
+
+class WorksheetTest(unittest.TestCase):
+    def test_recomputes_downstream_cells(self):
+        sheet = Worksheet()
+        sheet.load_lines(["total = price * qty * (1 + tax)", "price = 4.5", "qty = 2", "tax = 0.1", "# notes"])
+        self.assertEqual(sheet.display("total"), "Result: 9.9000")
+        self.assertEqual(sheet.set("qty", "4"), ["qty", "total"])
+        self.assertEqual(sheet.display("total"), "Result: 19.8000")
+        self.assertEqual(sheet.delete("tax"), ["total"])
+        self.assertEqual(sheet.display("total"), "Error: Unknown cell 'tax'")
+
+    def test_matches_brute_force_and_rejects_cycles(self):
+        rng = random.Random(22)
+        sheet = Worksheet()
+        names = [f"c{i}" for i in range(40)]
+        for _ in range(2000):
+            name = rng.choice(names)
+            if rng.random() < 0.1:
+                sheet.delete(name)
+                continue
+            refs = rng.sample(names, rng.randint(0, 3))
+            text = " + ".join(refs + [str(rng.randint(0, 9))]) + rng.choice(["", " / c0"])
+            before = (dict(sheet.formulas), dict(sheet.values))
+            proposed = dict(sheet._inputs, **{name: compile_expression(text).variables})
+            if reachable(proposed, name, name):
+                self.assertRaises(ExpressionError, sheet.set, name, text)
+                self.assertEqual((sheet.formulas, sheet.values), before)
+            else:
+                sheet.set(name, text)
+            for cell in sheet.formulas:
+                value = sheet.values[cell]
+                self.assertEqual(None if isinstance(value, CellError) else value, brute_force(sheet, cell), cell)
+
+    def test_long_chain(self):
+        sheet = Worksheet()
+        sheet.load_lines(f"c{i} = c{i - 1} + 1" for i in range(1, 20000))
+        sheet.set("c0", "1")
+        self.assertEqual(sheet.values["c19999"], 20000.0)
+        self.assertEqual(len(sheet.set("c19990", "0")), 10)
+
+    def test_too_deeply_nested_leaves_the_sheet_unchanged(self):
+        sheet = Worksheet()
+        sheet.set("x", "1")
+        sheet.set("y", "x * 2")
+        before = (dict(sheet.formulas), dict(sheet.values), dict(sheet._inputs), {k: set(v) for k, v in sheet._dependents.items()})
+        for name in ("y", "z"):
+            with self.assertRaises(ExpressionError):
+                sheet.set(name, "+".join(["x"] * 5000))
+            self.assertEqual((sheet.formulas, sheet.values, sheet._inputs, sheet._dependents), before)
+        self.assertEqual(sheet.set("x", "3"), ["x", "y"])
+        self.assertEqual(sheet.values["y"], 6.0)
+
+if __name__ == "__main__":
+    unittest.main()
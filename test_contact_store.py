@@ -0,0 +1,401 @@
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import contact_store
+from contact_store import Contact, ContactList, ContactSearchIndex
+from save_worker import file_lock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+class BookTestCase(unittest.TestCase):
+    """Runs each test in an empty directory with a freshly reset contact_store."""
+    storage_mode = 'journal'
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        self._mode = contact_store.STORAGE_MODE
+        contact_store.STORAGE_MODE = self.storage_mode
+        self.reset_store()
+
+    def tearDown(self):
+        if contact_store.save_worker is not None:
+            contact_store.flush_storage()
+        self.reset_store()
+        contact_store.STORAGE_MODE = self._mode
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def reset_store(self):
+        """Forgets everything contact_store holds in memory, like a new process."""
+        thread = contact_store._compaction_thread
+        if thread is not None:
+            thread.join()
+        for db in (contact_store._db, contact_store._writer_db):
+            if db is not None:
+                db.close()
+        contact_store._db = contact_store._writer_db = None
+        contact_store.contacts = contact_store.search_index = contact_store.save_worker = None
+        contact_store._on_save_conflict = None
+        contact_store._pending_entries = []
+        contact_store._pending_source = None
+        contact_store._json_digest = None
+        contact_store._json_base = {}
+        contact_store._json_save_deferred = False
+        contact_store._journal_position = (None, 0)
+        contact_store._db_data_version = None
+        contact_store._sqlite_unsaved = []
+        contact_store._sqlite_overlay = {}
+        contact_store._compaction_thread = None
+
+    def reopen(self):
+        contact_store.flush_storage()
+        self.reset_store()
+        contact_store.open_book()
+        return contact_store.contacts
+
+    def add(self, name, phone="555 0100"):
+        contact = Contact(contact_store.new_contact_id(), name, phone)
+        contact_store.contacts.add(contact)
+        contact_store.search_index.add(contact)
+        contact_store.persist_add(contact, contact_store.contacts)
+        return contact
+
+    def start_cli(self, *args):
+        env = dict(os.environ, CONTACTBOOK_STORAGE=self.storage_mode,
+                   PYTHONPATH=os.pathsep.join(filter(None, [HERE, os.environ.get('PYTHONPATH')])))
+        return subprocess.Popen([sys.executable, os.path.join(HERE, "contact_store.py"), *args],
+                                env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def run_cli(self, *args):
+        process = self.start_cli(*args)
+        output, errors = process.communicate()
+        self.assertEqual(process.returncode, 0, errors)
+
+    def names(self, contacts_list):
+        return [c.name for c in contacts_list]
+
+class ContactIdTest(BookTestCase):
+    def test_ids_increase(self):
+        ids = [contact_store.new_contact_id() for _ in range(1000)]
+        self.assertEqual(ids, sorted(set(ids)))
+        self.assertLess(ids[-1], 2 ** 63)
+
+    def test_two_processes_adding_keep_both_contacts(self):
+        contact_store.open_book()
+        self.run_cli("add", "Bob", "555 0101")
+        self.add("Alice")
+        self.assertEqual(self.names(self.reopen()), ["Alice", "Bob"])
+
+class CompactionTest(BookTestCase):
+    def test_compaction_keeps_records_other_windows_appended(self):
+        contact_store.open_book()
+        self.add("Alice")
+        contact_store.flush_storage()
+        self.run_cli("add", "Bob", "555 0101") # Not yet synced into this process
+        contact_store.compact_journal_async()
+        contact_store._compaction_thread.join()
+        self.assertFalse(os.path.exists(contact_store.CONTACTS_JOURNAL_FILE + ".old"))
+        self.assertEqual(self.names(self.reopen()), ["Alice", "Bob"])
+
+    def test_journal_lock_holds_off_appends_and_rotation(self):
+        contact_store.open_book()
+        self.add("Alice")
+        contact_store.flush_storage()
+        with file_lock(contact_store.CONTACTS_JOURNAL_FILE): # As another window's compaction would
+            process = self.start_cli("add", "Bob", "555 0101")
+            contact_store.compact_journal_async()
+            time.sleep(0.5)
+            with open(contact_store.CONTACTS_JOURNAL_FILE) as f:
+                self.assertNotIn("Bob", f.read())
+            self.assertIsNone(process.poll())
+        self.assertEqual(process.wait(), 0)
+        self.assertFalse(os.path.exists(contact_store.CONTACTS_JOURNAL_FILE + ".old"))
+        self.assertEqual(self.names(self.reopen()), ["Alice", "Bob"])
+
+class JournalSyncTest(BookTestCase):
+    def test_our_own_compactions_need_no_reload(self):
+        contact_store.open_book()
+        reloads = []
+        load_contacts = contact_store.load_contacts
+        contact_store.load_contacts = lambda **kwargs: reloads.append(1) or load_contacts(**kwargs)
+        threshold = contact_store.JOURNAL_COMPACT_BYTES
+        contact_store.JOURNAL_COMPACT_BYTES = 2048
+        try:
+            for n in range(40):
+                if n == 20:
+                    self.run_cli("add", "Bob", "555 0101") # Appended by another window just before we rotate
+                self.add(f"Alice {n:02d}")
+                contact_store.flush_storage()
+                contact_store.sync_from_storage()
+        finally:
+            contact_store.load_contacts = load_contacts
+            contact_store.JOURNAL_COMPACT_BYTES = threshold
+        self.assertEqual(reloads, [])
+        self.assertIn("Bob", self.names(contact_store.contacts))
+        self.assertEqual(self.names(contact_store.contacts), self.names(self.reopen()))
+        self.assertEqual(len(contact_store.contacts), 41)
+
+class ImportTest(BookTestCase):
+    def write_csv(self, rows):
+        with open("import.csv", "w", newline="") as f:
+            f.write("Name,Phone,Email\n" + "".join(f"{name},{phone},{email}\n" for name, phone, email in rows))
+        return "import.csv"
+
+    def test_parallel_validation_matches_serial(self):
+        rows = [(f"Person {n}", "555 0100" if n % 7 else "not a phone", "bad@" if n % 11 == 0 else "")
+                for n in range(1000)]
+        path = self.write_csv(rows + [("Person 3", "555 0199", "")]) # A duplicate name
+        records = list(contact_store.iter_csv_contacts(path))
+        serial = [(record.name, error) for record, error in contact_store._validated_records(records, False)]
+        settings = contact_store.IMPORT_CHUNK_SIZE, os.cpu_count
+        contact_store.IMPORT_CHUNK_SIZE, os.cpu_count = 64, lambda: 2 # Several chunks in flight at once
+        try:
+            parallel = [(record.name, error) for record, error in contact_store._validated_records(records, True)]
+        finally:
+            contact_store.IMPORT_CHUNK_SIZE, os.cpu_count = settings
+        self.assertEqual(parallel, serial)
+        contact_store.open_book()
+        added, duplicates, errors = contact_store.import_contacts(path, contact_store.contacts)
+        self.assertEqual(len(errors), sum(1 for name, error in serial if error))
+        self.assertEqual((len(added), duplicates), (1001 - len(errors) - 1, 1))
+
+class ContactListTest(unittest.TestCase):
+    def test_name_order_and_lookups(self):
+        book = ContactList([Contact(3, "bob", "1"), Contact(1, "Carol", "2"), Contact(2, "Bob", "3")]) # Old books may hold same-name contacts
+        book.add(Contact(5, "alice", "4"))
+        book.add_many([Contact(4, "Dave", "5"), Contact(6, "Al", "6")])
+        self.assertEqual([c.id for c in book], [6, 5, 2, 3, 1, 4])
+        self.assertEqual([book.position(i) for i in (6, 3, 4, 99)], [0, 3, 5, None])
+        self.assertEqual(book.find_by_name("BOB").id, 2)
+        self.assertTrue(book.name_taken("bob", exclude_id=2))
+        book.remove(3)
+        self.assertFalse(book.name_taken("bob", exclude_id=2))
+        book.replace(Contact(2, "Zed", "3"))
+        self.assertEqual((book[-1].name, len(book), book.find_by_name("bob")), ("Zed", 5, None))
+        with self.assertRaises(KeyError):
+            book.remove(3)
+        self.assertEqual(len(book), 5)
+
+    def test_names_compare_case_folded(self):
+        book = ContactList([Contact(1, "Straße", "1"), Contact(2, "strasse b", "2"), Contact(3, "STRASSE A", "3")])
+        self.assertEqual([c.id for c in book], [1, 3, 2]) # 'strasse', 'strasse a', 'strasse b'
+        self.assertEqual(book.find_by_name("STRASSE").id, 1)
+        self.assertTrue(book.name_taken("strasse"))
+
+def brute_force_duplicates(contacts_list):
+    """What find_duplicates should return for small books: the connected
+    groups of contacts that share a blocking key and score as duplicates."""
+    parent = {c.id: c.id for c in contacts_list}
+    def find(contact_id):
+        while parent[contact_id] != contact_id:
+            contact_id = parent[contact_id]
+        return contact_id
+    for a, b in itertools.combinations(contacts_list, 2):
+        if set(contact_store._blocking_keys(a)) & set(contact_store._blocking_keys(b)) and contact_store.is_duplicate(a, b):
+            parent[find(b.id)] = find(a.id)
+    groups = {}
+    for contact in contacts_list:
+        groups.setdefault(find(contact.id), []).append(contact)
+    return sorted((sorted(group, key=lambda c: c.id) for group in groups.values() if len(group) > 1),
+                  key=lambda group: contact_store._order_key(group[0]))
+
+class DuplicateTest(BookTestCase):
+    def test_soundex(self):
+        codes = {"Robert": "R163", "Rupert": "R163", "Rubin": "R150", "Ashcraft": "A261", "Tymczak": "T522",
+                 "Pfister": "P236", "Honeyman": "H555", "Lee": "L000", "O'Hara": "O600", "123": ""}
+        self.assertEqual({word: contact_store.soundex(word) for word in codes}, codes)
+        self.assertEqual(contact_store.phonetic_name_key("Jon Smyth"), contact_store.phonetic_name_key("John Smith"))
+        self.assertIsNone(contact_store.phonetic_name_key("42"))
+
+    def test_find_duplicates(self):
+        book = ContactList([
+            Contact(1, "John Smith", "(555) 123-4567"),
+            Contact(2, "Alice Jones", "555 0100", "alice@example.com"),
+            Contact(3, "Jon Smyth", "+1 555 123 4567"), # Same number written another way
+            Contact(4, "Alicia Jones", "555 0199", "Alice@Example.com"),
+            Contact(5, "Ann Lee", "555 0100"), # Shares Alice's phone, but not her name
+            Contact(6, "Bob Brown", "555 0123"),
+            Contact(7, "John Smith", "555 0124"), # Same name, nothing else
+        ])
+        groups = [[c.id for c in group] for group in contact_store.find_duplicates(book)]
+        self.assertEqual(groups, [[2, 4], [1, 3, 7]])
+
+    def test_find_duplicates_matches_brute_force(self):
+        rng = random.Random(9)
+        first = ["Ann", "Anne", "Jon", "John", "Mark", "Marc", "Sue", "Zoe", "Pete", "Peter", "Kim", "Omar", "Ivy", "Hugo"]
+        last = ["Smith", "Smyth", "Lee", "Leigh", "Brown", "Braun", "Novak", "Garcia", "Kowalski", "Ito", "Dubois", "Okafor"]
+        book = ContactList(Contact(n, f"{rng.choice(first)} {rng.choice(last)}", f"555 {rng.randint(0, 300):04d}",
+                                   rng.choice(["", "", f"x{rng.randint(0, 100)}@example.com"]))
+                           for n in range(1, 300)) # Blocks stay under MAX_BLOCK_SIZE, so every pair is scored
+        self.assertEqual(contact_store.find_duplicates(book), brute_force_duplicates(book))
+
+    def test_merge_folds_groups_into_the_oldest_contact(self):
+        contact_store.open_book()
+        john = self.add("John Smith", "(555) 123-4567")
+        jon = Contact(contact_store.new_contact_id(), "Jon Smyth", "+1 555 123 4567", "jon@example.com", "1 High St")
+        contact_store.contacts.add(jon)
+        contact_store.persist_add(jon, contact_store.contacts)
+        alice = self.add("Alice Jones")
+        groups = contact_store.find_duplicates(contact_store.contacts)
+        self.assertEqual(groups, [[john, jon]])
+        merged, removed = contact_store.merge_duplicates(groups, contact_store.contacts)
+        self.assertEqual(removed, [jon])
+        self.assertEqual([(old.id, new.email, new.address) for old, new in merged],
+                         [(john.id, "jon@example.com", "1 High St")])
+        book = self.reopen()
+        self.assertEqual(self.names(book), ["Alice Jones", "John Smith"])
+        self.assertEqual((book.get(john.id).email, book.get(alice.id).email), ("jon@example.com", ""))
+
+    def test_merge_skips_contacts_deleted_since_the_groups_were_found(self):
+        contact_store.open_book()
+        john = self.add("John Smith", "(555) 123-4567")
+        jon = self.add("Jon Smyth", "+1 555 123 4567")
+        johnny = self.add("Johnny Smith", "555-123-4567")
+        groups = contact_store.find_duplicates(contact_store.contacts)
+        self.assertEqual(groups, [[john, jon, johnny]])
+        contact_store.contacts.remove(john.id) # As a sync from another window would
+        merged, removed = contact_store.merge_duplicates(groups, contact_store.contacts)
+        self.assertEqual((merged, removed), ([], [johnny])) # Folded into jon, now the oldest
+        contact_store.contacts.remove(jon.id)
+        self.assertEqual(contact_store.merge_duplicates(groups, contact_store.contacts), ([], []))
+
+def brute_force_search(contacts_list, term, limit=None):
+    """What ContactSearchIndex.search should return, by checking every contact."""
+    term = term.strip().lower()
+    terms = {term, contact_store.normalize_phone(term)} if contact_store.validate_phone(term) else {term}
+    def matches(contact, t):
+        fields = ContactSearchIndex._field_values(contact)
+        if len(t) >= 3:
+            return any(t in value for value in fields)
+        return any(word.startswith(t) for word in ContactSearchIndex._word_set(fields))
+    found = [c for c in contacts_list if term and any(t and matches(c, t) for t in terms)]
+    return found[:limit]
+
+class ContactSearchIndexTest(unittest.TestCase):
+    def test_matches_brute_force_while_edited_during_a_background_build(self):
+        rng = random.Random(3)
+        first = ["Ann", "Anne", "Annabel", "Bo", "Mark", "Maria", "Jo"]
+        last = ["Smith", "Smyth", "Marsh", "O'Hara", "Lee"]
+        def random_contact(contact_id):
+            name = f"{rng.choice(first)} {rng.choice(last)} {contact_id}"
+            return Contact(contact_id, name, f"(555) {rng.randint(0, 9999):04d}", rng.choice(["", f"{name[:3]}@example.com"]))
+        book = ContactList(random_contact(i) for i in range(5000))
+        index = ContactSearchIndex(book, background=True)
+        for contact_id in range(5000, 5300): # Made while the index may still be building
+            contact = book[rng.randrange(len(book))]
+            book.remove(contact.id)
+            index.remove(contact)
+            for new in (random_contact(contact_id), random_contact(contact.id)):
+                book.add(new)
+                index.add(new)
+        terms = ["a", "An", "ann", "anne", "mar", "marsh", "smy", "o'h", "555", "(555) 01", "555-0", "@ex", "zzz", "", "12"]
+        for term in terms:
+            for limit in (None, 1, 10, 1000):
+                self.assertEqual(index.search(term, limit), brute_force_search(book, term, limit), (term, limit))
+
+class SqliteBookTest(BookTestCase):
+    storage_mode = 'sqlite'
+
+    def test_view_and_search_read_the_table(self):
+        contact_store.open_book()
+        for name in ("Carol", "alice", "Bob Marsh"):
+            self.add(name)
+        self.run_cli("add", "Dave Marsh", "555 0101") # Another process commits
+        self.assertEqual(contact_store.sync_from_storage(), 1)
+        book = contact_store.contacts
+        self.assertEqual((self.names(book), len(book), book[-1].name), (["alice", "Bob Marsh", "Carol", "Dave Marsh"], 4, "Dave Marsh"))
+        self.assertEqual(self.names(book[1:3]), ["Bob Marsh", "Carol"])
+        self.assertTrue(book.name_taken("ALICE"))
+        self.assertEqual(book.position(book.find_by_name("carol").id), 2)
+        in_memory = ContactSearchIndex(ContactList(book))
+        for term in ("mars", "m", "ma", "555", "555-0101", "zz"):
+            self.assertEqual(contact_store.search_index.search(term), in_memory.search(term), term)
+        self.assertEqual(self.names(contact_store.search_index.search("ma", limit=1)), ["Bob Marsh"])
+
+    def test_removing_a_missing_contact_raises(self):
+        contact_store.open_book()
+        alice = self.add("Alice")
+        contact_store.contacts.remove(alice.id)
+        with self.assertRaises(KeyError):
+            contact_store.contacts.remove(alice.id)
+        self.assertEqual(len(contact_store.contacts), 0)
+
+    def test_failed_writes_are_retried_in_order(self):
+        contact_store.open_book()
+        commit = contact_store._sqlite_commit
+        def locked_once(ops):
+            contact_store._sqlite_commit = commit
+            raise sqlite3.OperationalError("database is locked")
+        contact_store._sqlite_commit = locked_once
+        alice = self.add("Alice")
+        contact_store.contacts.remove(alice.id) # Must not reach the table before Alice does
+        contact_store.persist_delete(alice, contact_store.contacts)
+        self.add("Bob")
+        self.assertEqual(self.names(self.reopen()), ["Bob"])
+
+    def test_reads_see_edits_the_worker_could_not_commit(self):
+        contact_store.open_book()
+        bob = self.add("Bob")
+        contact_store.flush_storage()
+        commit = contact_store._sqlite_commit
+        def locked(ops):
+            raise sqlite3.OperationalError("database is locked") # Another window holds the write lock
+        contact_store._sqlite_commit = locked
+        try:
+            alice = self.add("Alice")
+            book = contact_store.contacts
+            book.remove(bob.id)
+            contact_store.persist_delete(bob, book)
+            self.assertEqual((self.names(book), len(book), book.position(alice.id)), (["Alice"], 1, 0))
+            self.assertTrue(book.name_taken("ALICE"))
+            self.assertEqual((book.get(alice.id), book.get(bob.id), bob.id in book), (alice, None, False))
+            self.assertEqual(self.names(contact_store.search_index.search("b")), [])
+            self.assertEqual(contact_store._query("SELECT name FROM contacts"), [("Bob",)])
+        finally:
+            contact_store._sqlite_commit = commit
+        contact_store.save_worker.mark_dirty() # What the next edit would do
+        self.assertEqual(self.names(self.reopen()), ["Alice"])
+
+    def test_legacy_import_keeps_names_differing_only_in_case(self):
+        with open(contact_store.CONTACTS_FILE, "w") as f:
+            json.dump([{"name": "Ann Lee", "phone": "1"}, {"name": "ann lee", "phone": "2"}, {"name": "Bo", "phone": "3"}], f)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            contact_store.open_book()
+        self.assertEqual(len(contact_store.contacts), 3)
+        self.assertIn("2 contacts in contacts_data.json share a name", output.getvalue())
+
+    def test_upgrades_a_database_with_unique_names(self):
+        db = sqlite3.connect(contact_store.CONTACTS_DB_FILE)
+        db.executescript("""
+            CREATE TABLE contacts (id INTEGER PRIMARY KEY, name TEXT NOT NULL, phone TEXT NOT NULL,
+                email TEXT NOT NULL DEFAULT '', address TEXT NOT NULL DEFAULT '',
+                name_key TEXT NOT NULL, phone_key TEXT NOT NULL);
+            CREATE UNIQUE INDEX idx_contacts_name_key ON contacts(name_key);
+            INSERT INTO contacts VALUES (1, 'Ann Lee', '555 0100', '', '', 'ann lee', '5550100');
+            INSERT INTO contacts VALUES (2, 'Straße', '555 0101', '', '', 'straße', '5550101');
+        """)
+        db.close()
+        contact_store.open_book()
+        self.assertEqual(contact_store.contacts.find_by_name("STRASSE").id, 2) # name_key is now case-folded
+        self.assertEqual(contact_store._query("PRAGMA user_version")[0][0], contact_store._DB_SCHEMA_VERSION)
+        self.add("ANN LEE")
+        self.assertEqual(self.names(contact_store.search_index.search("lee")), ["Ann Lee", "ANN LEE"])
+        self.assertEqual(self.names(contact_store.search_index.search("(555) 010")), ["Ann Lee", "ANN LEE", "Straße"])
+        indexes = {row[0] for row in contact_store._query("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn("idx_contacts_phone", indexes)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+
+import record_codecs
+from file_watcher import file_digest
+from record_codecs import (ENCODERS, RECORDS_MAGIC, RecordFormatError, decode, detect_format, encode, file_format,
+                           migrate, read_records, write_records)
+
+RECORDS = [
+    {"id": "a1", "description": "Buy milk", "status": "pending", "due_ts": None},
+    {"id": "a2", "description": "Café – naïve ✓", "status": "completed", "due_ts": 1717171717},
+    {"id": "a3", "description": "Extra keys are stored whole", "status": "pending", "due_ts": None, "repeat": "weekly"},
+]
+
+class CodecTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmp.name, "tasks.json")
+        self._record_format, record_codecs.RECORD_FORMAT = record_codecs.RECORD_FORMAT, None
+        self._orjson = record_codecs.orjson
+
+    def tearDown(self):
+        record_codecs.RECORD_FORMAT = self._record_format
+        record_codecs.orjson = self._orjson
+        self._tmp.cleanup()
+
+class RoundTripTest(CodecTestCase):
+    def test_every_format_round_trips(self):
+        for format in ENCODERS:
+            for records in (RECORDS, [], RECORDS[:1]):
+                with self.subTest(format=format, count=len(records)):
+                    self.assertEqual(decode(encode(records, format)), records)
+
+    def test_records_span_several_blocks(self):
+        records = [{"id": str(n), "n": n} for n in range(record_codecs.BLOCK_SIZE * 2 + 5)]
+        self.assertEqual(decode(encode(records, 'records')), records)
+
+    def test_detect_format(self):
+        self.assertEqual(detect_format(encode(RECORDS, 'json')), 'json')
+        self.assertEqual(detect_format(encode(RECORDS, 'json-compact')), 'json')
+        self.assertEqual(detect_format(encode(RECORDS, 'records')), 'records')
+        self.assertIsNone(file_format(self.path))
+        write_records(self.path, RECORDS, 'records')
+        self.assertEqual(file_format(self.path), 'records')
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            encode(RECORDS, 'yaml')
+
+    def test_writes_keep_a_records_file_in_its_format(self):
+        write_records(self.path, RECORDS)
+        self.assertEqual(file_format(self.path), 'json')
+        write_records(self.path, RECORDS, 'records')
+        write_records(self.path, RECORDS[:2])
+        self.assertEqual(file_format(self.path), 'records')
+        self.assertEqual(read_records(self.path), RECORDS[:2])
+
+    def test_write_returns_the_file_digest(self):
+        self.assertEqual(write_records(self.path, RECORDS), file_digest(self.path))
+
+class DamagedFileTest(CodecTestCase):
+    def test_every_truncation_is_reported(self):
+        data = encode(RECORDS, 'records')
+        for end in range(len(RECORDS_MAGIC), len(data)):
+            with self.subTest(end=end), self.assertRaises(RecordFormatError):
+                decode(data[:end])
+
+    def test_damaged_frames_are_reported(self):
+        def records_file(*payloads):
+            return RECORDS_MAGIC + b"".join(record_codecs._FRAME_LENGTH.pack(len(p)) + p for p in payloads)
+        header = b'{"fields":["id","n"],"count":1}'
+        self.assertEqual(decode(records_file(header, b'[["x",1]]')), [{"id": "x", "n": 1}])
+        damaged = {
+            "not json": records_file(header, b'\xff[["x",1]]'),
+            "header not an object": records_file(b'[1]', b'[["x",1]]'),
+            "header fields not a list": records_file(b'{"fields":"id","count":1}', b'[["x",1]]'),
+            "header count missing": records_file(b'{"fields":["id","n"]}', b'[["x",1]]'),
+            "block not a list": records_file(header, b'{"id":"x","n":1}'),
+            "row too short": records_file(header, b'[["x"]]'),
+            "row neither list nor object": records_file(header, b'[7]'),
+        }
+        for name, data in damaged.items():
+            with self.subTest(name), self.assertRaises(RecordFormatError):
+                decode(data)
+
+    def test_errors_are_value_errors(self):
+        # Callers catch ValueError for any file that can't be decoded
+        with self.assertRaises(ValueError):
+            decode(encode(RECORDS, 'records')[:-1])
+        with self.assertRaises(ValueError):
+            decode(encode(RECORDS, 'json')[:-1])
+
+class MigrateTest(CodecTestCase):
+    def migrate_through_every_format(self):
+        write_records(self.path, RECORDS, 'json')
+        self.assertEqual(migrate(self.path, 'records'), 'json')
+        self.assertEqual(file_format(self.path), 'records')
+        self.assertEqual(migrate(self.path, 'json-compact'), 'records')
+        self.assertEqual(file_format(self.path), 'json')
+        self.assertEqual(migrate(self.path, 'json'), 'json')
+        self.assertEqual(read_records(self.path), RECORDS)
+
+    def test_migrate(self):
+        self.migrate_through_every_format()
+
+    def test_migrate_without_orjson(self):
+        record_codecs.orjson = None
+        self.migrate_through_every_format()
+
+    @unittest.skipIf(record_codecs.orjson is None, "orjson is not installed")
+    def test_files_read_the_same_with_or_without_orjson(self):
+        for format in ENCODERS:
+            with self.subTest(format=format):
+                with_orjson = encode(RECORDS, format)
+                record_codecs.orjson = None
+                self.assertEqual(decode(with_orjson), RECORDS)
+                without_orjson = encode(RECORDS, format)
+                record_codecs.orjson = self._orjson
+                self.assertEqual(decode(without_orjson), RECORDS)
+
+if __name__ == "__main__":
+    unittest.main()
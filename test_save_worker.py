@@ -0,0 +1,84 @@
+import itertools
+import threading
+import time
+import unittest
+
+from save_worker import SaveWorker
+
+class FakeRoot:
+    """Stands in for a Tk window: records after() jobs and fails the test if
+    any thread but the one that created it touches it, as Tk would hang."""
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.jobs = {}
+        self._ids = itertools.count()
+
+    def _check_thread(self):
+        if threading.current_thread() is not self.thread:
+            raise AssertionError("Tk called from the save worker thread")
+
+    def after(self, ms, callback, *args):
+        self._check_thread()
+        job = next(self._ids)
+        self.jobs[job] = (callback, args)
+        return job
+
+    def after_cancel(self, job):
+        self._check_thread()
+        self.jobs.pop(job, None)
+
+    def run_pending(self):
+        jobs, self.jobs = self.jobs, {}
+        for callback, args in jobs.values():
+            callback(*args)
+
+class SaveWorkerTest(unittest.TestCase):
+    def test_flush_runs_handed_back_callbacks_and_the_save_they_queue(self):
+        root = FakeRoot()
+        written = []
+        data = ["first"]
+
+        def write(snapshots):
+            written.append(snapshots[-1])
+            if snapshots[-1] == "first": # e.g. another window saved first: merge, then save again
+                worker.hand_back(merge)
+
+        def merge():
+            data[0] = "merged"
+            worker.mark_dirty()
+
+        worker = SaveWorker(root, snapshot=lambda: data[0], write=write)
+        worker.mark_dirty()
+        worker.flush()
+        self.assertEqual(written, ["first", "merged"])
+        self.assertTrue(worker.is_idle())
+
+    def test_errors_reach_on_error_on_the_tk_thread(self):
+        root = FakeRoot()
+        errors = []
+
+        def write(snapshots):
+            raise OSError("disk full")
+
+        def on_error(error, snapshots):
+            errors.append((threading.current_thread(), str(error), snapshots))
+
+        worker = SaveWorker(root, snapshot=lambda: 1, write=write, on_error=on_error)
+        worker.mark_dirty()
+        root.run_pending() # The delay timer fires: the snapshot goes to the worker
+        while not errors:
+            root.run_pending() # The event loop keeps polling while the save is in flight
+            time.sleep(0.01)
+        self.assertEqual(errors, [(root.thread, "disk full", [1])])
+
+    def test_without_a_root_callbacks_run_on_the_worker(self):
+        threads = []
+        worker = SaveWorker(None, snapshot=lambda: 1,
+                            write=lambda snapshots: worker.hand_back(lambda: threads.append(threading.current_thread())))
+        worker.mark_dirty()
+        worker.flush()
+        self.assertEqual(threads, [worker._thread])
+
+if __name__ == "__main__":
+    unittest.main()
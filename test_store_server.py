@@ -0,0 +1,156 @@
+import asyncio
+import json
+import os
+import stat
+import subprocess
+import sys
+import time
+import unittest
+
+import contact_store
+import store_server
+from store_server import RequestError, StoreClient
+from task_store import new_task, read_tasks, write_tasks
+from test_contact_store import HERE, BookTestCase
+
+def save_task_elsewhere(description):
+    """What the todo window or the task_store command line does to tasks.json."""
+    tasks = read_tasks()
+    tasks.append(new_task(description))
+    write_tasks(tasks)
+
+def start_task_cli(*args):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [HERE, os.environ.get('PYTHONPATH')])))
+    return subprocess.Popen([sys.executable, os.path.join(HERE, "task_store.py"), *args], env=env,
+                            stdout=subprocess.DEVNULL)
+
+class StoreServerTest(BookTestCase):
+    def serve(self, scenario):
+        """Runs scenario(server, client) against a server on a Unix socket, then stops it."""
+        async def main():
+            server = store_server.StoreServer(sync_interval=0.05)
+            ready = asyncio.Event()
+            serving = asyncio.create_task(server.serve(path="store.sock", ready=ready))
+            await ready.wait()
+            client = await store_server.StoreClient.connect(path="store.sock")
+            try:
+                await scenario(server, client)
+            finally:
+                await client.close()
+                serving.cancel()
+                await asyncio.gather(serving, return_exceptions=True)
+        asyncio.run(main())
+
+    def test_socket_is_private(self):
+        async def scenario(server, client):
+            self.assertEqual(stat.S_IMODE(os.stat("store.sock").st_mode), 0o600)
+        self.serve(scenario)
+
+    def test_pipelined_requests_are_answered_in_order(self):
+        async def scenario(server, client):
+            reader, writer = await asyncio.open_unix_connection("store.sock")
+            requests = [{"seq": 1, "op": "tasks.add", "description": "first"}, {"seq": 2, "op": "tasks.count"},
+                        {"seq": 3, "op": "tasks.add", "description": "second"}, {"seq": 4, "op": "tasks.count"},
+                        {"seq": 5, "op": "ping"}]
+            writer.write(b"".join(json.dumps(request).encode() + b"\n" for request in requests)) # All before any reply
+            await writer.drain()
+            replies = [json.loads(await reader.readline()) for _ in requests]
+            writer.close()
+            await writer.wait_closed()
+            self.assertEqual([reply['seq'] for reply in replies], [1, 2, 3, 4, 5])
+            self.assertEqual([replies[1]['result'], replies[3]['result']], [1, 2]) # Each read sees the writes before it
+        self.serve(scenario)
+
+    def test_batch_requests_succeed_or_fail_one_by_one(self):
+        async def scenario(server, client):
+            results = await client.batch([{"op": "contacts.add", "name": "Alice", "phone": "555 0100"},
+                                          {"op": "contacts.add", "name": "Alice", "phone": "555 0101"},
+                                          {"op": "contacts.count"}])
+            self.assertEqual(results[0]['phone'], "555 0100")
+            self.assertIsInstance(results[1], RequestError)
+            self.assertEqual(results[2], 1)
+        self.serve(scenario)
+        self.assertEqual(self.names(self.reopen()), ["Alice"])
+
+    def test_concurrent_clients(self):
+        async def scenario(server, client):
+            clients = [await StoreClient.connect(path="store.sock") for _ in range(5)]
+            try:
+                await asyncio.gather(*[other.call("tasks.add", description=f"{i}.{n}")
+                                       for i, other in enumerate(clients) for n in range(20)])
+            finally:
+                for other in clients:
+                    await other.close()
+            self.assertEqual(await client.call("tasks.count"), 100)
+        self.serve(scenario)
+        self.assertEqual(len(read_tasks()), 100)
+
+    def test_failed_saves_are_kept_and_retried(self):
+        append_journal = contact_store._append_journal
+        def fail_once(restore, *args):
+            restore()
+            raise OSError("disk full")
+        async def scenario(server, client):
+            store_server.write_tasks = lambda tasks: fail_once(lambda: setattr(store_server, 'write_tasks', write_tasks))
+            contact_store._append_journal = lambda *entries: fail_once(
+                lambda: setattr(contact_store, '_append_journal', append_journal))
+            try:
+                task, contact, count = await client.batch([{"op": "tasks.add", "description": "kept"},
+                                                           {"op": "contacts.add", "name": "Alice", "phone": "555 0100"},
+                                                           {"op": "tasks.count"}])
+                self.assertIn("disk full", client.unsaved)
+                self.assertEqual(count, 1)
+            finally:
+                store_server.write_tasks = write_tasks
+                contact_store._append_journal = append_journal
+            self.assertEqual((await client.call("tasks.get", id=task['id']))['description'], "kept")
+            self.assertEqual((await client.call("contacts.get", id=contact['id']))['name'], "Alice")
+            for _ in range(100): # Until the retries have saved both
+                if server._unsaved == set() and read_tasks():
+                    break
+                await asyncio.sleep(0.05)
+            self.assertEqual(await client.call("ping"), "pong")
+            self.assertIsNone(client.unsaved)
+        self.serve(scenario)
+        self.assertEqual([task['description'] for task in read_tasks()], ["kept"])
+        self.assertEqual(self.names(self.reopen()), ["Alice"])
+
+    def test_task_saves_merge_a_save_made_meanwhile(self):
+        save_task_elsewhere("from the window")
+        async def scenario(server, client):
+            sync = server._sync
+            def sync_then_another_save():
+                sync()
+                save_task_elsewhere("saved while the server was writing") # After the sync, before our save
+            server._sync = sync_then_another_save
+            await client.call("tasks.add", description="from the server")
+            server._sync = sync
+            self.assertEqual(await client.call("tasks.count"), 3)
+        self.serve(scenario)
+        self.assertEqual(sorted(task['description'] for task in read_tasks()),
+                         ["from the server", "from the window", "saved while the server was writing"])
+
+    def test_task_saves_hold_off_other_processes(self):
+        async def scenario(server, client):
+            processes = []
+            def write_while_another_process_saves(tasks):
+                processes.append(start_task_cli("add", "from the command line"))
+                time.sleep(0.5) # Time enough to read tasks.json, were it not waiting for our save
+                return write_tasks(tasks)
+            store_server.write_tasks = write_while_another_process_saves
+            try:
+                await client.call("tasks.add", description="from the server")
+            finally:
+                store_server.write_tasks = write_tasks
+            self.assertEqual(await asyncio.get_running_loop().run_in_executor(None, processes[0].wait), 0)
+            for _ in range(100): # Until the server has synced the command line's save
+                if await client.call("tasks.count") == 2:
+                    break
+                await asyncio.sleep(0.05)
+            self.assertEqual(await client.call("tasks.count"), 2)
+        self.serve(scenario)
+        self.assertEqual(sorted(task['description'] for task in read_tasks()),
+                         ["from the command line", "from the server"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import datetime
+import random
+import unittest
+
+from task_store import TaskOrder, TaskSearchIndex, description_words, filter_tasks, follow_up_task, new_task, next_due
+
+def local_ts(*args):
+    return int(datetime.datetime(*args).timestamp())
+
+class RecurrenceTest(unittest.TestCase):
+    def recurring_task(self, due_ts, repeat):
+        task = new_task("pay rent")
+        task.update(due_ts=due_ts, repeat=repeat, repeat_anchor_ts=due_ts)
+        return task
+
+    def test_monthly_keeps_its_day_after_a_short_month(self):
+        task = self.recurring_task(local_ts(2024, 1, 31, 9), "monthly")
+        dues = []
+        for _ in range(4):
+            task = follow_up_task(task, None, task['due_ts'])
+            dues.append(datetime.datetime.fromtimestamp(task['due_ts']))
+        self.assertEqual([(d.month, d.day, d.hour) for d in dues], [(2, 29, 9), (3, 31, 9), (4, 30, 9), (5, 31, 9)])
+
+    def test_completed_late_skips_to_the_next_occurrence(self):
+        task = self.recurring_task(local_ts(2024, 3, 4, 8), "weekly")
+        follow_up = follow_up_task(task, None, local_ts(2024, 3, 20, 12))
+        self.assertEqual(follow_up['due_ts'], local_ts(2024, 3, 25, 8))
+        self.assertEqual(follow_up['repeat_anchor_ts'], task['due_ts'])
+
+    def test_tasks_without_an_anchor_count_from_their_due_time(self):
+        task = self.recurring_task(local_ts(2024, 2, 29, 9), "monthly")
+        task['repeat_anchor_ts'] = None # Saved before anchors existed
+        self.assertEqual(follow_up_task(task, None, task['due_ts'])['due_ts'], local_ts(2024, 3, 29, 9))
+        self.assertEqual(next_due(local_ts(2024, 1, 31, 9), "daily", local_ts(2024, 1, 31, 9)), local_ts(2024, 2, 1, 9))
+
+def brute_force_filter(tasks, text, status, added):
+    """What filter_tasks should return, by checking every task in display order."""
+    start_ts, end_ts = added
+    query = description_words(text)
+    return [task for task in tasks
+            if status in ("all", task['status'])
+            and (start_ts is None or task['added_ts'] >= start_ts) and (end_ts is None or task['added_ts'] < end_ts)
+            and all(any(word.startswith(prefix) for word in description_words(task['description'])) for prefix in query)]
+
+class FilterTest(unittest.TestCase):
+    def test_matches_brute_force(self):
+        rng = random.Random(15)
+        common = ["call", "car", "cat", "buy", "milk"]
+        rare = ["taxes", "paint", "laptop"]
+        tasks = []
+        for _ in range(3000):
+            task = new_task(" ".join(rng.sample(common, 2) + ([rng.choice(rare)] if rng.random() < 0.02 else [])))
+            task.update(added_ts=rng.randrange(1000), status=rng.choice(["pending", "completed"]))
+            tasks.append(task)
+        order = TaskOrder(tasks)
+        index = TaskSearchIndex(order.tasks)
+        for text in ["", "c", "ca", "call", "call car", "car call", "cat milk", "ta", "paint", "taxes c", "zzz"]:
+            for status in ("all", "pending", "completed"):
+                for added in ((None, None), (100, 900), (400, 410)):
+                    self.assertEqual(filter_tasks(order, index, text, status, added),
+                                     brute_force_filter(order.tasks, text, status, added), (text, status, added))
+
+if __name__ == "__main__":
+    unittest.main()
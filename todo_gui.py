@@ -1,45 +1,111 @@
-import json
-import os
 import datetime
+import heapq
+import threading
+import time
 import tkinter as tk
 from tkinter import ttk  # For themed widgets (optional but nice)
 from tkinter import messagebox
 from tkinter import simpledialog
+from save_worker import SaveWorker, file_lock
+from file_watcher import FileWatcher, file_digest
+from instrumentation import timed
+from task_store import (REPEAT_CHOICES, TASKS_FILE, TaskOrder, TaskSearchIndex, archive_old_tasks,
+    assign_task_ids, filter_tasks, follow_up_task, format_timestamp, is_overdue, list_archive_months,
+    load_archive_segment, merge_tasks, new_task, parse_date, parse_timestamp, read_tasks_with_digest, timestamp_now,
+    write_tasks)
 
-TASKS_FILE = "tasks.json"
+FILTER_DELAY_MS = 150 # Debounce for the search entry
+MAX_TIMER_MS = 60 * 60 * 1000 # Re-check the clock at least hourly (suspend, clock changes)
 
-# --- Core Data Logic (Slightly modified for GUI feedback) ---
+# --- Loading and Saving (with error dialogs; see task_store.py for the data itself) ---
 
 def load_tasks():
-    """Loads tasks from the JSON file."""
-    if not os.path.exists(TASKS_FILE):
-        return []
+    """Loads tasks from the task file. Returns them with the digest of the
+    file they were read from."""
     try:
-        with open(TASKS_FILE, 'r') as f:
-            tasks = json.load(f)
-            # Ensure tasks have required keys, provide defaults if missing
-            for task in tasks:
-                task.setdefault('status', 'pending')
-                task.setdefault('added_on', 'unknown')
-                task.setdefault('completed_on', None)
-            return tasks
-    except (json.JSONDecodeError, IOError) as e:
+        return read_tasks_with_digest()
+    except (ValueError, IOError) as e:
         messagebox.showerror("Load Error", f"Error loading tasks: {e}\nStarting with an empty list.")
-        return []
     except Exception as e:
         messagebox.showerror("Load Error", f"An unexpected error occurred loading tasks: {e}\nStarting empty.")
-        return []
+    return [], file_digest(TASKS_FILE)
 
 
-def save_tasks(tasks):
-    """Saves the current list of tasks to the JSON file."""
-    try:
-        with open(TASKS_FILE, 'w') as f:
-            json.dump(tasks, f, indent=4)
-    except IOError as e:
-        messagebox.showerror("Save Error", f"Error saving tasks: {e}")
-    except Exception as e:
-        messagebox.showerror("Save Error", f"An unexpected error occurred saving tasks: {e}")
+# --- Reminders ---
+
+class ReminderScheduler:
+    """Fires on_due(tasks) when pending tasks reach their due time.
+
+    Tasks wait in a heap keyed by due time and only one root.after() timer is
+    ever pending, armed for the earliest entry, so an idle app costs nothing
+    however many tasks are scheduled and each firing is O(log n). Rescheduled
+    or cancelled tasks leave stale heap entries behind; they are skipped when
+    popped and the heap is rebuilt once they outnumber the live ones."""
+
+    def __init__(self, root, on_due):
+        self.root = root
+        self.on_due = on_due
+        self._heap = [] # (due_ts, seq, task)
+        self._due = {} # id(task) -> (due_ts, task) for live entries
+        self._seq = 0
+        self._timer = None
+        self._timer_ts = None
+
+    def schedule(self, task):
+        """(Re)schedules a task by its due_ts; unschedules it if it has none,
+        is completed, or its reminder for that time already went off."""
+        due_ts = task.get('due_ts')
+        if due_ts is None or task.get('status') == 'completed' or task.get('reminded_ts') == due_ts:
+            self.unschedule(task)
+            return
+        if self._due.get(id(task), (None,))[0] == due_ts:
+            return
+        self._due[id(task)] = (due_ts, task)
+        self._seq += 1
+        heapq.heappush(self._heap, (due_ts, self._seq, task))
+        self._arm()
+
+    def schedule_many(self, tasks):
+        for task in tasks:
+            if task.get('due_ts') is not None:
+                self.schedule(task)
+
+    def unschedule(self, task):
+        if self._due.pop(id(task), None) is not None and len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [entry for entry in self._heap if self._is_live(entry)]
+            heapq.heapify(self._heap)
+
+    def _is_live(self, entry):
+        due_ts, _, task = entry
+        return self._due.get(id(task), (None,))[0] == due_ts
+
+    def _arm(self):
+        """Points the single timer at the earliest live entry."""
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+        next_ts = self._heap[0][0] if self._heap else None
+        if next_ts == self._timer_ts:
+            return
+        if self._timer is not None:
+            self.root.after_cancel(self._timer)
+            self._timer = self._timer_ts = None
+        if next_ts is not None:
+            delay_ms = int(max(0, next_ts - time.time()) * 1000)
+            self._timer = self.root.after(min(delay_ms, MAX_TIMER_MS), self._fire)
+            self._timer_ts = next_ts
+
+    def _fire(self):
+        self._timer = self._timer_ts = None
+        now = time.time()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._is_live(entry):
+                del self._due[id(entry[2])]
+                due.append(entry[2])
+        if due:
+            self.on_due(due)
+        self._arm()
 
 # --- Tkinter GUI Application Class ---
 
@@ -47,18 +113,80 @@ class TodoApp:
     def __init__(self, root):
         self.root = root
         self.root.title("To-Do List Application")
-        self.root.geometry("600x450") # Adjusted size
-
-        self.tasks = load_tasks()
+        self.root.geometry("600x520") # Adjusted size
+
+        # What tasks.json held when we last read or wrote it: lets changes made
+        # by other windows be told apart from our own (see sync_from_disk)
+        self._disk_lock = threading.Lock()
+        self.tasks, self._disk_digest = load_tasks()
+        missing_ids = assign_task_ids(self.tasks) # Files from before task ids
+        self._disk_tasks = {task['id']: dict(task) for task in self.tasks}
+        try:
+            self.tasks, archived_count = archive_old_tasks(self.tasks)
+        except Exception as e:
+            archived_count = 0
+            messagebox.showwarning("Archive Error", f"Could not archive old completed tasks: {e}")
+        # All changes to the order of self.tasks go through self.order
+        self.order = TaskOrder(self.tasks)
+        self.search_index = TaskSearchIndex(self.tasks)
+        self.task_filter = None # filter_tasks() keyword arguments while a filter is applied
+        self._filter_job = None
+        self.reminders = ReminderScheduler(root, self.on_tasks_due)
+        self.reminders.schedule_many(self.tasks) # Reminders missed while closed fire right away
+
+        # Saves run on a background thread; bursts of edits become one write
+        self.save_worker = SaveWorker(root,
+                                      snapshot=lambda: (self._disk_digest, [dict(task) for task in self.tasks]),
+                                      write=self.write_snapshot,
+                                      on_error=self.on_save_error)
+        # Other windows' saves are read and parsed off the Tk thread too
+        self.disk_reader = SaveWorker(root, snapshot=lambda: self._disk_digest, write=self.read_disk_changes,
+                                      delay_ms=0, name="tasks-reader")
+        self._save_after_sync = False
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        if archived_count or missing_ids:
+            self.save_worker.mark_dirty() # Drop the archived tasks from tasks.json, store new ids
+        # Other windows open on the same file are merged in as they save
+        self.watcher = FileWatcher(root, [TASKS_FILE], self.on_file_changed)
 
         # Style (Optional)
         self.style = ttk.Style()
         self.style.theme_use("clam") # Or 'alt', 'default', 'classic'
 
         # --- GUI Elements ---
+        # Frame for Search and Filters
+        self.filter_frame = ttk.Frame(root)
+        self.filter_frame.pack(pady=(10, 0), padx=10, fill=tk.X)
+
+        ttk.Label(self.filter_frame, text="Search:").grid(row=0, column=0, sticky=tk.W)
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", self.on_filter_changed) # Live filter as you type
+        self.search_entry = ttk.Entry(self.filter_frame, textvariable=self.search_var, width=30)
+        self.search_entry.grid(row=0, column=1, columnspan=3, padx=5, sticky=tk.EW)
+
+        self.status_var = tk.StringVar(value="all")
+        self.status_box = ttk.Combobox(self.filter_frame, textvariable=self.status_var, width=10,
+                                       values=("all", "pending", "completed"), state="readonly")
+        self.status_box.grid(row=0, column=4, padx=5)
+        self.status_box.bind("<<ComboboxSelected>>", self.apply_filter)
+
+        ttk.Button(self.filter_frame, text="Clear", command=self.clear_filter).grid(row=0, column=5)
+
+        # Date ranges (YYYY-MM-DD, both ends inclusive, blank = open); applied on Enter
+        self.date_vars = {}
+        for row, (field, label) in enumerate((("added", "Added from:"), ("completed", "Completed from:")), start=1):
+            ttk.Label(self.filter_frame, text=label).grid(row=row, column=0, sticky=tk.W)
+            for column, end in ((1, "from"), (3, "to")):
+                var = self.date_vars[field, end] = tk.StringVar()
+                entry = ttk.Entry(self.filter_frame, textvariable=var, width=12)
+                entry.grid(row=row, column=column, padx=5, pady=2, sticky=tk.W)
+                entry.bind("<Return>", self.apply_filter)
+            ttk.Label(self.filter_frame, text="to").grid(row=row, column=2)
+        self.filter_frame.columnconfigure(1, weight=1)
+
         # Frame for Listbox and Scrollbar
         self.list_frame = ttk.Frame(root)
-        self.list_frame.pack(pady=10, padx=10, fill=tk.BOTH, expand=True)
+        self.list_frame.pack(pady=(5, 10), padx=10, fill=tk.BOTH, expand=True)
 
         # Scrollbar
         self.scrollbar = ttk.Scrollbar(self.list_frame, orient=tk.VERTICAL)
@@ -67,7 +195,7 @@ class TodoApp:
         # Listbox
         self.task_listbox = tk.Listbox(self.list_frame, width=70, height=15,
                                        yscrollcommand=self.scrollbar.set,
-                                       selectmode=tk.SINGLE, # Allow selecting only one task
+                                       selectmode=tk.EXTENDED, # Shift/Ctrl-click to select several tasks
                                        font=("Arial", 11))
         self.task_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         self.scrollbar.config(command=self.task_listbox.yview)
@@ -99,128 +227,505 @@ class TodoApp:
         self.delete_button = ttk.Button(self.action_frame, text="Delete Task", command=self.delete_task_gui)
         self.delete_button.pack(side=tk.LEFT, padx=5)
 
+        self.due_button = ttk.Button(self.action_frame, text="Set Due...", command=self.set_due_gui)
+        self.due_button.pack(side=tk.LEFT, padx=5)
+
+        self.history_button = ttk.Button(self.action_frame, text="History...", command=self.show_history_gui)
+        self.history_button.pack(side=tk.RIGHT, padx=5)
+
         # --- Initial Load ---
+        self.rows = [] # (task, text, colour, sort key) for each listbox row, as last drawn
         self.refresh_task_list()
 
-    def refresh_task_list(self):
-        """Clears and repopulates the listbox with current tasks."""
-        self.task_listbox.delete(0, tk.END) # Clear existing items
-
-        # Sort tasks: pending first, then by added date
-        try:
-             # Sort safely, handling potential missing or malformed dates
-            self.tasks.sort(key=lambda x: (x['status'] == 'completed', x.get('added_on', '')))
-        except Exception as e:
-            print(f"Warning: Error during sorting - {e}") # Log sort error, but continue
-
-        # Populate listbox
-        self.task_map = {} # Map listbox index to actual task index in self.tasks
-        listbox_idx = 0
-        for i, task in enumerate(self.tasks):
-            status_symbol = "[X]" if task.get('status', 'pending') == 'completed' else "[ ]"
-            added_date = task.get('added_on', 'N/A')
-            desc = task.get('description', 'No Description')
-            display_text = f"{status_symbol} {desc} (Added: {added_date})"
-            if task.get('status') == 'completed':
-                completed_date = task.get('completed_on', 'N/A')
-                display_text += f" (Completed: {completed_date})"
-
-            self.task_listbox.insert(tk.END, display_text)
-            self.task_map[listbox_idx] = i # Store mapping
-            # Optional: Color completed tasks differently
-            if task.get('status') == 'completed':
-                self.task_listbox.itemconfig(listbox_idx, {'fg': 'gray'})
+    def on_save_error(self, error, snapshots):
+        messagebox.showerror("Save Error", f"Error saving tasks: {error}")
+
+    def on_close(self):
+        # Don't lose edits still waiting for the background write (or for a
+        # merge with another window's save: flush runs sync_then_save too)
+        while True:
+            self.save_worker.flush()
+            self.disk_reader.flush()
+            if self.save_worker.is_idle():
+                break
+        self.watcher.close()
+        self.root.destroy()
+
+    # --- Sharing tasks.json with other windows ---
+
+    def write_snapshot(self, snapshots):
+        """Save worker thread: writes the newest snapshot, unless the file no
+        longer holds what the snapshot was based on (another window saved).
+        Then the save is handed back to the Tk thread to merge those changes
+        in first, rather than overwriting them."""
+        base_digest, tasks = snapshots[-1]
+        # The file lock keeps other windows from saving between our check and
+        # our write, or before we have noted what we wrote
+        with file_lock(TASKS_FILE):
+            if file_digest(TASKS_FILE) != base_digest:
+                self.save_worker.hand_back(self.sync_then_save)
+                return
+            digest = write_tasks(tasks)
+            with self._disk_lock:
+                self._disk_digest = digest
+                self._disk_tasks = {task['id']: task for task in tasks}
+
+    def sync_then_save(self):
+        self._save_after_sync = True
+        self.sync_from_disk()
+
+    def on_file_changed(self, paths):
+        self.sync_from_disk() # A no-op when the change was our own save
+
+    def sync_from_disk(self):
+        """Merges what other windows saved to tasks.json into ours. The file is
+        read on the disk_reader thread (see read_disk_changes)."""
+        self.disk_reader.mark_dirty()
+
+    def read_disk_changes(self, snapshots):
+        """Reader thread: reads tasks.json if it no longer holds what we last
+        knew, and hands what it read back to apply_disk_changes."""
+        digest, theirs = snapshots[-1], None
+        if file_digest(TASKS_FILE) != digest:
+            try:
+                theirs, digest = read_tasks_with_digest() # Saves replace the file whole, so no lock is needed
+                assign_task_ids(theirs) # Saved by a version without task ids
+            except (ValueError, IOError) as e:
+                print(f"Warning: Could not read changed {TASKS_FILE} - {e}") # Retried on the next change
+                theirs = None
+        self.disk_reader.hand_back(self.apply_disk_changes, digest, theirs)
+
+    def apply_disk_changes(self, digest, theirs):
+        if theirs is not None:
+            with self._disk_lock:
+                if digest == self._disk_digest: # Our own save, written since the read was asked for
+                    theirs = None
+                else:
+                    base = self._disk_tasks
+                    self._disk_tasks = {task['id']: task for task in theirs}
+                    self._disk_digest = digest
+        if theirs is not None and self.merge_tasks(base, self._disk_tasks):
+            self.refresh_task_list(resort=False) # Only the changed rows are redrawn
+        if self._save_after_sync:
+            self._save_after_sync = False
+            self.save_worker.mark_dirty()
+
+    def merge_tasks(self, base, theirs):
+        """Applies what another window changed between 'base' (the file as we
+        last knew it) and 'theirs' (the file now) to self.tasks (see
+        task_store.merge_tasks). Returns the number of tasks changed."""
+        added, updated, removed = merge_tasks(base, theirs, {task['id']: task for task in self.tasks})
+        for their_task in added:
+            task = dict(their_task)
+            self.order.insert(task)
+            self.search_index.add(task)
+            self.reminders.schedule(task)
+        for our_task, their_task in updated:
+            self.order.pop(self.order.index_of(our_task))
+            old_description = our_task['description']
+            our_task.clear()
+            our_task.update(their_task)
+            self.order.insert(our_task) # Status or dates may have moved it
+            self.search_index.update(our_task, old_description)
+            self.reminders.schedule(our_task)
+        for our_task in removed:
+            self.order.pop(self.order.index_of(our_task))
+            self.search_index.remove(our_task)
+            self.reminders.unschedule(our_task)
+        return len(added) + len(updated) + len(removed)
+
+    def task_row(self, task):
+        """Returns the display text and colour for one task."""
+        status_symbol = "[X]" if task.get('status', 'pending') == 'completed' else "[ ]"
+        added_date = task.get('added_on', 'N/A')
+        desc = task.get('description', 'No Description')
+        display_text = f"{status_symbol} {desc} (Added: {added_date})"
+        if task.get('due_on'):
+            repeat = f", {task['repeat']}" if task.get('repeat') else ""
+            display_text += f" (Due: {task['due_on']}{repeat})"
+        if task.get('status') == 'completed':
+            completed_date = task.get('completed_on', 'N/A')
+            display_text += f" (Completed: {completed_date})"
+        # Optional: Color completed tasks differently
+        if task.get('status') == 'completed':
+            color = 'gray'
+        elif is_overdue(task):
+            color = 'red'
+        else:
+            color = 'black'
+        return display_text, color
+
+    def visible_tasks(self):
+        """The tasks the listbox should show, in order."""
+        if self.task_filter is None:
+            return self.tasks
+        return filter_tasks(self.order, self.search_index, **self.task_filter)
+
+    @timed('tasks.refresh_task_list')
+    def refresh_task_list(self, resort=True):
+        """Brings the listbox in line with visible_tasks() after a wholesale change.
+
+        Both the rows on screen and the new rows are in display order, so one
+        merge pass over the sort key each row was drawn with finds the rows
+        that were inserted, deleted or changed, and only those are touched.
+        Single edits use insert_row/delete_row/redraw_row instead. Pass
+        resort=False when self.order is already up to date."""
+        if resort:
+            self.order.rebuild() # Renumbers every key: all rows are redrawn
+
+        sort_key = self.order.sort_key
+        old_rows = self.rows
+        new_rows = [(task,) + self.task_row(task) + (sort_key(task),) for task in self.visible_tasks()]
+        listbox = self.task_listbox
+        # Row j of the listbox is new_rows[j] before it and old_rows[i] after it
+        n_old, n_new = len(old_rows), len(new_rows)
+        i = j = 0
+        while i < n_old or j < n_new:
+            if i < n_old and j < n_new:
+                old_task, old_text, old_color, old_key = old_rows[i]
+                new_task, new_text, new_color, new_key = new_rows[j]
+                if old_task is new_task and old_key == new_key:
+                    if new_text != old_text:
+                        listbox.delete(j)
+                        listbox.insert(j, new_text)
+                        listbox.itemconfig(j, {'fg': new_color})
+                    elif new_color != old_color:
+                        listbox.itemconfig(j, {'fg': new_color})
+                    i += 1
+                    j += 1
+                    continue
+            if j == n_new or (i < n_old and old_rows[i][3] <= new_rows[j][3]):
+                # old_rows[i] is no longer shown, nor are the rows after it up to the next new one
+                first = i
+                i += 1
+                while i < n_old and (j == n_new or old_rows[i][3] < new_rows[j][3]):
+                    i += 1
+                listbox.delete(j, j + i - first - 1)
             else:
-                 self.task_listbox.itemconfig(listbox_idx, {'fg': 'black'})
-            listbox_idx += 1
+                first = j
+                j += 1
+                while j < n_new and (i == n_old or new_rows[j][3] < old_rows[i][3]):
+                    j += 1
+                listbox.insert(first, *(row[1] for row in new_rows[first:j]))
+                for index in range(first, j):
+                    listbox.itemconfig(index, {'fg': new_rows[index][2]})
+        self.rows = new_rows
+
+    # The row helpers below rely on listbox row i showing self.tasks[i], which
+    # only holds while no filter is applied; otherwise they re-filter instead.
+
+    def insert_row(self, index, task):
+        """Shows a task just filed at 'index' by self.order."""
+        if self.task_filter is not None:
+            self.refresh_task_list(resort=False)
+            return
+        text, color = self.task_row(task)
+        self.rows.insert(index, (task, text, color, self.order.sort_key(task)))
+        self.task_listbox.insert(index, text)
+        self.task_listbox.itemconfig(index, {'fg': color})
+
+    def delete_row(self, index):
+        if self.task_filter is not None:
+            self.refresh_task_list(resort=False)
+            return
+        del self.rows[index]
+        self.task_listbox.delete(index)
+
+    def redraw_row(self, index):
+        """Re-renders one row after its task changed in place."""
+        if self.task_filter is not None:
+            self.refresh_task_list(resort=False)
+            return
+        task = self.tasks[index]
+        text, color = self.task_row(task)
+        self.rows[index] = (task, text, color, self.order.sort_key(task))
+        self.task_listbox.delete(index)
+        self.task_listbox.insert(index, text)
+        self.task_listbox.itemconfig(index, {'fg': color})
 
 
     def add_task_gui(self, event=None): # Add event=None for Enter key binding
         """Adds a task from the entry field."""
         description = self.task_entry.get().strip()
         if description:
-            new_task = {
-                "description": description,
-                "status": "pending",
-                "added_on": datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
-                "completed_on": None
-            }
-            self.tasks.append(new_task)
-            save_tasks(self.tasks)
-            self.refresh_task_list()
+            task = new_task(description)
+            index = self.order.insert(task)
+            self.search_index.add(task)
+            self.save_worker.mark_dirty()
+            self.insert_row(index, task)
             self.task_entry.delete(0, tk.END) # Clear entry field
             # Optional: messagebox.showinfo("Success", f"Task '{description}' added.")
         else:
             messagebox.showwarning("Input Error", "Task description cannot be empty.")
 
-    def get_selected_task_index(self):
-        """Gets the index from the core tasks list based on listbox selection."""
+    def get_selected_task_indices(self):
+        """Gets the indices in the core tasks list of every selected row."""
         try:
             selected_listbox_indices = self.task_listbox.curselection()
             if not selected_listbox_indices:
                 messagebox.showwarning("Selection Error", "Please select a task first.")
                 return None
-            listbox_index = selected_listbox_indices[0]
-            # Use the map to find the original index in self.tasks
-            original_task_index = self.task_map.get(listbox_index)
-            if original_task_index is None or original_task_index >= len(self.tasks):
+            rows = [int(index) for index in selected_listbox_indices]
+            if max(rows) >= len(self.rows):
                  messagebox.showerror("Internal Error", "Task mapping failed. Please restart.")
                  return None
-            return original_task_index
+            # Map the shown rows back to positions in self.tasks (they differ while filtered)
+            return [self.order.index_of(self.rows[row][0]) for row in rows]
         except Exception as e:
             messagebox.showerror("Error", f"Could not get selected task: {e}")
             return None
 
+    # --- Bulk operations (one save and one refresh per call) ---
+
+    def complete_tasks(self, indices):
+        """Marks the tasks at the given indices complete. Returns how many
+        changed (tasks that were already complete are left alone)."""
+        indices = sorted({i for i in indices if self.tasks[i]['status'] != 'completed'}, reverse=True)
+        if not indices:
+            return 0
+        # Completing moves tasks to the other partition; pop from the end so indices stay valid
+        tasks = [self.order.pop(i) for i in indices]
+        completed_on, completed_ts = timestamp_now()
+        new_indices = []
+        follow_ups = []
+        for task in tasks:
+            task['status'] = 'completed'
+            task['completed_on'], task['completed_ts'] = completed_on, completed_ts
+            new_indices.append(self.order.insert(task))
+            self.reminders.unschedule(task)
+            if task.get('repeat') and task.get('due_ts') is not None:
+                # A recurring task comes back as a new pending task for its next occurrence
+                follow_up = follow_up_task(task, completed_on, completed_ts)
+                self.order.insert(follow_up)
+                self.search_index.add(follow_up)
+                self.reminders.schedule(follow_up)
+                follow_ups.append(follow_up)
+        self.save_worker.mark_dirty()
+        if len(tasks) == 1 and not follow_ups:
+            self.delete_row(indices[0])
+            self.insert_row(new_indices[0], tasks[0])
+        else:
+            self.refresh_task_list(resort=False)
+        return len(tasks)
+
+    def delete_tasks(self, indices):
+        """Deletes the tasks at the given indices. Returns how many were deleted."""
+        indices = sorted(set(indices), reverse=True)
+        if not indices:
+            return 0
+        for i in indices:
+            task = self.order.pop(i)
+            self.search_index.remove(task)
+            self.reminders.unschedule(task)
+        self.save_worker.mark_dirty()
+        if len(indices) == 1:
+            self.delete_row(indices[0])
+        else:
+            self.refresh_task_list(resort=False)
+        return len(indices)
+
+    def redescribe_tasks(self, indices, description):
+        """Sets the description of the tasks at the given indices. 'description'
+        is either the new text or a function mapping a task to its new text.
+        Returns how many descriptions changed."""
+        changed = []
+        for i in set(indices):
+            task = self.tasks[i]
+            new_description = description(task) if callable(description) else description
+            if new_description != task['description']:
+                old_description, task['description'] = task['description'], new_description
+                self.search_index.update(task, old_description)
+                changed.append(i)
+        if changed:
+            self.save_worker.mark_dirty()
+            if self.task_filter is not None:
+                self.refresh_task_list(resort=False)
+            else:
+                for i in changed:
+                    self.redraw_row(i) # Order doesn't depend on the description
+        return len(changed)
+
+    def set_due(self, indices, due_ts, repeat=None):
+        """Gives the tasks at the given indices a due time (epoch seconds, or
+        None to clear it) and optional repeat ('daily', 'weekly', 'monthly')."""
+        indices = set(indices)
+        due_on = format_timestamp(due_ts)
+        for i in indices:
+            task = self.tasks[i]
+            task['due_on'], task['due_ts'] = due_on, due_ts
+            task['repeat'] = repeat if due_ts is not None else None
+            task['repeat_anchor_ts'] = due_ts if task['repeat'] else None
+            task.pop('reminded_ts', None)
+            self.reminders.schedule(task)
+        if indices:
+            self.save_worker.mark_dirty()
+            if self.task_filter is not None or len(indices) > 1:
+                self.refresh_task_list(resort=False)
+            else:
+                self.redraw_row(indices.pop())
+        return len(indices)
+
+    def on_tasks_due(self, tasks):
+        """Called by the scheduler when tasks reach their due time."""
+        for task in tasks:
+            task['reminded_ts'] = task['due_ts'] # Don't remind again after a restart
+        self.save_worker.mark_dirty()
+        self.refresh_task_list(resort=False) # Recolour the now overdue rows
+        lines = [f"- {task['description']} (Due: {task['due_on']})" for task in tasks[:10]]
+        if len(tasks) > 10:
+            lines.append(f"... and {len(tasks) - 10} more")
+        messagebox.showinfo("Reminder", "Due now:\n" + "\n".join(lines))
 
     def mark_complete_gui(self):
-        """Marks the selected task as complete."""
-        task_index = self.get_selected_task_index()
-        if task_index is not None:
-            if self.tasks[task_index]['status'] == 'completed':
-                messagebox.showinfo("Already Done", "This task is already marked as complete.")
-            else:
-                self.tasks[task_index]['status'] = 'completed'
-                self.tasks[task_index]['completed_on'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
-                save_tasks(self.tasks)
-                self.refresh_task_list()
-                # Optional: messagebox.showinfo("Success", "Task marked as complete.")
+        """Marks the selected tasks as complete."""
+        task_indices = self.get_selected_task_indices()
+        if task_indices is not None:
+            if not self.complete_tasks(task_indices):
+                if len(task_indices) == 1:
+                    messagebox.showinfo("Already Done", "This task is already marked as complete.")
+                else:
+                    messagebox.showinfo("Already Done", "The selected tasks are already marked as complete.")
 
 
     def update_task_gui(self):
-        """Updates the description of the selected task."""
-        task_index = self.get_selected_task_index()
-        if task_index is not None:
-            current_description = self.tasks[task_index]['description']
-            new_description = simpledialog.askstring("Update Task",
-                                                     f"Enter new description for:",
+        """Updates the description of the selected tasks."""
+        task_indices = self.get_selected_task_indices()
+        if task_indices is not None:
+            descriptions = {self.tasks[i]['description'] for i in task_indices}
+            current_description = descriptions.pop() if len(descriptions) == 1 else ""
+            if len(task_indices) == 1:
+                prompt = "Enter new description for:"
+            else:
+                prompt = f"Enter new description for {len(task_indices)} tasks:"
+            new_description = simpledialog.askstring("Update Task", prompt,
                                                      initialvalue=current_description)
             if new_description is not None: # Check if user cancelled
                 new_description = new_description.strip()
                 if new_description:
-                     if new_description != current_description:
-                        self.tasks[task_index]['description'] = new_description
-                        # Optionally reset status? For now, keep status as is.
-                        # self.tasks[task_index]['status'] = 'pending'
-                        # self.tasks[task_index]['completed_on'] = None
-                        save_tasks(self.tasks)
-                        self.refresh_task_list()
-                        # Optional: messagebox.showinfo("Success", "Task updated.")
-                     else:
+                     # Optionally reset status? For now, keep status as is.
+                     if not self.redescribe_tasks(task_indices, new_description):
                          messagebox.showinfo("No Change", "Description is the same.")
+                     # Optional: messagebox.showinfo("Success", "Task updated.")
                 else:
                     messagebox.showwarning("Input Error", "New description cannot be empty.")
 
 
     def delete_task_gui(self):
-        """Deletes the selected task after confirmation."""
-        task_index = self.get_selected_task_index()
-        if task_index is not None:
-            task_desc = self.tasks[task_index]['description']
-            if messagebox.askyesno("Confirm Deletion", f"Are you sure you want to delete task:\n'{task_desc}'?"):
-                del self.tasks[task_index]
-                save_tasks(self.tasks)
-                self.refresh_task_list()
-                # Optional: messagebox.showinfo("Success", f"Task '{task_desc}' deleted.")
+        """Deletes the selected tasks after confirmation."""
+        task_indices = self.get_selected_task_indices()
+        if task_indices is not None:
+            if len(task_indices) == 1:
+                task_desc = self.tasks[task_indices[0]]['description']
+                question = f"Are you sure you want to delete task:\n'{task_desc}'?"
+            else:
+                question = f"Are you sure you want to delete {len(task_indices)} tasks?"
+            if messagebox.askyesno("Confirm Deletion", question):
+                self.delete_tasks(task_indices)
+
+    def set_due_gui(self):
+        """Sets or clears the due date and repeat of the selected tasks."""
+        task_indices = self.get_selected_task_indices()
+        if task_indices is None:
+            return
+        current = self.tasks[task_indices[0]]
+        due_text = simpledialog.askstring("Set Due Date",
+                                          "Due date and time (YYYY-MM-DD HH:MM), blank to clear:",
+                                          initialvalue=current.get('due_on') or "")
+        if due_text is None:
+            return
+        due_text = due_text.strip()
+        if not due_text:
+            self.set_due(task_indices, None)
+            return
+        due_ts = parse_timestamp(due_text)
+        if due_ts is None:
+            messagebox.showwarning("Input Error", "Due date must look like YYYY-MM-DD HH:MM.")
+            return
+        repeat = simpledialog.askstring("Repeat", "Repeat (daily, weekly, monthly), blank for none:",
+                                        initialvalue=current.get('repeat') or "")
+        if repeat is None:
+            return
+        repeat = repeat.strip().lower() or None
+        if repeat is not None and repeat not in REPEAT_CHOICES:
+            messagebox.showwarning("Input Error", "Repeat must be daily, weekly, monthly or blank.")
+            return
+        self.set_due(task_indices, due_ts, repeat)
+
+    # --- Search and Filtering ---
+
+    def on_filter_changed(self, *args):
+        """Debounces keystrokes in the search entry so only the last one queries."""
+        if self._filter_job is not None:
+            self.root.after_cancel(self._filter_job)
+        self._filter_job = self.root.after(FILTER_DELAY_MS, self.apply_filter)
+
+    def apply_filter(self, event=None):
+        """Reads the search bar and shows just the matching tasks."""
+        if self._filter_job is not None:
+            self.root.after_cancel(self._filter_job)
+            self._filter_job = None
+        ranges = {}
+        for field in ("added", "completed"):
+            try:
+                start_ts = parse_date(self.date_vars[field, "from"].get())
+                end_ts = parse_date(self.date_vars[field, "to"].get())
+            except ValueError:
+                messagebox.showwarning("Filter Error", f"{field.capitalize()} dates must look like YYYY-MM-DD.")
+                return
+            if end_ts is not None:
+                end_ts = int((datetime.datetime.fromtimestamp(end_ts) + datetime.timedelta(days=1)).timestamp())
+            ranges[field] = (start_ts, end_ts)
+        task_filter = dict(text=self.search_var.get(), status=self.status_var.get(), **ranges)
+        if not task_filter['text'].strip() and task_filter['status'] == "all" \
+                and ranges["added"] == ranges["completed"] == (None, None):
+            task_filter = None
+        self.task_filter = task_filter
+        self.refresh_task_list(resort=False)
+
+    def clear_filter(self):
+        self.search_var.set("")
+        self.status_var.set("all")
+        for var in self.date_vars.values():
+            var.set("")
+        self.apply_filter()
+
+    def show_history_gui(self):
+        """Opens a window for browsing archived tasks one month at a time."""
+        months = list_archive_months()
+        if not months:
+            messagebox.showinfo("History", "No archived tasks yet.")
+            return
+        window = tk.Toplevel(self.root)
+        window.title("Task History")
+        window.geometry("600x400")
+
+        month_var = tk.StringVar(value=months[0])
+        month_box = ttk.Combobox(window, textvariable=month_var, values=months, state="readonly")
+        month_box.pack(pady=5, padx=10, fill=tk.X)
+
+        history_frame = ttk.Frame(window)
+        history_frame.pack(pady=5, padx=10, fill=tk.BOTH, expand=True)
+        history_scrollbar = ttk.Scrollbar(history_frame, orient=tk.VERTICAL)
+        history_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        history_listbox = tk.Listbox(history_frame, yscrollcommand=history_scrollbar.set,
+                                     font=("Arial", 11), fg='gray')
+        history_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        history_scrollbar.config(command=history_listbox.yview)
+
+        segments = {} # Each month is read at most once per window
+        def show_month(event=None):
+            month = month_var.get()
+            if month not in segments:
+                try:
+                    segments[month] = load_archive_segment(month)
+                except Exception as e:
+                    messagebox.showerror("Load Error", f"Error loading archive for {month}: {e}", parent=window)
+                    return
+            history_listbox.delete(0, tk.END)
+            for task in sorted(segments[month], key=lambda x: x.get('completed_ts') or 0):
+                history_listbox.insert(tk.END, self.task_row(task)[0])
+        month_box.bind("<<ComboboxSelected>>", show_month)
+        show_month()
 
 # --- Main Execution ---
 if __name__ == "__main__":